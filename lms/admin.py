@@ -1,9 +1,79 @@
-from django.contrib import admin
-from .models import Course, Lesson, Student, HomeworkSubmission, Certificate, Deadline
+from django.contrib import admin, messages
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.models import User
+from .models import Course, CourseGrade, Lesson, Student, HomeworkSubmission, Certificate, Deadline, Avatar, DeletionJob
+from . import deletion
+
+
+class BackgroundDeleteMixin:
+    """Deleting only hides the object and queues a DeletionJob (lms.deletion)."""
+    schedule = None
+
+    def get_deleted_objects(self, objs, request):
+        # listing every dependent row would itself take as long as the old delete
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        type(self).schedule(obj, requested_by=request.user)
+        messages.info(request, f'«{obj}» скрыт и будет удалён в фоне (см. «Deletion jobs»).')
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_model(request, obj)
+
+
+@admin.register(Course)
+class CourseAdmin(BackgroundDeleteMixin, admin.ModelAdmin):
+    schedule = deletion.schedule_course
+
+
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class BackgroundDeleteUserAdmin(BackgroundDeleteMixin, UserAdmin):
+    schedule = deletion.schedule_user
+
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('label', 'kind', 'status', 'progress_percent', 'deleted', 'total', 'files_removed',
+                    'created_at', 'finished_at')
+    list_filter = ('kind',)
+    readonly_fields = ('kind', 'object_id', 'label', 'requested_by', 'created_at', 'started_at', 'finished_at',
+                       'total', 'deleted', 'files_removed')
+    fields = readonly_fields + ('error',)  # clear the error to retry a failed job
+
+    @admin.display(description='Status')
+    def status(self, job):
+        if job.finished_at:
+            return 'done'
+        if job.error:
+            return 'failed'
+        return 'running' if job.started_at else 'queued'
+
+    @admin.display(description='Progress')
+    def progress_percent(self, job):
+        return f'{job.progress}%'
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(CourseGrade)
+class CourseGradeAdmin(admin.ModelAdmin):
+    # maintained by lms.coursegrades; `manage.py check_course_grades --repair` fixes drift
+    list_display = ('student', 'course', 'final_grade', 'graded_count', 'weight_total')
+    list_filter = ('course',)
+    readonly_fields = ('student', 'course', 'weighted_sum', 'weight_total', 'graded_count', 'final_grade')
+
+    def has_add_permission(self, request):
+        return False
+
 
-admin.site.register(Course)
 admin.site.register(Lesson)
 admin.site.register(Student)
 admin.site.register(HomeworkSubmission)
 admin.site.register(Certificate)
 admin.site.register(Deadline)
+admin.site.register(Avatar)
@@ -0,0 +1,141 @@
+"""Sparse fieldsets and compact encodings for the JSON APIs.
+
+`?fields=id,title,due_at` selects the fields of every item. The selection is
+pushed down into the query: only the columns behind the selected fields are
+fetched, and a related table is joined only when a selected field needs it
+(lesson_title, created_by). Without `fields` all fields are returned.
+
+The representation is chosen by `?format=` or else by the Accept header:
+
+- json (application/json, the default): {"deadlines": [{"id": ..., ...}, ...]};
+- columns (application/vnd.lms.columns+json): {"fields": [...], "deadlines": [[...], ...]},
+  field names once instead of in every item;
+- msgpack (application/msgpack): the columns layout in MessagePack, if the
+  msgpack package is installed.
+
+Responses of at least API_GZIP_MIN_BYTES are gzip-compressed for clients that
+send Accept-Encoding: gzip. They carry no secrets (no CSRF token), so unlike
+HTML pages they are safe to compress.
+"""
+import json
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# columns: for QuerySet.only(); joins: for select_related(); value: instance -> JSON value
+Field = namedtuple('Field', 'columns joins value')
+
+DEADLINE_FIELDS = {
+    'id': Field(('id',), (), lambda d: d.id),
+    'title': Field(('title',), (), lambda d: d.title),
+    'description': Field(('description',), (), lambda d: d.description),
+    'due_at': Field(('due_at',), (), lambda d: d.due_at.isoformat()),
+    'lesson_id': Field(('lesson_id',), (), lambda d: d.lesson_id),
+    'lesson_title': Field(('lesson', 'lesson__title'), ('lesson',),
+                          lambda d: d.lesson.title if d.lesson else None),
+    'created_by': Field(('created_by', 'created_by__username'), ('created_by',),
+                        lambda d: d.created_by.username if d.created_by else None),
+}
+
+JSON = 'json'
+COLUMNS = 'columns'
+MSGPACK = 'msgpack'
+MEDIA_TYPES = {
+    JSON: 'application/json',
+    COLUMNS: 'application/vnd.lms.columns+json',
+    MSGPACK: 'application/msgpack',
+}
+_ACCEPT_ALIASES = {'application/x-msgpack': MSGPACK}
+
+
+def parse_fields(request, available):
+    """Field names from ?fields=, in request order; ValueError for unknown ones."""
+    raw = request.GET.get('fields', '').strip()
+    if not raw:
+        return list(available)
+    names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}; available: {', '.join(available)}")
+    return names
+
+
+def project(queryset, fields, available, columns=(), joins=()):
+    """Restrict `queryset` to the columns and joins of `fields` (plus extra `columns`/`joins`)."""
+    columns = [c for name in fields for c in available[name].columns] + list(columns)
+    joins = sorted({j for name in fields for j in available[name].joins} | set(joins))
+    queryset = queryset.select_related(None)
+    if joins:  # select_related() without arguments would follow every foreign key
+        queryset = queryset.select_related(*joins)
+    return queryset.only(*columns)
+
+
+def row(obj, fields, available):
+    return [available[name].value(obj) for name in fields]
+
+
+def negotiate(request):
+    """The representation to answer with; ValueError for an unknown or unavailable ?format=."""
+    fmt = request.GET.get('format')
+    if fmt is not None:
+        if fmt not in MEDIA_TYPES:
+            raise ValueError(f"unknown format {fmt!r}; available: {', '.join(MEDIA_TYPES)}")
+        if fmt == MSGPACK and msgpack is None:
+            raise ValueError('msgpack is not available on this server')
+        return fmt
+    accepted = {part.split(';')[0].strip().lower() for part in request.headers.get('Accept', '').split(',')}
+    by_type = {media_type: fmt for fmt, media_type in MEDIA_TYPES.items()} | _ACCEPT_ALIASES
+    offered = {by_type[t] for t in accepted if t in by_type}
+    if MSGPACK in offered and msgpack is not None:
+        return MSGPACK
+    return COLUMNS if COLUMNS in offered else JSON
+
+
+def _encode(data, fmt):
+    if fmt == MSGPACK:
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def list_response(request, key, fields, rows, fmt):
+    if fmt == JSON:
+        data = {key: [dict(zip(fields, values)) for values in rows]}
+    else:
+        data = {'fields': fields, key: rows}
+    return _respond(request, _encode(data, fmt), fmt)
+
+
+def object_response(request, fields, values, fmt):
+    # a single object has nothing to factor out: columns is plain JSON here
+    fmt = JSON if fmt == COLUMNS else fmt
+    return _respond(request, _encode(dict(zip(fields, values)), fmt), fmt)
+
+
+def _respond(request, body, fmt):
+    response = HttpResponse(body, content_type=MEDIA_TYPES[fmt])
+    patch_vary_headers(response, ('Accept',))
+    return compress(request, response)
+
+
+def compress(request, response):
+    """gzip the response body if it is big enough and the client accepts it (as GZipMiddleware does)."""
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if len(response.content) < settings.API_GZIP_MIN_BYTES or response.has_header('Content-Encoding'):
+        return response
+    if not re.search(r'\bgzip\b', request.headers.get('Accept-Encoding', '')):
+        return response
+    compressed = compress_string(response.content)
+    if len(compressed) < len(response.content):
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = 'gzip'
+    return response
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class LmsConfig(AppConfig):
     name = 'lms'
+
+    def ready(self):
+        # connect the SQLite connection_created handler
+        from . import db  # noqa: F401
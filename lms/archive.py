@@ -0,0 +1,100 @@
+"""Archival of finished courses.
+
+Submissions and deadlines of courses closed more than ``ARCHIVE_AFTER_TERMS``
+terms (``ARCHIVE_TERM_DAYS`` days each) ago are moved from the hot tables to
+ArchivedSubmission / ArchivedDeadline, so the hot tables and their indexes only
+hold current courses. Courses, lessons, enrollments and certificates stay where
+they are; students see archived grades on a read-only page.
+
+Rows are moved in batches ordered by id. A batch is first copied (keeping its
+original id, existing copies are ignored) and then deleted from the hot table,
+so an interrupted run is simply started again. When the archive tables live in
+the same database both steps share one transaction. Course.archived_at is set
+once nothing is left to move.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from . import bootstrap, coursegrades
+from .models import ArchivedDeadline, ArchivedSubmission, Course, Deadline, HomeworkSubmission
+
+
+class ArchiveResult:
+    def __init__(self, course):
+        self.course = course
+        self.submissions = 0
+        self.deadlines = 0
+
+    def __str__(self):
+        return f"{self.course.title} (#{self.course.id}): {self.submissions} submissions, {self.deadlines} deadlines"
+
+
+def archive_cutoff(terms=None, now=None):
+    terms = settings.ARCHIVE_AFTER_TERMS if terms is None else terms
+    return (now or timezone.now()) - timedelta(days=settings.ARCHIVE_TERM_DAYS * terms)
+
+
+def archivable_courses(terms=None, now=None):
+    """Closed long enough ago and not archived yet (including half-done runs)."""
+    return Course.objects.filter(closed_at__lte=archive_cutoff(terms, now), archived_at__isnull=True).order_by('id')
+
+
+def _submission_copy(sub):
+    return ArchivedSubmission(
+        id=sub.id, student_id=sub.student_id, course_id=sub.lesson.course_id, course_title=sub.lesson.course.title,
+        lesson_id=sub.lesson_id, lesson_title=sub.lesson.title, content=sub.content,
+        attachment_id=sub.attachment_id, attachment_name=sub.attachment_name, is_graded=sub.is_graded, grade=sub.grade)
+
+
+def _deadline_copy(deadline):
+    return ArchivedDeadline(
+        id=deadline.id, title=deadline.title, description=deadline.description, due_at=deadline.due_at,
+        course_id=deadline.lesson.course_id, lesson_id=deadline.lesson_id,
+        created_by_id=deadline.created_by_id, created_at=deadline.created_at)
+
+
+def _move(source, archive_model, make_copy, batch_size):
+    """Move every row of `source` in id order; returns the number of rows moved."""
+    hot_db = router.db_for_write(source.model)
+    cold_db = router.db_for_write(archive_model)
+    moved = 0
+    while True:
+        with transaction.atomic(using=hot_db):
+            batch = list(source.select_related('lesson__course').order_by('id')[:batch_size])
+            if not batch:
+                return moved
+            copies = [make_copy(obj) for obj in batch]
+            if cold_db == hot_db:
+                archive_model.objects.bulk_create(copies, ignore_conflicts=True)
+            else:
+                # separate database: the copy commits first, a crash before the
+                # delete below leaves rows that the next run copies again (ignored)
+                with transaction.atomic(using=cold_db):
+                    archive_model.objects.bulk_create(copies, ignore_conflicts=True)
+            source.model.objects.filter(id__in=[obj.id for obj in batch]).delete()
+        moved += len(batch)
+
+
+def archive_course(course, batch_size=None):
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    result = ArchiveResult(course)
+    with coursegrades.frozen():  # archived grades still count
+        result.submissions = _move(HomeworkSubmission.objects.filter(lesson__course=course),
+                                   ArchivedSubmission, _submission_copy, batch_size)
+    result.deadlines = _move(Deadline.objects.filter(lesson__course=course),
+                             ArchivedDeadline, _deadline_copy, batch_size)
+    course.archived_at = timezone.now()
+    Course.objects.filter(id=course.id).update(archived_at=course.archived_at)
+    bootstrap.bump_courses([course.id])
+    return result
+
+
+def archived_submissions(student):
+    return ArchivedSubmission.objects.filter(student_id=student.id).order_by('course_title', 'lesson_id')
+
+
+def archived_submission(student, lesson):
+    return ArchivedSubmission.objects.filter(student_id=student.id, lesson_id=lesson.id).first()
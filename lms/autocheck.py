@@ -0,0 +1,168 @@
+"""Automatic checking of submissions.
+
+Submissions of lessons with a LessonChecker are queued (check_status =
+'queued') when a student sends them. `manage.py check_submissions` claims
+queued rows in batches, runs lms.checkers in a bounded process pool and writes
+the provisional grades of a whole batch with one bulk_update. The teacher then
+confirms all provisional grades of a lesson at once (confirm_provisional_grades),
+which turns them into regular grades and issues certificates.
+
+A claimed row records its worker (host, pid and a per-process token) and
+only that worker stores its result. A starting worker puts back in the queue
+the rows of workers on its host that are no longer running;
+`check_submissions --reset-stale` requeues every claimed row (after a host
+was lost, with no other worker running).
+"""
+import os
+import secrets
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from . import bootstrap, checkers, coursegrades
+from .models import HomeworkSubmission, LessonChecker, issue_certificates
+
+QUEUED = HomeworkSubmission.CHECK_QUEUED
+RUNNING = HomeworkSubmission.CHECK_RUNNING
+DONE = HomeworkSubmission.CHECK_DONE
+ERROR = HomeworkSubmission.CHECK_ERROR
+
+HOST = socket.gethostname()
+_worker = [None]  # (pid, "<host>:<pid>:<token>") of this process, new after a fork
+
+
+def worker_id():
+    if _worker[0] is None or _worker[0][0] != os.getpid():
+        _worker[0] = (os.getpid(), f'{HOST}:{os.getpid()}:{secrets.token_hex(4)}')
+    return _worker[0][1]
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def enqueue(submissions):
+    """Queue a queryset of submissions for checking; those of lessons without a checker are skipped."""
+    return submissions.filter(lesson__checker__isnull=False).update(
+        check_status=QUEUED, provisional_grade=None, check_feedback='', check_worker='')
+
+
+def enqueue_submission(submission):
+    return enqueue(HomeworkSubmission.objects.filter(pk=submission.pk))
+
+
+def reset_stale(everything=False):
+    """Put rows claimed by workers of this host that have exited back in the queue.
+
+    With `everything`, all claimed rows, whatever worker holds them.
+    """
+    running = HomeworkSubmission.objects.filter(check_status=RUNNING)
+    if not everything:
+        dead = []
+        for worker in running.values_list('check_worker', flat=True).distinct():
+            host, _, rest = worker.partition(':')
+            pid = rest.partition(':')[0]
+            if not worker or (host == HOST and pid.isdigit() and not _alive(int(pid))):
+                dead.append(worker)
+        running = running.filter(check_worker__in=dead)
+    return running.update(check_status=QUEUED, check_worker='')
+
+
+def claim_batch(size):
+    with transaction.atomic():
+        ids = list(HomeworkSubmission.objects.filter(check_status=QUEUED).order_by('id')
+                   .values_list('id', flat=True)[:size])
+        if ids:
+            HomeworkSubmission.objects.filter(id__in=ids, check_status=QUEUED).update(
+                check_status=RUNNING, check_worker=worker_id())
+    return ids
+
+
+def check_batch(ids, pool=None):
+    """Check the claimed submissions and store the results; returns the number checked."""
+    claimed = HomeworkSubmission.objects.filter(id__in=ids, check_status=RUNNING, check_worker=worker_id())
+    submissions = list(claimed.only('id', 'lesson_id', 'content', 'check_status'))
+    checkers_by_lesson = {c.lesson_id: c.as_spec() for c in
+                          LessonChecker.objects.filter(lesson__in={s.lesson_id for s in submissions})}
+    jobs = [(s, checkers_by_lesson.get(s.lesson_id)) for s in submissions]
+    work = [(spec, s.content) for s, spec in jobs if spec is not None]
+    specs, answers = [w[0] for w in work], [w[1] for w in work]
+    if pool is not None and len(work) > 1:
+        results = iter(pool.map(checkers.run_check, specs, answers, chunksize=max(1, len(work) // 64)))
+    else:
+        results = iter(map(checkers.run_check, specs, answers))
+
+    for submission, spec in jobs:
+        if spec is None:  # checker removed after the submission was queued
+            submission.provisional_grade, submission.check_feedback, submission.check_status = None, '', ''
+            continue
+        grade, feedback, error = next(results)
+        submission.provisional_grade = grade
+        submission.check_feedback = feedback[:500]
+        submission.check_status = ERROR if error else DONE
+    for submission in submissions:
+        submission.check_worker = ''
+    # only rows still claimed by this worker: a student who resubmitted meanwhile has been queued
+    # again, a row requeued by --reset-stale may belong to another worker now
+    with transaction.atomic():
+        still_running = set(claimed.select_for_update().values_list('id', flat=True))
+        HomeworkSubmission.objects.bulk_update(
+            [s for s in submissions if s.id in still_running],
+            ['provisional_grade', 'check_feedback', 'check_status', 'check_worker'], batch_size=500)
+    return len(submissions)
+
+
+def run_worker(workers=None, batch_size=None, once=False, poll=2, stop=None, log=None, reset_all=False):
+    """Loop of `manage.py check_submissions`; returns the number of submissions checked."""
+    batch_size = batch_size or settings.CHECK_BATCH_SIZE
+    workers = settings.CHECK_WORKERS if workers is None else workers
+    reset_stale(everything=reset_all)
+    total = 0
+    pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count()) if workers != 0 else None
+    try:
+        while not (stop and stop.is_set()):
+            ids = claim_batch(batch_size)
+            if ids:
+                started = time.monotonic()
+                total += check_batch(ids, pool)
+                if log:
+                    log(f"checked {len(ids)} submissions in {time.monotonic() - started:.1f}s")
+                continue
+            if once:
+                break
+            time.sleep(poll)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return total
+
+
+def confirm_provisional_grades(lesson, submission_ids=None):
+    """Make the provisional grades of a lesson final in one UPDATE; manual grades are kept."""
+    pending = lesson.submissions.filter(check_status=DONE, provisional_grade__isnull=False, is_graded=False)
+    if submission_ids is not None:
+        pending = pending.filter(id__in=submission_ids)
+    with transaction.atomic():
+        # the rows the deltas are computed from are exactly the rows updated
+        rows = list(pending.select_for_update().values_list('id', 'student_id', 'provisional_grade'))
+        ids = [pk for pk, _, _ in rows]
+        count = sum(HomeworkSubmission.objects.filter(id__in=ids[i:i + 500])
+                    .update(grade=F('provisional_grade'), is_graded=True) for i in range(0, len(ids), 500))
+        deltas = coursegrades.Deltas()
+        for _, student_id, grade in rows:
+            deltas.add(student_id, lesson.course_id, lesson.weight, (False, None), (True, grade))
+        deltas.apply()
+        student_ids = [student_id for _, student_id, _ in rows]
+        bootstrap.bump(student_ids)
+    issue_certificates(lesson.course, student_ids)
+    return count
@@ -0,0 +1,183 @@
+"""Local avatar service: identicons and uploaded avatars stored on disk.
+
+Avatars are pre-rendered at a few standard sizes and stored content-addressed
+under MEDIA_ROOT/avatars/<digest[:2]>/<digest>/<size>.png, where digest is the
+SHA-256 of the source image. Files never change once written, so they can be
+served with immutable cache headers.
+
+The digest of each user's avatar is kept in the Django cache (bounded by the
+backend, shared between processes when the backend is) for
+AVATAR_CACHE_SECONDS, and on the user object for the rest of the request.
+Saving or deleting an Avatar replaces the cache entry; with a per-process
+cache other processes see the change within AVATAR_CACHE_SECONDS.
+"""
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+from . import metrics
+
+DEFAULT_SIZES = (36, 80, 120)
+DEFAULT_CACHE_SECONDS = 300
+IDENTICON_GRID = 5
+
+
+def _cache_key(user_id):
+    return f"avatar-digest:{user_id}"
+
+
+def cache_seconds():
+    return getattr(settings, 'AVATAR_CACHE_SECONDS', DEFAULT_CACHE_SECONDS)
+
+
+def avatar_sizes():
+    return tuple(sorted(getattr(settings, 'AVATAR_SIZES', DEFAULT_SIZES)))
+
+
+def snap_size(size):
+    """Return the smallest standard size that is >= size (or the largest one)."""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        size = 80
+    sizes = avatar_sizes()
+    for s in sizes:
+        if s >= size:
+            return s
+    return sizes[-1]
+
+
+def avatar_dir(digest):
+    return os.path.join(settings.MEDIA_ROOT, 'avatars', digest[:2], digest)
+
+
+def avatar_path(digest, size):
+    return os.path.join(avatar_dir(digest), f"{int(size)}.png")
+
+
+def render_identicon(seed, size=None):
+    """Render a deterministic symmetric identicon for seed (string) as a PIL image."""
+    from PIL import Image, ImageDraw
+
+    size = size or avatar_sizes()[-1]
+    h = hashlib.sha256(seed.strip().lower().encode('utf-8')).digest()
+    color = (h[0], h[1], h[2])
+    background = (240, 240, 240)
+    img = Image.new('RGB', (size, size), background)
+    draw = ImageDraw.Draw(img)
+    cell = size / (IDENTICON_GRID + 1)
+    margin = cell / 2
+    half = (IDENTICON_GRID + 1) // 2
+    bit = 0
+    for col in range(half):
+        for row in range(IDENTICON_GRID):
+            if h[3 + bit // 8] >> (bit % 8) & 1:
+                for c in {col, IDENTICON_GRID - 1 - col}:
+                    x0 = margin + c * cell
+                    y0 = margin + row * cell
+                    draw.rectangle([x0, y0, x0 + cell - 1, y0 + cell - 1], fill=color)
+            bit += 1
+    return img
+
+
+def _square(img):
+    w, h = img.size
+    side = min(w, h)
+    left = (w - side) // 2
+    top = (h - side) // 2
+    return img.crop((left, top, left + side, top + side))
+
+
+def store_image(img, digest):
+    """Write img at every standard size under its digest. Existing files are kept."""
+    from PIL import Image
+
+    out_dir = avatar_dir(digest)
+    os.makedirs(out_dir, exist_ok=True)
+    img = _square(img.convert('RGB'))
+    for size in avatar_sizes():
+        path = avatar_path(digest, size)
+        if os.path.exists(path):
+            continue
+        tmp_path = path + '.tmp'
+        img.resize((size, size), Image.LANCZOS).save(tmp_path, 'PNG', optimize=True)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def store_identicon(seed):
+    """Render and store an identicon for seed; return its content digest."""
+    img = render_identicon(seed)
+    buf = io.BytesIO()
+    img.save(buf, 'PNG')
+    digest = hashlib.sha256(buf.getvalue()).hexdigest()
+    return store_image(img, digest)
+
+
+def store_upload(uploaded_file):
+    """Store a user-uploaded image file; return its content digest."""
+    from PIL import Image
+
+    h = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        h.update(chunk)
+    uploaded_file.seek(0)
+    img = Image.open(uploaded_file)
+    return store_image(img, h.hexdigest())
+
+
+def identicon_seed(user):
+    return (getattr(user, 'email', '') or '') or user.get_username()
+
+
+def get_or_create_avatar(user):
+    """Return the user's Avatar row, generating an identicon the first time."""
+    from .models import Avatar
+
+    avatar = Avatar.objects.filter(user=user).first()
+    if avatar is None:
+        digest = store_identicon(identicon_seed(user))
+        avatar, _ = Avatar.objects.get_or_create(user=user, defaults={'digest': digest})
+    return avatar
+
+
+def set_uploaded_avatar(user, uploaded_file):
+    from .models import Avatar
+
+    digest = store_upload(uploaded_file)
+    Avatar.objects.update_or_create(user=user, defaults={'digest': digest, 'uploaded': True})
+    user._avatar_digest = digest
+    return digest
+
+
+def avatar_digest(user):
+    """Digest of the user's avatar: from the user object, the cache, or the Avatar row."""
+    digest = getattr(user, '_avatar_digest', None)
+    if digest is not None:
+        return digest
+    digest = cache.get(_cache_key(user.pk))
+    metrics.inc('lms_cache_requests_total', cache='avatar_url', result='miss' if digest is None else 'hit')
+    if digest is None:
+        digest = get_or_create_avatar(user).digest
+        cache.set(_cache_key(user.pk), digest, cache_seconds())
+    user._avatar_digest = digest
+    return digest
+
+
+def avatar_url(user, size=80):
+    """Return the URL of the user's avatar at the nearest standard size."""
+    if getattr(user, 'pk', None) is None:
+        return ''
+    return reverse('avatar_image', args=[avatar_digest(user), snap_size(size)])
+
+
+def avatar_changed(avatar, deleted=False):
+    """Signal hook: replace the cached digest of the avatar's user."""
+    if deleted:
+        cache.delete(_cache_key(avatar.user_id))
+    else:
+        cache.set(_cache_key(avatar.user_id), avatar.digest, cache_seconds())
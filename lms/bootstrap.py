@@ -0,0 +1,121 @@
+"""Everything a student's first page load needs, in one response (GET /api/me/bootstrap/).
+
+Enrollments, lessons, the student's submissions and grades, upcoming
+deadlines and certificates are read with one query each, run concurrently,
+and returned as column tables ({"fields": [...], "rows": [[...], ...]}, as
+with ?format=columns of the deadline API).
+
+Student.bootstrap_version goes up whenever any of that changes: the signal
+receivers in lms.models bump it on single saves and deletes, and the bulk
+paths that bypass signals (batch grading, confirmed autocheck grades, lesson
+and enrollment imports, archiving) call bump() themselves. The payload is
+cached under the student's id and version and its ETag contains the version,
+so revalidating an unchanged bundle (If-None-Match) costs no query beyond
+loading the profile. A deadline passing changes the payload without any
+write: an entry remembers the earliest due_at it lists and is rebuilt after it.
+"""
+import asyncio
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.urls import reverse
+from django.utils import timezone
+
+from . import api
+from .models import Certificate, HomeworkSubmission, Lesson, Student
+from .repositories import get_all_deadlines
+
+DEADLINE_FIELDS = ['id', 'title', 'due_at', 'lesson_id']
+UPCOMING_LIMIT = 50
+
+# body: compact JSON bytes; valid_until: earliest listed due_at (None: no deadline listed)
+Bundle = namedtuple('Bundle', 'etag body valid_until')
+
+
+def bump(student_ids):
+    """Invalidate the bundles of these students."""
+    ids = {i for i in student_ids if i is not None}
+    if ids:
+        Student.objects.filter(id__in=ids).update(bootstrap_version=F('bootstrap_version') + 1)
+
+
+def bump_courses(course_ids):
+    """Invalidate the bundles of everyone enrolled in these courses."""
+    ids = {i for i in course_ids if i is not None}
+    if ids:
+        Student.objects.filter(courses__in=ids).update(bootstrap_version=F('bootstrap_version') + 1)
+
+
+def bump_lesson(lesson_id):
+    """A deadline of this lesson changed; a deadline without a lesson is shown to every student."""
+    if lesson_id is None:
+        Student.objects.update(bootstrap_version=F('bootstrap_version') + 1)
+    else:
+        Student.objects.filter(courses__lessons=lesson_id).update(bootstrap_version=F('bootstrap_version') + 1)
+
+
+def _table(fields, rows):
+    return {'fields': fields, 'rows': rows}
+
+
+async def _rows(queryset, make_row):
+    return [make_row(obj) async for obj in queryset]
+
+
+async def build(student, now=None):
+    """Assemble the bundle of `student` with five queries."""
+    now = now or timezone.now()
+    courses_qs = student.courses.all()
+    course_lessons = Lesson.objects.filter(course__in=courses_qs).values('id')
+    deadlines_qs = api.project(
+        get_all_deadlines().filter(Q(lesson__in=course_lessons) | Q(lesson__isnull=True), due_at__gte=now),
+        DEADLINE_FIELDS, api.DEADLINE_FIELDS)[:UPCOMING_LIMIT]
+
+    courses, lessons, submissions, deadlines, certs = await asyncio.gather(
+        _rows(courses_qs.select_related('teacher')
+              .only('id', 'title', 'closed_at', 'archived_at', 'teacher__username', 'teacher__first_name',
+                    'teacher__last_name').order_by('title', 'id'),
+              lambda c: [c.id, c.title, c.teacher.get_full_name() or c.teacher.username,
+                         c.closed_at and c.closed_at.isoformat(), c.is_archived]),
+        _rows(Lesson.objects.filter(course__in=courses_qs).only('id', 'title', 'course_id').order_by('course_id', 'id'),
+              lambda l: [l.id, l.course_id, l.title]),
+        _rows(HomeworkSubmission.objects.filter(student=student).only('id', 'lesson_id', 'is_graded', 'grade')
+              .order_by('lesson_id'),
+              lambda s: [s.id, s.lesson_id, 'graded' if s.is_graded else 'submitted', s.grade if s.is_graded else None]),
+        _rows(deadlines_qs, lambda d: api.row(d, DEADLINE_FIELDS, api.DEADLINE_FIELDS) + [d.due_at]),
+        _rows(Certificate.objects.filter(student=student).only('id', 'certificate_id', 'course_id', 'issued_at')
+              .order_by('issued_at'),
+              lambda c: [str(c.certificate_id), c.course_id, c.issued_at.isoformat(),
+                         reverse('certificate_pdf', args=[c.id])]),
+    )
+    valid_until = min((row.pop() for row in deadlines), default=None)
+    payload = {
+        'version': student.bootstrap_version,
+        'student_id': student.id,
+        'courses': _table(['id', 'title', 'teacher', 'closed_at', 'archived'], courses),
+        'lessons': _table(['id', 'course_id', 'title'], lessons),
+        'submissions': _table(['id', 'lesson_id', 'status', 'grade'], submissions),
+        'deadlines': _table(DEADLINE_FIELDS, deadlines),
+        'certificates': _table(['certificate_id', 'course_id', 'issued_at', 'pdf_url'], certs),
+    }
+    stamp = int(valid_until.timestamp()) if valid_until else 0
+    etag = f'"{student.id}-{student.bootstrap_version}-{stamp}"'
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode()
+    return Bundle(etag, body, valid_until)
+
+
+def _cache_key(student):
+    return f'lms:bootstrap:{student.id}:{student.bootstrap_version}'
+
+
+async def get(student):
+    """The cached bundle of `student`, built if missing or outdated."""
+    now = timezone.now()
+    bundle = await cache.aget(_cache_key(student))
+    if bundle is None or (bundle.valid_until is not None and bundle.valid_until < now):
+        bundle = await build(student, now)
+        await cache.aset(_cache_key(student), bundle, settings.BOOTSTRAP_CACHE_SECONDS)
+    return bundle
@@ -0,0 +1,342 @@
+"""Rendering of certificate PDFs.
+
+Two renderers, chosen with settings.CERTIFICATE_RENDERER:
+
+- 'vector' (default): the background template is drawn as an image XObject and
+  the name, course, teacher, date and ID as text in an embedded subset of
+  CERTIFICATE_FONT. The template is converted to a JPEG once per process (and
+  again only when the file changes); ReportLab copies a JPEG into the PDF as is,
+  DCT-compressed, without decoding it, and stores an image drawn on several
+  pages of one document only once, so several certificates can share one PDF
+  (write_vector_pdf with a list) for little more than the size of one. The
+  font is embedded (as a subset) only when Helvetica cannot show the text.
+- 'raster': the text is painted into a copy of the 1600x1200 bitmap, which is
+  wrapped in a PDF (the original behaviour).
+
+`python scripts/bench_certificates.py` compares the two. course_archive streams
+all certificates of a course as a ZIP.
+"""
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from . import metrics, zipstream
+
+VECTOR = 'vector'
+RASTER = 'raster'
+
+FONT_NAME = 'CertificateFont'
+# tried in order when CERTIFICATE_FONT is not set; Helvetica (no Cyrillic) is the last resort
+FONT_CANDIDATES = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    '/Library/Fonts/Arial Unicode.ttf',
+    '/Library/Fonts/Arial.ttf',
+    'C:/Windows/Fonts/arial.ttf',
+)
+
+_fonts = {}
+_backgrounds = {}
+
+
+def template_path():
+    return os.path.join(settings.MEDIA_ROOT, 'certificates', 'templates', 'background.png')
+
+
+def pdf_name(cert):
+    """Storage name of a certificate's PDF (relative to MEDIA_ROOT)."""
+    return f'certificates/generated/certificate-{cert.id}.pdf'
+
+
+def certificate_text(cert):
+    """The strings printed on a certificate."""
+    student = cert.student.user
+    teacher = cert.course.teacher
+    return {
+        'student': student.get_full_name() or student.username,
+        'course': cert.course.title,
+        'teacher': teacher.get_full_name() or teacher.username,
+        'date': (cert.issued_at or timezone.now()).strftime('%d.%m.%Y'),
+        'id': str(cert.certificate_id),
+    }
+
+
+def font_file():
+    """Path of the TTF used for text Helvetica cannot show, or None."""
+    candidates = [settings.CERTIFICATE_FONT] if settings.CERTIFICATE_FONT else FONT_CANDIDATES
+    return next((path for path in candidates if os.path.exists(path)), None)
+
+
+def _font_for(texts):
+    """None (Helvetica, built into every PDF reader, nothing embedded) when it covers the text."""
+    try:
+        for text in texts:
+            for value in text.values():
+                value.encode('cp1252')
+    except UnicodeEncodeError:
+        return font_file()
+    return None
+
+
+def _load_font(path):
+    """Register the TTF at path once per process; returns the name to draw with."""
+    if path is None:
+        return 'Helvetica'
+    if path not in _fonts:
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+
+        name = f'{FONT_NAME}{len(_fonts)}'
+        pdfmetrics.registerFont(TTFont(name, path))
+        _fonts[path] = name
+    return _fonts[path]
+
+
+def _background(path):
+    """(JPEG path, (width, height)) of the template, converted once per change of the file."""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _backgrounds:
+        from PIL import Image
+
+        with Image.open(path) as img:
+            size = img.size
+            if img.format == 'JPEG':
+                jpeg = path
+            else:
+                digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+                jpeg = os.path.join(tempfile.gettempdir(), f'lms-certificate-{digest}.jpg')
+                if not os.path.exists(jpeg):
+                    tmp = f'{jpeg}.{os.getpid()}'
+                    img.convert('RGB').save(tmp, 'JPEG', quality=settings.CERTIFICATE_BACKGROUND_QUALITY,
+                                            optimize=True)
+                    os.replace(tmp, jpeg)
+        _backgrounds[key] = (jpeg, size)
+    return _backgrounds[key]
+
+
+def _draw_page(c, background, size, text, font):
+    w, h = size
+    c.drawImage(background, 0, 0, width=w, height=h)
+    c.setFillColorRGB(0, 0, 0)
+
+    def centred(value, y_frac, size_frac):
+        font_size = w * size_frac
+        c.setFont(font, font_size)
+        # y_frac is the middle of the line, measured from the top as in the raster layout
+        c.drawCentredString(w / 2, h * (1 - y_frac) - font_size * 0.35, value)
+
+    centred(text['student'], 0.36, 0.045)
+    centred(text['course'], 0.48, 0.03)
+    centred(f"Instructor: {text['teacher']}", 0.78, 0.018)
+    small = w * 0.018
+    c.setFont(font, small)
+    c.drawString(w * 0.06, h * 0.1 - small * 0.8, f"Certificate ID: {text['id']}")
+    c.drawString(w * 0.76, h * 0.1 - small * 0.8, f"Date: {text['date']}")
+    c.showPage()
+
+
+def render(out, texts, background, size, font_path):
+    """Draw pages from certificate_text() dicts; uses no settings or models (runs in pool workers)."""
+    from reportlab.pdfgen import canvas
+
+    font = _load_font(font_path)
+    c = canvas.Canvas(out, pagesize=size, pageCompression=1)
+    c.setTitle('Certificates' if len(texts) > 1 else 'Certificate')
+    for text in texts:
+        _draw_page(c, background, size, text, font)
+    c.save()
+
+
+def render_file(pdf_path, text, background, size, font_path):
+    """Pool worker: render one certificate into pdf_path, replacing it atomically."""
+    tmp = f'{pdf_path}.{os.getpid()}.tmp'
+    render(tmp, [text], background, size, font_path)
+    os.replace(tmp, pdf_path)
+    return pdf_path
+
+
+def write_vector_pdf(out, certificates, template=None):
+    """Write the certificates, one per page, into `out` (a path or a binary file)."""
+    background, size = _background(template or template_path())
+    texts = [certificate_text(cert) for cert in certificates]
+    render(out, texts, background, size, _font_for(texts))
+
+
+def write_raster_pdf(pdf_path, cert, template=None):
+    """Paint the text into the bitmap, save it as a temporary PNG next to the PDF and wrap it in a PDF.
+
+    Try to use ReportLab for PDF creation; if it's not available, fall back to
+    Pillow's PDF saving. Returns False if no PDF could be written.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    img = Image.open(template or template_path()).convert('RGBA')
+    draw = ImageDraw.Draw(img)
+    w, h = img.size
+    text = certificate_text(cert)
+
+    try:
+        font_large = ImageFont.truetype('arial.ttf', size=int(w*0.045))
+        font_medium = ImageFont.truetype('arial.ttf', size=int(w*0.03))
+        font_small = ImageFont.truetype('arial.ttf', size=int(w*0.018))
+    except Exception:
+        font_large = ImageFont.load_default()
+        font_medium = ImageFont.load_default()
+        font_small = ImageFont.load_default()
+
+    def draw_centered(text, y_frac, font, fill=(0,0,0)):
+        try:
+            bbox = draw.textbbox((0, 0), text, font=font)
+            text_w = bbox[2] - bbox[0]
+            text_h = bbox[3] - bbox[1]
+        except Exception:
+            # fallback for older/newer Pillow versions
+            try:
+                text_w, text_h = font.getsize(text)
+            except Exception:
+                text_w, text_h = (0, 0)
+        x = (w - text_w) / 2
+        y = int(h * y_frac) - text_h/2
+        draw.text((x, y), text, font=font, fill=fill)
+
+    draw_centered(text['student'], 0.36, font_large)
+    draw_centered(text['course'], 0.48, font_medium)
+    draw_centered(f"Instructor: {text['teacher']}", 0.78, font_small)
+    draw.text((int(w*0.06), int(h*0.9)), f"Certificate ID: {text['id']}", font=font_small, fill=(0,0,0))
+    draw.text((int(w*0.76), int(h*0.9)), f"Date: {text['date']}", font=font_small, fill=(0,0,0))
+
+    img_path = os.path.splitext(pdf_path)[0] + '.png'
+    img.convert('RGB').save(img_path, 'PNG')
+
+    # Try ReportLab first
+    try:
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.utils import ImageReader
+        c = canvas.Canvas(pdf_path, pagesize=(w, h))
+        c.drawImage(ImageReader(img_path), 0, 0, width=w, height=h)
+        c.showPage()
+        c.save()
+    except Exception:
+        # Fallback: Pillow's PDF save
+        try:
+            img_rgb = Image.open(img_path).convert('RGB')
+            img_rgb.save(pdf_path, 'PDF', resolution=100.0)
+        except Exception:
+            # If PDF generation fails, clean up and exit
+            try:
+                if os.path.exists(img_path):
+                    os.remove(img_path)
+            except Exception:
+                pass
+            return False
+    os.remove(img_path)
+    return True
+
+
+def write_pdf(pdf_path, cert):
+    """Render one certificate with the configured renderer; returns False if nothing was written."""
+    if not os.path.exists(template_path()):
+        return False
+    started = time.perf_counter()
+    renderer = RASTER if settings.CERTIFICATE_RENDERER == RASTER else VECTOR
+    if renderer == VECTOR:
+        try:
+            write_vector_pdf(pdf_path, [cert])
+            written = True
+        except ImportError:  # ReportLab missing: the raster renderer can still use Pillow
+            renderer = RASTER
+    if renderer == RASTER:
+        written = write_raster_pdf(pdf_path, cert)
+    metrics.observe('lms_certificate_render_seconds', time.perf_counter() - started, renderer=renderer)
+    return written
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _stored_path(cert):
+    for name in (cert.pdf_file.name, pdf_name(cert)):
+        if name and os.path.exists(os.path.join(settings.MEDIA_ROOT, name)):
+            return name
+    return None
+
+
+def _render_missing(batch, pool):
+    """Start rendering the PDFs of the batch that are not on disk; {cert id: (future or None, args)}."""
+    template = template_path()
+    if not os.path.exists(template):
+        return {}
+    jobs = {}
+    for cert in batch:
+        if _stored_path(cert):
+            continue
+        background, size = _background(template)
+        text = certificate_text(cert)
+        args = (os.path.join(settings.MEDIA_ROOT, pdf_name(cert)), text, background, size, _font_for([text]))
+        jobs[cert.id] = (pool.submit(render_file, *args) if pool is not None else None, args)
+    return jobs
+
+
+def _finish(batch, jobs):
+    """Yield the batch's ZIP members as their renders complete, then attach the new PDFs to their records."""
+    from .models import Certificate
+
+    changed = []
+    for cert in batch:
+        if cert.id in jobs:
+            future, args = jobs[cert.id]
+            if future is None:
+                render_file(*args)
+            else:
+                future.result()  # re-raises a failed render
+        name = _stored_path(cert)
+        if name is None:  # no template to render from
+            continue
+        if cert.pdf_file.name != name:
+            cert.pdf_file.name = name
+            changed.append(cert)
+        arcname = f'{get_valid_filename(cert.student.user.username)}-{cert.certificate_id}.pdf'
+        yield arcname, os.path.join(settings.MEDIA_ROOT, name), cert.issued_at.timetuple()
+    Certificate.objects.bulk_update(changed, ['pdf_file'])
+
+
+def _course_files(course, workers, batch_size):
+    certs = (course.certificates.select_related('student__user', 'course__teacher')
+             .defer('course__description').order_by('id').iterator(chunk_size=batch_size))
+    # processes are only started once something has to be rendered
+    pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count()) if workers != 0 else None
+    try:
+        ahead = None
+        for batch in _batches(certs, batch_size):
+            # the next batch renders in the pool while the current one is streamed
+            current, ahead = ahead, (batch, _render_missing(batch, pool))
+            if current:
+                yield from _finish(*current)
+        if ahead:
+            yield from _finish(*ahead)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def course_archive(course, workers=None, batch_size=None):
+    """Yield a ZIP of all certificates of a course as byte chunks (for StreamingHttpResponse).
+
+    Certificates are read and streamed in batches of CERTIFICATE_EXPORT_BATCH, so
+    memory does not grow with the course. PDFs missing on disk are rendered in
+    a pool of CERTIFICATE_EXPORT_WORKERS processes (0 = in this process).
+    """
+    workers = settings.CERTIFICATE_EXPORT_WORKERS if workers is None else workers
+    files = _course_files(course, workers, batch_size or settings.CERTIFICATE_EXPORT_BATCH)
+    yield from zipstream.stream_zip(files)
@@ -0,0 +1,332 @@
+"""Automatic answer checks (pure functions, run inside lms.autocheck's process pool).
+
+A check gets a spec dict (a LessonChecker as plain data) and the answer text,
+and returns (grade, feedback, error) where error is True when the check itself
+could not run (bad regex, broken test code, ...).
+
+Python checks run the teacher's ``test_*`` functions in a harness
+interpreter (``python -I``, its own process group, killed as a whole on
+timeout) and the answer in a second interpreter started by the harness, in an
+empty temporary directory. The tests call the answer's functions through the
+answer's stdin/stdout, so the answer never sees the verdict or the channel it
+is reported on; where the ``resource`` module exists (POSIX) the answer is
+limited in CPU time, address space and written file size and may not start
+processes. This contains runaway, careless and cheating code; it is not a
+full security boundary, so the worker should run as an unprivileged user.
+Grades are provisional until the teacher confirms them.
+"""
+import json
+import math
+import os
+import re
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+
+try:
+    import resource
+except ImportError:  # Windows: only the timeout applies
+    resource = None
+
+EXACT = 'exact'
+REGEX = 'regex'
+NUMERIC = 'numeric'
+PYTHON = 'python'
+
+MAX_OUTPUT = 64 * 1024
+# return code of a process killed for exceeding RLIMIT_CPU
+_CPU_LIMIT_SIGNALS = {-signal.SIGXCPU} if hasattr(signal, 'SIGXCPU') else set()
+MAX_FILE_SIZE = 1024 * 1024
+# extra seconds for the harness around the answer's time limit
+HARNESS_GRACE = 5
+
+# The answer runs in a process of its own (_ANSWER) that can only hand back
+# values: the harness (_HARNESS, another process) runs the teacher's tests and
+# calls the answer's functions over the answer's stdin/stdout, one repr()'d
+# tuple per line, read back with ast.literal_eval. Arguments and return values
+# must therefore be literals (numbers, strings, bytes, tuples, lists, dicts,
+# sets, None). The verdict is formed and reported by the harness only: it is
+# non-dumpable, so its /proc entries (stdout pipe, memory) are closed to the
+# answer, and its result line carries a nonce the answer never sees.
+_ANSWER = r"""
+import ast, os, sys, types
+channel = os.fdopen(os.dup(1), "w", encoding="utf-8")
+requests = sys.stdin
+os.dup2(2, 1)
+sys.stdout, sys.stdin = sys.stderr, open(os.devnull)
+def send(*message):
+    channel.write(repr(message) + "\n")
+    channel.flush()
+ns = {"__name__": "solution"}
+try:
+    exec(compile(open("solution.py", encoding="utf-8").read(), "solution.py", "exec"), ns)
+except BaseException as exc:
+    send("error", "%s: %s" % (type(exc).__name__, exc))
+    sys.exit(0)
+exports = {}
+for name, value in ns.items():
+    if name.startswith(("_", "test_")) or isinstance(value, types.ModuleType):
+        continue
+    exports[name] = None if callable(value) else repr(value)
+send("names", exports)
+for line in requests:
+    name, args, kwargs = ast.literal_eval(line)
+    try:
+        result = ns[name](*args, **kwargs)
+    except BaseException as exc:
+        send("raise", type(exc).__name__, str(exc)[:200])
+    else:
+        send("value", result)
+"""
+
+_HARNESS = r"""
+import ast, builtins, ctypes, json, math, os, queue, signal, subprocess, sys, threading, time
+from collections import deque
+nonce = sys.stdin.readline().strip()
+config = json.loads(sys.stdin.readline())
+sys.stdin.close()
+def report(**result):
+    sys.stdout.write("\n" + nonce + json.dumps(result) + "\n")
+    sys.stdout.flush()
+try:
+    ctypes.CDLL(None).prctl(4, 0, 0, 0, 0)  # PR_SET_DUMPABLE 0
+except Exception:
+    pass
+tests_source = open("tests.py", encoding="utf-8").read()
+os.remove("tests.py")  # not for the answer to read
+
+def limits():
+    import resource
+    cpu = max(1, math.ceil(config["time_limit"]))
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (config["memory_mb"] * 1024 * 1024,) * 2)
+    resource.setrlimit(resource.RLIMIT_FSIZE, (config["max_file_size"],) * 2)
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))  # no processes or threads of its own
+
+class Timeout(BaseException):
+    pass
+
+class Crashed(BaseException):
+    pass
+
+class SolutionError(Exception):
+    pass
+
+proc = subprocess.Popen([sys.executable, "-I", "-c", config["answer"]], cwd="answer", stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env={"PATH": os.defpath, "PYTHONIOENCODING": "utf-8"},
+                        preexec_fn=limits if config["posix"] else None)
+replies, stderr_tail = queue.Queue(), deque(maxlen=20)
+def read_replies():
+    for line in iter(lambda: proc.stdout.readline(config["max_line"]), b""):
+        replies.put(line)
+    replies.put(None)
+def read_stderr():
+    for line in iter(lambda: proc.stderr.readline(4096), b""):
+        stderr_tail.append(line.decode("utf-8", "replace").strip())
+threading.Thread(target=read_replies, daemon=True).start()
+threading.Thread(target=read_stderr, daemon=True).start()
+deadline = time.monotonic() + config["time_limit"]
+
+def receive():
+    try:
+        line = replies.get(timeout=max(0, deadline - time.monotonic()))
+    except queue.Empty:
+        raise Timeout
+    if line is None or not line.endswith(b"\n"):
+        raise Crashed
+    try:
+        return ast.literal_eval(line.decode("utf-8", "replace"))
+    except Exception:
+        return ("unreadable",)
+
+def exception(name, message):
+    cls = getattr(builtins, name, None)
+    if isinstance(cls, type) and issubclass(cls, Exception):
+        return cls(message)
+    return SolutionError("%s: %s" % (name, message))
+
+def proxy(name):
+    def call(*args, **kwargs):
+        request = repr((name, args, kwargs))
+        try:
+            ast.literal_eval(request)
+        except Exception:
+            raise TypeError("arguments of %s() must be literals" % name)
+        try:
+            proc.stdin.write(request.encode("utf-8") + b"\n")
+            proc.stdin.flush()
+        except OSError:
+            raise Crashed
+        reply = receive()
+        if reply[0] == "value":
+            return reply[1]
+        if reply[0] == "raise":
+            raise exception(reply[1], reply[2])
+        raise TypeError("%s() returned a value that is not a literal" % name)
+    call.__name__ = name
+    return call
+
+try:
+    reply = receive()
+    if reply[0] == "error":
+        report(passed=0, total=0, failures=["solution: " + reply[1]])
+        sys.exit(0)
+    tests = {"__name__": "tests"}
+    for name, text in reply[1].items():
+        if text is None:
+            tests[name] = proxy(name)
+        else:
+            try:
+                tests[name] = ast.literal_eval(text)
+            except Exception:
+                pass
+    try:
+        exec(compile(tests_source, "tests.py", "exec"), tests)
+    except (Timeout, Crashed):
+        raise
+    except BaseException as exc:
+        report(passed=0, total=0, failures=[], error="tests.py: %s: %s" % (type(exc).__name__, exc))
+        sys.exit(0)
+    names = sorted(n for n, f in tests.items()
+                   if n.startswith("test_") and callable(f) and getattr(f, "__module__", None) == "tests")
+    passed, failures = 0, []
+    for name in names:
+        try:
+            tests[name]()
+            passed += 1
+        except (Timeout, Crashed):
+            raise
+        except BaseException as exc:
+            failures.append(("%s: %s: %s" % (name, type(exc).__name__, exc))[:200])
+    report(passed=passed, total=len(names), failures=failures[:5])
+except Timeout:
+    report(timeout=True)
+except Crashed:
+    proc.kill()
+    code = proc.wait()
+    if code in config["cpu_signals"]:
+        report(timeout=True)
+    else:
+        report(crashed=(list(stderr_tail)[-1:] or ["exit code %s" % code])[0][:200])
+finally:
+    proc.kill()
+"""
+
+def _normalize(text):
+    return ' '.join((text or '').split()).casefold()
+
+
+def check_exact(spec, answer):
+    """Any line of `expected` is an accepted answer (case and spacing ignored)."""
+    accepted = {_normalize(line) for line in spec['expected'].splitlines() if line.strip()}
+    ok = _normalize(answer) in accepted
+    return (spec['points'] if ok else 0), ('Ответ верный' if ok else 'Ответ не совпадает'), False
+
+
+def check_regex(spec, answer):
+    try:
+        pattern = re.compile(spec['expected'], re.IGNORECASE | re.DOTALL)
+    except re.error as exc:
+        return None, f'Ошибка в регулярном выражении: {exc}', True
+    ok = pattern.fullmatch((answer or '').strip()) is not None
+    return (spec['points'] if ok else 0), ('Ответ верный' if ok else 'Ответ не подходит под шаблон'), False
+
+
+def _number(text):
+    return float((text or '').strip().replace(',', '.').replace(' ', ''))
+
+
+def check_numeric(spec, answer):
+    try:
+        expected = _number(spec['expected'])
+    except ValueError:
+        return None, 'Ожидаемое значение не число', True
+    try:
+        value = _number(answer)
+    except ValueError:
+        return 0, 'Ответ не число', False
+    ok = math.isfinite(value) and abs(value - expected) <= spec['tolerance']
+    return (spec['points'] if ok else 0), ('Ответ верный' if ok else f'{value} вне допуска'), False
+
+
+def _limit(time_limit):
+    """The harness: its own process group (killed as a whole on timeout), CPU time and file size."""
+    def apply():
+        os.setsid()
+        if resource is not None:
+            cpu = max(1, math.ceil(time_limit)) + HARNESS_GRACE
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+            resource.setrlimit(resource.RLIMIT_FSIZE, (MAX_FILE_SIZE,) * 2)
+    return apply if os.name == 'posix' else None
+
+
+def _kill_group(proc):
+    try:
+        if os.name == 'posix':
+            os.killpg(proc.pid, signal.SIGKILL)  # the harness and the answer it started
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+    proc.communicate()
+
+
+def check_python(spec, answer):
+    nonce = secrets.token_hex(16)
+    timeout_feedback = f"Превышено время ({spec['time_limit']:g} с)"
+    config = {'time_limit': spec['time_limit'], 'memory_mb': spec['memory_limit_mb'], 'max_file_size': MAX_FILE_SIZE,
+              'max_line': MAX_OUTPUT, 'answer': _ANSWER, 'posix': os.name == 'posix' and resource is not None,
+              'cpu_signals': sorted(_CPU_LIMIT_SIGNALS)}
+    with tempfile.TemporaryDirectory(prefix='lms-check-') as workdir:
+        os.mkdir(os.path.join(workdir, 'answer'))
+        for name, source in (('answer/solution.py', answer or ''), ('tests.py', spec['expected'])):
+            with open(os.path.join(workdir, name), 'w', encoding='utf-8') as f:
+                f.write(source)
+        proc = subprocess.Popen(
+            [sys.executable, '-I', '-c', _HARNESS], cwd=workdir, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace',
+            env={'PATH': os.defpath, 'PYTHONIOENCODING': 'utf-8'}, preexec_fn=_limit(spec['time_limit']))
+        try:
+            stdout, stderr = proc.communicate(nonce + '\n' + json.dumps(config) + '\n',
+                                              timeout=spec['time_limit'] + HARNESS_GRACE)
+        except subprocess.TimeoutExpired:
+            _kill_group(proc)
+            return 0, timeout_feedback, False
+    result = None
+    for line in stdout[-MAX_OUTPUT:].splitlines():
+        if line.startswith(nonce):
+            result = json.loads(line[len(nonce):])
+            break
+    if result is None:
+        if proc.returncode in _CPU_LIMIT_SIGNALS:
+            return 0, timeout_feedback, False
+        tail = (stderr or '').strip().splitlines()[-1:] or [f'код выхода {proc.returncode}']
+        return None, f'Проверка не удалась: {tail[0][:200]}', True
+    if result.get('timeout'):
+        return 0, timeout_feedback, False
+    if 'crashed' in result:
+        return 0, f"Решение завершилось аварийно: {result['crashed']}", False
+    if result.get('error'):
+        return None, f"Ошибка в тестах: {result['error']}"[:500], True
+    if not result['total']:
+        if result['failures']:
+            return 0, result['failures'][0], False
+        return None, 'В тестах нет функций test_*', True
+    grade = round(spec['points'] * result['passed'] / result['total'])
+    feedback = f"Тестов пройдено: {result['passed']} из {result['total']}"
+    if result['failures']:
+        feedback += '; ' + '; '.join(result['failures'])
+    return grade, feedback[:500], False
+
+
+CHECKS = {EXACT: check_exact, REGEX: check_regex, NUMERIC: check_numeric, PYTHON: check_python}
+
+
+def run_check(spec, answer):
+    """Entry point for pool workers: never raises, failures come back as error results."""
+    try:
+        return CHECKS[spec['kind']](spec, answer)
+    except Exception as exc:
+        return None, f'Проверка не удалась: {type(exc).__name__}: {exc}'[:500], True
@@ -0,0 +1,83 @@
+"""Copy a course with its lessons, checkers and deadlines for a new term.
+
+Everything is written with bulk_create inside one transaction: an INSERT for
+the course, then one per batch of lessons, checkers and deadlines. bulk_create
+returns the new primary keys (SQLite 3.35+, PostgreSQL), which map the old
+lesson ids to the new ones for the checkers and deadlines. Lesson attachments
+are content-addressed StoredFiles and are referenced, not copied. Deadlines
+are moved by `shift`; those of an archived course are read from the archive.
+Students, submissions and certificates stay with the old course.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from . import reminders
+from .models import ArchivedDeadline, Course, Deadline, Lesson, LessonChecker
+
+BATCH_SIZE = 500
+
+
+class CloneResult:
+    def __init__(self, source, course):
+        self.source = source
+        self.course = course
+        self.lessons = 0
+        self.checkers = 0
+        self.deadlines = 0
+
+    def __str__(self):
+        return (f"{self.source.title} (#{self.source.id}) -> {self.course.title} (#{self.course.id}): "
+                f"{self.lessons} lessons, {self.checkers} checkers, {self.deadlines} deadlines")
+
+
+def default_shift():
+    """One term, as used by the archive (ARCHIVE_TERM_DAYS)."""
+    return timedelta(days=settings.ARCHIVE_TERM_DAYS)
+
+
+def _source_deadlines(course):
+    """(title, description, due_at, lesson_id) of the course's deadlines, archived ones included."""
+    fields = ('title', 'description', 'due_at', 'lesson_id')
+    rows = list(Deadline.objects.filter(lesson__course=course).order_by('due_at', 'id').values_list(*fields))
+    if course.is_archived:
+        rows += ArchivedDeadline.objects.filter(course_id=course.id).order_by('due_at', 'id').values_list(*fields)
+    return rows
+
+
+def clone_course(course, teacher=None, title=None, shift=None):
+    """Copy `course` for `teacher` (default: its teacher); deadlines move by `shift` (default: one term)."""
+    teacher = teacher or course.teacher
+    shift = default_shift() if shift is None else shift
+    lessons = list(Lesson.objects.filter(course=course).order_by('id'))
+    checkers = list(LessonChecker.objects.filter(lesson__course=course))
+    deadlines = _source_deadlines(course)
+
+    with transaction.atomic():
+        clone = Course.objects.create(title=title or course.title, description=course.description, teacher=teacher)
+        result = CloneResult(course, clone)
+        copies = Lesson.objects.bulk_create(
+            [Lesson(course=clone, title=l.title, content=l.content, attachment_id=l.attachment_id,
+                    attachment_name=l.attachment_name, weight=l.weight)
+             for l in lessons],
+            batch_size=BATCH_SIZE)
+        if any(copy.pk is None for copy in copies):  # backend without RETURNING: rows keep their order
+            for copy, pk in zip(copies, Lesson.objects.filter(course=clone).order_by('id').values_list('id', flat=True)):
+                copy.pk = pk
+        lesson_ids = {old.id: new.pk for old, new in zip(lessons, copies)}
+
+        LessonChecker.objects.bulk_create(
+            [LessonChecker(lesson_id=lesson_ids[c.lesson_id], kind=c.kind, expected=c.expected, tolerance=c.tolerance,
+                           points=c.points, time_limit=c.time_limit, memory_limit_mb=c.memory_limit_mb)
+             for c in checkers], batch_size=BATCH_SIZE)
+        new_deadlines = Deadline.objects.bulk_create(
+            [Deadline(title=t, description=d, due_at=due_at + shift, lesson_id=lesson_ids.get(lesson_id),
+                      created_by=teacher)
+             for t, d, due_at, lesson_id in deadlines if lesson_id in lesson_ids],
+            batch_size=BATCH_SIZE)
+        # bulk_create sends no post_save: tell the reminder schedulers of this process once committed
+        transaction.on_commit(lambda: [reminders.deadline_changed(d) for d in new_deadlines if d.pk])
+
+    result.lessons, result.checkers, result.deadlines = len(copies), len(checkers), len(new_deadlines)
+    return result
@@ -0,0 +1,233 @@
+"""Weighted course grades, maintained incrementally.
+
+Every lesson has a weight (Lesson.weight, 1 by default). CourseGrade keeps,
+per student and course, the sum of grade × weight over the graded
+submissions, the sum of their weights, their number and the final grade
+(weighted_sum / weight_total). Pages read and sort by these columns instead
+of aggregating submissions.
+
+A grade change moves the row by its difference with one UPDATE
+(weighted_sum = weighted_sum + ...), without reading the other submissions:
+single saves and deletes through the receivers in lms.models (the grade as
+loaded is remembered by HomeworkSubmission.from_db), batch grading and
+confirmed autocheck grades by collecting the differences of the whole batch
+in a Deltas. A changed lesson weight touches every grade of the lesson and
+recomputes the course instead. Archived submissions still count, so
+archiving (which moves rows inside frozen()) changes nothing. Every move of a
+final grade is also logged for the leaderboards (lms.leaderboard).
+
+`manage.py check_course_grades` recomputes everything from the submissions,
+reports the rows that drifted and with --repair rewrites them.
+"""
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, FloatField, Sum, When
+from django.db.models.functions import Cast
+from django.db.models.lookups import GreaterThan
+
+from . import leaderboard
+from .models import ArchivedSubmission, CourseGrade, HomeworkSubmission, Lesson
+
+# (weighted_sum, weight_total, graded_count)
+Totals = namedtuple('Totals', 'weighted_sum weight_total graded_count')
+ZERO = Totals(0, 0, 0)
+
+Drift = namedtuple('Drift', 'student_id course_id stored expected')
+
+_frozen = ContextVar('coursegrades_frozen', default=False)
+
+
+@contextmanager
+def frozen():
+    """Leave course grades alone while submissions are moved rather than removed (archiving)."""
+    token = _frozen.set(True)
+    try:
+        yield
+    finally:
+        _frozen.reset(token)
+
+
+def contribution(is_graded, grade, weight):
+    """What one submission adds to its CourseGrade."""
+    if not is_graded or grade is None:
+        return ZERO
+    return Totals(grade * weight, weight, 1)
+
+
+def final_grade(weighted_sum, weight_total):
+    return weighted_sum / weight_total if weight_total else None
+
+
+def _final_expression(weighted_sum, weight_total):
+    return Case(When(GreaterThan(weight_total, 0), then=Cast(weighted_sum, FloatField()) / weight_total),
+                default=None, output_field=FloatField())
+
+
+class Deltas:
+    """Differences to apply to CourseGrade rows, summed per (student, course)."""
+
+    def __init__(self):
+        self.totals = defaultdict(lambda: [0, 0, 0])
+
+    def add(self, student_id, course_id, weight, old, new):
+        """Record a submission going from `old` to `new` (is_graded, grade)."""
+        before, after = contribution(*old, weight), contribution(*new, weight)
+        total = self.totals[student_id, course_id]
+        for i in range(3):
+            total[i] += after[i] - before[i]
+
+    def apply(self):
+        """One UPDATE per changed row (an INSERT for a student's first grade in a course)."""
+        moves = []
+        with transaction.atomic():
+            for (student_id, course_id), (d_sum, d_weight, d_count) in self.totals.items():
+                if d_sum or d_weight or d_count:
+                    moves.append((course_id, *_apply(student_id, course_id, d_sum, d_weight, d_count)))
+            leaderboard.log(moves)
+        self.totals.clear()
+
+
+def _apply(student_id, course_id, d_sum, d_weight, d_count):
+    """Move one row; returns its (old, new) final grade."""
+    rows = CourseGrade.objects.filter(student_id=student_id, course_id=course_id)
+    # every right-hand side of an UPDATE reads the old values, hence final_grade from the new ones spelled out
+    changes = dict(weighted_sum=F('weighted_sum') + d_sum, weight_total=F('weight_total') + d_weight,
+                   graded_count=F('graded_count') + d_count,
+                   final_grade=_final_expression(F('weighted_sum') + d_sum, F('weight_total') + d_weight))
+    if not rows.update(**changes):
+        try:
+            with transaction.atomic():
+                CourseGrade.objects.create(student_id=student_id, course_id=course_id, weighted_sum=d_sum,
+                                           weight_total=d_weight, graded_count=d_count,
+                                           final_grade=final_grade(d_sum, d_weight))
+            return None, final_grade(d_sum, d_weight)
+        except IntegrityError:  # created concurrently: add to it
+            rows.update(**changes)
+    # the row stays locked by the UPDATE until commit: the old values are the new ones minus the delta
+    weighted_sum, weight_total = rows.values_list('weighted_sum', 'weight_total').get()
+    return final_grade(weighted_sum - d_sum, weight_total - d_weight), final_grade(weighted_sum, weight_total)
+
+
+def _lesson(lesson_id):
+    """(course_id, weight, course deletion pending) of a lesson, or None."""
+    return Lesson.objects.filter(id=lesson_id).values_list('course_id', 'weight', 'course__deleting_at').first()
+
+
+def submission_saved(submission, created):
+    """post_save: move the CourseGrade by what the save changed."""
+    new = (submission.is_graded, submission.grade)
+    old = (False, None) if created else getattr(submission, '_stored_grade', None)
+    if old == new:
+        return
+    lesson = _lesson(submission.lesson_id)
+    if lesson is None:
+        return
+    course_id, weight, _ = lesson
+    if old is None:  # not loaded with its grade: nothing to subtract from, count again
+        recompute(course_ids=[course_id], student_ids=[submission.student_id])
+    else:
+        deltas = Deltas()
+        deltas.add(submission.student_id, course_id, weight, old, new)
+        deltas.apply()
+    submission._stored_grade = new
+
+
+def submission_deleted(submission):
+    """pre_delete: take the submission out of its CourseGrade."""
+    if _frozen.get():
+        return
+    old = getattr(submission, '_stored_grade', (submission.is_graded, submission.grade))
+    if contribution(*old, 1) == ZERO:
+        return
+    lesson = _lesson(submission.lesson_id)
+    if lesson is None or lesson[2] is not None:  # rows of a course being deleted go with it
+        return
+    course_id, weight, _ = lesson
+    deltas = Deltas()
+    deltas.add(submission.student_id, course_id, weight, old, (False, None))
+    deltas.apply()
+
+
+# -- From scratch -------------------------------------------------------------------------------
+
+def expected(course_ids=None, student_ids=None):
+    """{(student_id, course_id): Totals} computed from the submissions, archived ones included."""
+    hot = HomeworkSubmission.objects.filter(is_graded=True, grade__isnull=False)
+    archived = ArchivedSubmission.objects.filter(is_graded=True, grade__isnull=False)
+    if course_ids is not None:
+        hot = hot.filter(lesson__course_id__in=course_ids)
+        archived = archived.filter(course_id__in=course_ids)
+    if student_ids is not None:
+        hot = hot.filter(student_id__in=student_ids)
+        archived = archived.filter(student_id__in=student_ids)
+
+    totals = defaultdict(lambda: [0, 0, 0])
+    rows = (hot.values_list('student_id', 'lesson__course_id')
+            .annotate(weighted_sum=Sum(F('grade') * F('lesson__weight')), weight_total=Sum('lesson__weight'),
+                      graded_count=Count('id')).order_by())
+    for student_id, course_id, weighted_sum, weight_total, graded_count in rows:
+        totals[student_id, course_id] = [weighted_sum, weight_total, graded_count]
+    # the archive may be another database: weigh its rows here
+    archived_rows = list(archived.values_list('student_id', 'course_id', 'lesson_id', 'grade'))
+    weights = dict(Lesson.objects.filter(id__in={row[2] for row in archived_rows}).values_list('id', 'weight'))
+    for student_id, course_id, lesson_id, grade in archived_rows:
+        weight = weights.get(lesson_id, 1)
+        total = totals[student_id, course_id]
+        total[0] += grade * weight
+        total[1] += weight
+        total[2] += 1
+    return {key: Totals(*total) for key, total in totals.items()}
+
+
+def check(course_ids=None, student_ids=None, repair=False):
+    """Compare CourseGrade with a recomputation; returns the Drifts (rewritten first if `repair`)."""
+    stored_rows = CourseGrade.objects.all()
+    if course_ids is not None:
+        stored_rows = stored_rows.filter(course_id__in=course_ids)
+    if student_ids is not None:
+        stored_rows = stored_rows.filter(student_id__in=student_ids)
+    with transaction.atomic():
+        stored = {(g.student_id, g.course_id): g for g in stored_rows.select_for_update()}
+        wanted = expected(course_ids, student_ids)
+        drifts = []
+        for key in sorted(stored.keys() | wanted.keys()):
+            row = stored.get(key)
+            have = Totals(row.weighted_sum, row.weight_total, row.graded_count) if row else ZERO
+            want = wanted.get(key, ZERO)
+            if have != want or (row and row.final_grade != final_grade(want.weighted_sum, want.weight_total)):
+                drifts.append(Drift(*key, have, want))
+        if repair and drifts:
+            _rewrite(drifts, stored)
+    return drifts
+
+
+def _rewrite(drifts, stored):
+    changed, created, emptied, moves = [], [], [], []
+    for drift in drifts:
+        row = stored.get((drift.student_id, drift.course_id))
+        moves.append((drift.course_id, row and row.final_grade,
+                      final_grade(drift.expected.weighted_sum, drift.expected.weight_total)))
+        if drift.expected == ZERO:
+            if row:
+                emptied.append(row.id)
+            continue
+        if row is None:
+            row = CourseGrade(student_id=drift.student_id, course_id=drift.course_id)
+            created.append(row)
+        else:
+            changed.append(row)
+        row.weighted_sum, row.weight_total, row.graded_count = drift.expected
+        row.final_grade = final_grade(drift.expected.weighted_sum, drift.expected.weight_total)
+    CourseGrade.objects.filter(id__in=emptied).delete()
+    CourseGrade.objects.bulk_update(changed, ['weighted_sum', 'weight_total', 'graded_count', 'final_grade'],
+                                    batch_size=500)
+    CourseGrade.objects.bulk_create(created, batch_size=500)
+    leaderboard.log(moves)
+
+
+def recompute(course_ids=None, student_ids=None):
+    """Rewrite the CourseGrade rows in scope from the submissions; returns how many were wrong."""
+    return len(check(course_ids, student_ids, repair=True))
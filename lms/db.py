@@ -0,0 +1,37 @@
+"""SQLite connection tuning.
+
+Every new SQLite connection gets the PRAGMAs from ``settings.SQLITE_PRAGMAS``
+(empty by default, see the ``LMS_DB_PROFILE`` switch in settings). With the
+production profile the database runs in WAL mode, so readers are no longer
+blocked while a grade or submission is being written.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# applied first: journal_mode is persistent and changes how the others behave
+PRAGMA_ORDER = ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store')
+
+
+def apply_pragmas(cursor, pragmas):
+    """Run PRAGMA statements on a DB-API cursor. Returns {name: resulting value}."""
+    names = [n for n in PRAGMA_ORDER if n in pragmas] + [n for n in pragmas if n not in PRAGMA_ORDER]
+    result = {}
+    for name in names:
+        value = pragmas[name]
+        if not name.replace('_', '').isalnum() or not str(value).lstrip('-').replace('_', '').isalnum():
+            raise ValueError(f"invalid PRAGMA {name}={value!r}")
+        cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.execute(f"PRAGMA {name}")
+        row = cursor.fetchone()
+        result[name] = row[0] if row else None
+    return result
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor != 'sqlite' or not pragmas:
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas)
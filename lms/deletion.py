@@ -0,0 +1,248 @@
+"""Deleting courses and users in the background, in small batches.
+
+Deleting a course in one go cascades through its lessons, submissions (with
+their similarity index), deadlines, certificates and enrollments in a single
+transaction, which keeps SQLite locked for every other request meanwhile.
+schedule_course() and schedule_user() only hide the object instead
+(Course.deleting_at, filtered out by the default manager; User.is_active) and
+record a DeletionJob. `manage.py run_deletions` then deletes the dependent
+rows table by table, DELETION_BATCH_SIZE rows per short transaction with a
+pause in between, and the object itself last.
+
+Files go with their rows: certificate PDFs, attachments whose StoredFile no
+row refers to any more, avatar images nobody else uses and unfinished
+uploads. A job keeps no cursor: every step reads what is left, so an
+interrupted job just continues. Progress is shown in the admin.
+"""
+import os
+import shutil
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import bootstrap, uploads
+from .avatars import avatar_dir
+from .models import (ArchivedDeadline, ArchivedSubmission, Avatar, Certificate, Course, CourseGrade, Deadline,
+                     DeletionJob, HomeworkSubmission, Leaderboard, LeaderboardChange, Lesson, StoredFile, Student,
+                     UploadSession)
+
+# a finished upload that has not been attached to anything yet still needs its file
+UPLOAD_GRACE = timedelta(days=1)
+
+
+# -- Scheduling -------------------------------------------------------------------------
+
+def _count(steps):
+    return sum(queryset.count() for queryset, _ in steps)
+
+
+def _job(kind, object_id, label, requested_by, steps):
+    job = DeletionJob.objects.filter(kind=kind, object_id=object_id, finished_at__isnull=True).first()
+    if job is None:
+        job = DeletionJob.objects.create(kind=kind, object_id=object_id, label=label[:200],
+                                         requested_by=requested_by, total=_count(steps))
+    return job
+
+
+def schedule_course(course, requested_by=None):
+    """Hide the course now and queue the deletion of everything in it; returns the DeletionJob."""
+    with transaction.atomic():
+        Course.all_objects.filter(id=course.id, deleting_at__isnull=True).update(deleting_at=timezone.now())
+        job = _job(DeletionJob.COURSE, course.id, course.title, requested_by, course_steps(course.id))
+        bootstrap.bump_courses([course.id])
+    return job
+
+
+def schedule_user(user, requested_by=None):
+    """Deactivate the user, hide the courses they teach and queue the deletion; returns the DeletionJob."""
+    with transaction.atomic():
+        User.objects.filter(id=user.id).update(is_active=False)
+        courses = Course.all_objects.filter(teacher_id=user.id)
+        course_ids = list(courses.values_list('id', flat=True))
+        courses.filter(deleting_at__isnull=True).update(deleting_at=timezone.now())
+        job = _job(DeletionJob.USER, user.id, user.username, requested_by, user_steps(user.id))
+        bootstrap.bump_courses(course_ids)
+    return job
+
+
+# -- Steps ----------------------------------------------------------------------------------
+# (queryset, update): rows to delete in batches, or to update with `update` when it is set
+
+def course_steps(course_id):
+    return [(queryset, None) for queryset in (
+        Deadline.all_objects.filter(lesson__course_id=course_id),
+        HomeworkSubmission.objects.filter(lesson__course_id=course_id),
+        Certificate.objects.filter(course_id=course_id),
+        CourseGrade.objects.filter(course_id=course_id),
+        LeaderboardChange.objects.filter(course_id=course_id),
+        Leaderboard.objects.filter(course_id=course_id),
+        Lesson.objects.filter(course_id=course_id),
+        Student.courses.through.objects.filter(course_id=course_id),
+        Course.students.through.objects.filter(course_id=course_id),
+        ArchivedSubmission.objects.filter(course_id=course_id),
+        ArchivedDeadline.objects.filter(course_id=course_id),
+        Course.all_objects.filter(id=course_id),
+    )]
+
+
+def user_steps(user_id):
+    student_id = Student.objects.filter(user_id=user_id).values_list('id', flat=True).first()
+    steps = []
+    if student_id is not None:
+        steps += [(Student.courses.through.objects.filter(student_id=student_id), None),
+                  (Course.students.through.objects.filter(student_id=student_id), None)]
+    for course_id in Course.all_objects.filter(teacher_id=user_id).order_by('id').values_list('id', flat=True):
+        steps += course_steps(course_id)
+    if student_id is not None:
+        steps += [(HomeworkSubmission.objects.filter(student_id=student_id), None),
+                  (Certificate.objects.filter(student_id=student_id), None),
+                  (CourseGrade.objects.filter(student_id=student_id), None),
+                  (ArchivedSubmission.objects.filter(student_id=student_id), None),
+                  (Student.objects.filter(id=student_id), None)]
+    steps += [(Avatar.objects.filter(user_id=user_id), None),
+              (UploadSession.objects.filter(user_id=user_id), None),
+              (Deadline.all_objects.filter(created_by_id=user_id), {'created_by': None}),
+              (User.objects.filter(id=user_id), None)]
+    return steps
+
+
+# -- Files ------------------------------------------------------------------------------------
+
+class _Files:
+    """Media the rows of a batch refer to, read before the rows go."""
+
+    def __init__(self):
+        self.paths = []
+        self.stored_ids = set()
+        self.digests = set()
+
+    def collect(self, model, ids, db):
+        rows = model._base_manager.using(db).filter(pk__in=ids)
+        if model is Certificate:
+            self.paths += [os.path.join(settings.MEDIA_ROOT, name)
+                           for name in rows.exclude(pdf_file='').exclude(pdf_file__isnull=True)
+                           .values_list('pdf_file', flat=True)]
+        elif model in (Lesson, HomeworkSubmission, ArchivedSubmission):
+            self.stored_ids.update(rows.filter(attachment_id__isnull=False).values_list('attachment_id', flat=True))
+        elif model is Avatar:
+            self.digests.update(rows.values_list('digest', flat=True))
+        elif model is UploadSession:
+            self.paths += [uploads.part_path(session) for session in rows.filter(stored_file__isnull=True).only('id')]
+            self.stored_ids.update(rows.filter(stored_file__isnull=False).values_list('stored_file_id', flat=True))
+
+    def remove(self):
+        """Remove what no remaining row uses; returns the number of files removed."""
+        removed = 0
+        for path in self.paths:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        for stored in _unused_stored_files(self.stored_ids):
+            name = stored.file.name
+            stored.delete()
+            try:
+                os.remove(os.path.join(settings.MEDIA_ROOT, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        for digest in self.digests - set(Avatar.objects.filter(digest__in=self.digests).values_list('digest', flat=True)):
+            directory = avatar_dir(digest)
+            if os.path.isdir(directory):
+                removed += len(os.listdir(directory))
+                shutil.rmtree(directory, ignore_errors=True)
+        return removed
+
+
+def _unused_stored_files(ids):
+    ids = set(ids)
+    if not ids:
+        return []
+    ids -= set(Lesson.objects.filter(attachment_id__in=ids).values_list('attachment_id', flat=True))
+    ids -= set(HomeworkSubmission.objects.filter(attachment_id__in=ids).values_list('attachment_id', flat=True))
+    ids -= set(ArchivedSubmission.objects.filter(attachment_id__in=ids).values_list('attachment_id', flat=True))
+    ids -= set(UploadSession.objects.filter(stored_file_id__in=ids, updated_at__gte=timezone.now() - UPLOAD_GRACE)
+               .values_list('stored_file_id', flat=True))
+    return list(StoredFile.objects.filter(id__in=ids))
+
+
+# -- Running ----------------------------------------------------------------------------------
+
+def run_batch(queryset, update=None, batch_size=None):
+    """Delete (or update) the next batch of `queryset` in one transaction; returns (rows, files) or None when done."""
+    model = queryset.model
+    db = router.db_for_write(model)
+    ids = list(queryset.using(db).order_by('pk').values_list('pk', flat=True)[:batch_size or settings.DELETION_BATCH_SIZE])
+    if not ids:
+        return None
+    files = _Files()
+    files.collect(model, ids, db)
+    with transaction.atomic(using=db):
+        rows = model._base_manager.using(db).filter(pk__in=ids)
+        if update:
+            rows.update(**update)
+        else:
+            rows.delete()
+    return len(ids), files.remove()
+
+
+def _steps(job):
+    return course_steps(job.object_id) if job.kind == DeletionJob.COURSE else user_steps(job.object_id)
+
+
+def run_job(job, batch_size=None, pause=None, stop=None):
+    """Work through a job; returns True when it is finished, False if `stop` was set first."""
+    pause = settings.DELETION_PAUSE_SECONDS if pause is None else pause
+    if job.started_at is None:
+        job.started_at = timezone.now()
+        job.save(update_fields=['started_at'])
+    for queryset, update in _steps(job):
+        while (result := run_batch(queryset, update, batch_size)) is not None:
+            rows, files = result
+            DeletionJob.objects.filter(id=job.id).update(deleted=F('deleted') + rows,
+                                                         files_removed=F('files_removed') + files)
+            job.deleted += rows
+            job.files_removed += files
+            if stop and stop.is_set():
+                return False
+            if pause:
+                time.sleep(pause)  # let other writers at the database
+    job.finished_at = timezone.now()
+    job.save(update_fields=['finished_at'])
+    return True
+
+
+def pending_jobs():
+    """Jobs to run, oldest first; failed ones wait until their error is cleared in the admin."""
+    return DeletionJob.objects.filter(finished_at__isnull=True, error='').order_by('id')
+
+
+def run_worker(batch_size=None, pause=None, once=False, poll=10, stop=None, log=None):
+    """Loop of `manage.py run_deletions`; returns the number of jobs finished."""
+    finished = 0
+    while not (stop and stop.is_set()):
+        job = pending_jobs().first()
+        if job is None:
+            if once:
+                break
+            time.sleep(poll)
+            continue
+        started = time.monotonic()
+        try:
+            done = run_job(job, batch_size=batch_size, pause=pause, stop=stop)
+        except Exception as exc:
+            DeletionJob.objects.filter(id=job.id).update(error=f'{type(exc).__name__}: {exc}')
+            if log:
+                log(f"{job}: failed: {exc}")
+            continue
+        if done:
+            finished += 1
+            if log:
+                log(f"{job}: {job.deleted} rows, {job.files_removed} files in {time.monotonic() - started:.1f}s")
+    return finished
@@ -0,0 +1,90 @@
+"""Model fields used by lms.models."""
+import zlib
+
+from django import forms
+from django.conf import settings
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is always available
+    zstandard = None
+
+# first byte of the stored value says how the rest is encoded
+RAW = b'r'
+ZLIB = b'z'
+ZSTD = b's'
+
+DEFAULT_THRESHOLD = 512
+
+
+def compress_text(text, threshold=None, codec=None):
+    """Encode text for storage: raw UTF-8 below the threshold, compressed above it."""
+    data = text.encode('utf-8')
+    threshold = getattr(settings, 'COMPRESSED_TEXT_THRESHOLD', DEFAULT_THRESHOLD) if threshold is None else threshold
+    if len(data) < threshold:
+        return RAW + data
+    codec = codec or getattr(settings, 'COMPRESSED_TEXT_CODEC', 'zlib')
+    if codec == 'zstd' and zstandard is not None:
+        packed = ZSTD + zstandard.ZstdCompressor(level=9).compress(data)
+    else:
+        packed = ZLIB + zlib.compress(data, 6)
+    # incompressible text (already short, or random) is kept as is
+    return packed if len(packed) < len(data) + 1 else RAW + data
+
+
+def decompress_text(value):
+    if value is None or isinstance(value, str):
+        # rows written before the column was converted still hold plain text
+        return value
+    value = bytes(value)
+    marker, body = value[:1], value[1:]
+    if marker == ZLIB:
+        return zlib.decompress(body).decode('utf-8')
+    if marker == ZSTD:
+        if zstandard is None:
+            raise RuntimeError('zstandard is required to read this value')
+        return zstandard.ZstdDecompressor().decompress(body).decode('utf-8')
+    if marker == RAW:
+        return body.decode('utf-8')
+    return value.decode('utf-8')
+
+
+class CompressedTextField(models.Field):
+    """Text stored as a (possibly compressed) BLOB; reads and writes plain str.
+
+    Values shorter than settings.COMPRESSED_TEXT_THRESHOLD bytes are stored raw.
+    The column cannot be searched with LIKE, so lists should defer() it and show
+    a separate preview column instead.
+    """
+    description = 'Compressed text'
+
+    def get_internal_type(self):
+        return 'BinaryField'
+
+    def from_db_value(self, value, expression, connection):
+        return decompress_text(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return decompress_text(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None:
+            return None
+        return compress_text(str(value))
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        return connection.Database.Binary(value)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.CharField, 'widget': forms.Textarea, **kwargs})
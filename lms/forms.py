@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import AuthenticationForm
-from .models import Course, Lesson, HomeworkSubmission, Student
+from .models import Course, Lesson, HomeworkSubmission, Student, LessonChecker
 
 ROLE_CHOICES = (
     ('student', 'Студент'),
@@ -52,16 +52,53 @@ class CourseCreateForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'class':'form-control'}),
         }
 
+class CourseCloneForm(forms.Form):
+    title = forms.CharField(max_length=200, widget=forms.TextInput(attrs={'class': 'form-control'}))
+    shift_days = forms.IntegerField(label='Сдвиг дедлайнов, дней',
+                                    widget=forms.NumberInput(attrs={'class': 'form-control'}))
+
 class LessonCreateForm(forms.ModelForm):
+    # id of a completed chunked upload (filled in by static/js/chunked-upload.js)
+    upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput(attrs={'data-chunked-upload': '1'}))
+
     class Meta:
         model = Lesson
-        fields = ['title', 'content']
+        fields = ['title', 'content', 'weight']
         widgets = {
             'title': forms.TextInput(attrs={'class':'form-control'}),
             'content': forms.Textarea(attrs={'class':'form-control'}),
+            'weight': forms.NumberInput(attrs={'class':'form-control', 'min':0}),
+        }
+        labels = {'weight': 'Вес в итоговой оценке'}
+
+class LessonCheckerForm(forms.ModelForm):
+    class Meta:
+        model = LessonChecker
+        fields = ['kind', 'expected', 'tolerance', 'points', 'time_limit', 'memory_limit_mb']
+        widgets = {
+            'kind': forms.Select(attrs={'class': 'form-control'}),
+            'expected': forms.Textarea(attrs={'class': 'form-control font-monospace', 'rows': 8}),
+            'tolerance': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any'}),
+            'points': forms.NumberInput(attrs={'class': 'form-control', 'min': 0, 'max': 100}),
+            'time_limit': forms.NumberInput(attrs={'class': 'form-control', 'step': 'any', 'min': 0.5, 'max': 60}),
+            'memory_limit_mb': forms.NumberInput(attrs={'class': 'form-control', 'min': 32, 'max': 2048}),
         }
 
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('kind') == 'regex':
+            import re
+            try:
+                re.compile(cleaned.get('expected') or '')
+            except re.error as exc:
+                self.add_error('expected', f'Неверное регулярное выражение: {exc}')
+        if cleaned.get('kind') == 'python' and 'def test_' not in (cleaned.get('expected') or ''):
+            self.add_error('expected', 'Добавьте хотя бы одну функцию test_*.')
+        return cleaned
+
 class HomeworkSubmissionForm(forms.ModelForm):
+    upload_id = forms.UUIDField(required=False, widget=forms.HiddenInput(attrs={'data-chunked-upload': '1'}))
+
     class Meta:
         model = HomeworkSubmission
         fields = ['content']
@@ -90,3 +127,26 @@ class DeadlineForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows':3}),
             'lesson': forms.Select(attrs={'class': 'form-control'}),
         }
+
+
+class AvatarUploadForm(forms.Form):
+    image = forms.ImageField(widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': 'image/*'}))
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if image.size > 5 * 1024 * 1024:
+            raise forms.ValidationError('Файл слишком большой (максимум 5 МБ).')
+        return image
+
+
+IMPORT_KIND_CHOICES = (
+    ('users', 'Пользователи (студенты и преподаватели)'),
+    ('courses', 'Курсы'),
+    ('lessons', 'Уроки'),
+    ('enrollments', 'Записи на курсы'),
+)
+
+class ImportForm(forms.Form):
+    kind = forms.ChoiceField(choices=IMPORT_KIND_CHOICES, widget=forms.Select(attrs={'class': 'form-control'}))
+    file = forms.FileField(help_text='CSV с заголовком или JSON Lines (.jsonl)',
+                           widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.jsonl,.json'}))
@@ -0,0 +1,73 @@
+"""Grading many submissions at once (batch form on the teacher's page and /api/grades/)."""
+from collections import defaultdict
+
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+
+from . import bootstrap, coursegrades
+from .models import Course, HomeworkSubmission, issue_certificates
+
+MIN_GRADE = 0
+MAX_GRADE = 100
+
+
+class GradingError(ValueError):
+    pass
+
+
+def parse_grades(items):
+    """{submission id: grade} from (id, grade) pairs; raises GradingError on bad values."""
+    grades = {}
+    for submission_id, grade in items:
+        try:
+            submission_id, grade = int(submission_id), int(grade)
+        except (TypeError, ValueError):
+            raise GradingError(f"invalid pair ({submission_id!r}, {grade!r})")
+        if not MIN_GRADE <= grade <= MAX_GRADE:
+            raise GradingError(f"grade {grade} for submission {submission_id} is outside {MIN_GRADE}..{MAX_GRADE}")
+        grades[submission_id] = grade
+    return grades
+
+
+def apply_grades(teacher, grades, lesson=None):
+    """Grade submissions of the teacher's courses in one transaction; returns the number changed.
+
+    Ownership of all ids is checked with one query and the whole batch is
+    refused if any id is unknown or belongs to another teacher. The rows are
+    read (locked where the database supports SELECT ... FOR UPDATE) in the
+    transaction that updates them and the course grades, so a concurrent
+    grade change cannot make the course-grade deltas stale. Certificates are
+    evaluated once per affected student afterwards.
+    """
+    if not grades:
+        return 0
+    owned = HomeworkSubmission.objects.filter(id__in=list(grades), lesson__course__teacher=teacher)
+    if lesson is not None:
+        owned = owned.filter(lesson=lesson)
+    changed = []
+    deltas = coursegrades.Deltas()
+    with transaction.atomic():
+        # read in the transaction that writes: the deltas are taken against the rows being replaced
+        submissions = list(owned.select_for_update(of=('self',)).select_related('lesson').only(
+            'id', 'grade', 'is_graded', 'student_id', 'lesson_id', 'lesson__course_id', 'lesson__weight'))
+        if len(submissions) != len(grades):
+            raise PermissionDenied
+        for submission in submissions:
+            grade = grades[submission.id]
+            if submission.grade != grade or not submission.is_graded:
+                deltas.add(submission.student_id, submission.lesson.course_id, submission.lesson.weight,
+                           (submission.is_graded, submission.grade), (True, grade))
+                submission.grade = grade
+                submission.is_graded = True
+                changed.append(submission)
+        HomeworkSubmission.objects.bulk_update(changed, ['grade', 'is_graded'], batch_size=500)
+        # bulk_update sends no signals
+        deltas.apply()
+        bootstrap.bump({s.student_id for s in changed})
+
+    students_by_course = defaultdict(set)
+    for submission in changed:
+        students_by_course[submission.lesson.course_id].add(submission.student_id)
+    for course in Course.objects.filter(id__in=students_by_course):
+        issue_certificates(course, students_by_course[course.id])
+    return len(changed)
@@ -0,0 +1,337 @@
+"""Bulk import of users/students, courses, lessons and enrollments.
+
+Input is CSV (header row) or JSON Lines (one object per line), read as a stream
+and processed in batches. Every batch is validated row by row, then written
+with bulk_create/bulk_update in its own short transaction. Rows are matched on
+natural keys, so importing the same file twice updates instead of duplicating:
+
+- users:       username
+- courses:     title + teacher (username)
+- lessons:     course (title) + title; optional ``teacher`` column disambiguates the course
+- enrollments: username + course (title); optional ``teacher`` column
+
+Password hashing is the slow part (PBKDF2 runs hundreds of thousands of
+iterations per password), so passwords of a batch are hashed in a process pool.
+Rows without a password get an unusable password and no hashing at all.
+
+Only a trusted import (`manage.py import_lms`, or a superuser on the import
+page) may create teachers or change staff and superuser accounts; otherwise
+such rows are reported as errors and skipped.
+"""
+import csv
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+
+from . import bootstrap
+from .models import Course, Lesson, Student
+
+KINDS = ('users', 'courses', 'lessons', 'enrollments')
+DEFAULT_BATCH_SIZE = 1000
+
+REQUIRED = {
+    'users': ('username',),
+    'courses': ('title', 'teacher'),
+    'lessons': ('course', 'title'),
+    'enrollments': ('username', 'course'),
+}
+
+
+class ImportReport:
+    def __init__(self, kind):
+        self.kind = kind
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.rows = 0
+        self.errors = []  # (line number, message)
+
+    def error(self, line, message):
+        self.errors.append((line, message))
+
+    def __str__(self):
+        return (f"{self.kind}: {self.rows} rows, {self.created} created, {self.updated} updated, "
+                f"{self.unchanged} unchanged, {len(self.errors)} errors")
+
+
+def kind_from_filename(path):
+    stem = os.path.splitext(os.path.basename(path))[0].lower()
+    if stem in ('students', 'teachers'):
+        return 'users'
+    for kind in KINDS:
+        if stem.startswith(kind):
+            return kind
+    return None
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, dict) from a text stream without reading it whole."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {k.strip(): (v or '').strip() for k, v in row.items() if k}
+    elif fmt == 'jsonl':
+        for n, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                yield n, None
+                continue
+            yield n, {k: '' if v is None else str(v).strip() for k, v in obj.items()} if isinstance(obj, dict) else None
+    else:
+        raise ValueError(f"unsupported format {fmt!r}")
+
+
+def format_from_filename(path):
+    ext = os.path.splitext(path)[1].lower()
+    return 'jsonl' if ext in ('.jsonl', '.ndjson', '.json') else 'csv'
+
+
+def _batches(rows, size):
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _init_worker():
+    # spawned workers (Windows, macOS) start without Django configured
+    import django
+    from django.apps import apps
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms_project.settings')
+    if not apps.ready:
+        django.setup()
+
+
+def _hash(password):
+    return make_password(password)
+
+
+class Importer:
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, workers=None, update_passwords=False, manage_staff=True):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.update_passwords = update_passwords
+        self.manage_staff = manage_staff  # may create teachers and change staff/superuser accounts
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        return False
+
+    def hash_passwords(self, passwords):
+        if not passwords:
+            return []
+        if len(passwords) < 4 or self.workers == 0:
+            return [make_password(p) for p in passwords]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        return list(self._pool.map(_hash, passwords, chunksize=max(1, len(passwords) // 32)))
+
+    def run(self, kind, stream, fmt='csv'):
+        report = ImportReport(kind)
+        handler = getattr(self, f'_import_{kind}')
+        for batch in _batches(iter_rows(stream, fmt), self.batch_size):
+            valid = []
+            for line, row in batch:
+                report.rows += 1
+                if row is None:
+                    report.error(line, 'invalid JSON object')
+                    continue
+                missing = [f for f in REQUIRED[kind] if not row.get(f)]
+                if missing:
+                    report.error(line, f"missing {', '.join(missing)}")
+                    continue
+                valid.append((line, row))
+            if valid:
+                handler(valid, report)
+        return report
+
+    def run_file(self, path, kind=None):
+        kind = kind or kind_from_filename(path)
+        if kind not in KINDS:
+            raise ValueError(f"cannot tell what {path} contains; use one of: {', '.join(KINDS)}")
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            return self.run(kind, f, format_from_filename(path))
+
+    # -- users -------------------------------------------------------------------
+
+    def _import_users(self, rows, report):
+        checked = []
+        for line, row in rows:
+            role = (row.get('role') or 'student').lower()
+            if role not in ('student', 'teacher'):
+                report.error(line, f"unknown role {role!r}")
+                continue
+            if role == 'teacher' and not self.manage_staff:
+                report.error(line, 'only a superuser can import teachers')
+                continue
+            if row.get('email'):
+                try:
+                    validate_email(row['email'])
+                except ValidationError:
+                    report.error(line, f"invalid email {row['email']!r}")
+                    continue
+            checked.append((line, row, role))
+        # the last row wins if a username repeats inside a batch
+        by_username = {row['username']: (line, row, role) for line, row, role in checked}
+        existing = {u.username: u for u in User.objects.filter(username__in=by_username)}
+        if not self.manage_staff:
+            for name, user in list(existing.items()):
+                if user.is_staff or user.is_superuser:
+                    report.error(by_username.pop(name)[0], f"{name!r} is a staff account; only a superuser can change it")
+                    del existing[name]
+
+        to_hash = [(name, row['password']) for name, (_, row, _) in by_username.items()
+                   if row.get('password') and (name not in existing or self.update_passwords)]
+        hashes = dict(zip((n for n, _ in to_hash), self.hash_passwords([p for _, p in to_hash])))
+
+        new_users, changed, unchanged = [], [], []
+        for name, (line, row, role) in by_username.items():
+            fields = {f: row[f] for f in ('email', 'first_name', 'last_name') if f in row}
+            user = existing.get(name)
+            if user is None:
+                user = User(username=name, is_staff=(role == 'teacher'), **fields)
+                user.password = hashes.get(name) or make_password(None)
+                new_users.append(user)
+            else:
+                if name in hashes:
+                    fields['password'] = hashes[name]
+                if any(getattr(user, f) != v for f, v in fields.items()):
+                    for f, v in fields.items():
+                        setattr(user, f, v)
+                    changed.append(user)
+                else:
+                    unchanged.append(user)
+
+        with transaction.atomic():
+            created = User.objects.bulk_create(new_users)
+            if changed:
+                User.objects.bulk_update(changed, ['email', 'first_name', 'last_name', 'password'])
+            student_user_ids = [u.id for u in created + changed + unchanged
+                                if by_username[u.username][2] == 'student']
+            Student.objects.bulk_create([Student(user_id=uid) for uid in student_user_ids], ignore_conflicts=True)
+        report.created += len(created)
+        report.updated += len(changed)
+        report.unchanged += len(unchanged)
+
+    # -- courses -----------------------------------------------------------------
+
+    def _teachers(self, usernames):
+        return {u.username: u for u in User.objects.filter(username__in=set(usernames))}
+
+    def _import_courses(self, rows, report):
+        teachers = self._teachers(row['teacher'] for _, row in rows)
+        keyed = {}
+        for line, row in rows:
+            if row['teacher'] not in teachers:
+                report.error(line, f"unknown teacher {row['teacher']!r}")
+                continue
+            keyed[(row['title'], teachers[row['teacher']].id)] = row
+        existing = {(c.title, c.teacher_id): c for c in Course.objects.filter(
+            title__in={t for t, _ in keyed}, teacher__in=[t.id for t in teachers.values()])}
+        new, changed = [], []
+        for (title, teacher_id), row in keyed.items():
+            course = existing.get((title, teacher_id))
+            if course is None:
+                new.append(Course(title=title, teacher_id=teacher_id, description=row.get('description', '')))
+            elif 'description' in row and course.description != row['description']:
+                course.description = row['description']
+                changed.append(course)
+        with transaction.atomic():
+            Course.objects.bulk_create(new)
+            Course.objects.bulk_update(changed, ['description'])
+        report.created += len(new)
+        report.updated += len(changed)
+        report.unchanged += len(keyed) - len(new) - len(changed)
+
+    def _resolve_courses(self, rows, report):
+        """Map (line, row) -> Course by title (+ optional teacher username); reports ambiguous ones."""
+        titles = {row['course'] for _, row in rows}
+        by_title = {}
+        for c in Course.objects.filter(title__in=titles).select_related('teacher'):
+            by_title.setdefault(c.title, []).append(c)
+        resolved = []
+        for line, row in rows:
+            candidates = by_title.get(row['course'], [])
+            if row.get('teacher'):
+                candidates = [c for c in candidates if c.teacher.username == row['teacher']]
+            if len(candidates) != 1:
+                report.error(line, f"course {row['course']!r} is {'ambiguous' if candidates else 'unknown'}")
+                continue
+            resolved.append((line, row, candidates[0]))
+        return resolved
+
+    # -- lessons -----------------------------------------------------------------
+
+    def _import_lessons(self, rows, report):
+        keyed = {(course.id, row['title']): row for _, row, course in self._resolve_courses(rows, report)}
+        existing = {(l.course_id, l.title): l for l in Lesson.objects.filter(
+            course_id__in={cid for cid, _ in keyed}, title__in={t for _, t in keyed})}
+        new, changed = [], []
+        for (course_id, title), row in keyed.items():
+            lesson = existing.get((course_id, title))
+            if lesson is None:
+                new.append(Lesson(course_id=course_id, title=title, content=row.get('content', '')))
+            elif 'content' in row and lesson.content != row['content']:
+                lesson.content = row['content']
+                changed.append(lesson)
+        with transaction.atomic():
+            Lesson.objects.bulk_create(new)
+            Lesson.objects.bulk_update(changed, ['content'])
+            bootstrap.bump_courses({l.course_id for l in new})
+        report.created += len(new)
+        report.updated += len(changed)
+        report.unchanged += len(keyed) - len(new) - len(changed)
+
+    # -- enrollments -------------------------------------------------------------
+
+    def _import_enrollments(self, rows, report):
+        resolved = self._resolve_courses(rows, report)
+        students = {s.user.username: s for s in Student.objects.filter(
+            user__username__in={row['username'] for _, row, _ in resolved}).select_related('user')}
+        pairs = set()
+        for line, row, course in resolved:
+            student = students.get(row['username'])
+            if student is None:
+                report.error(line, f"unknown student {row['username']!r}")
+                continue
+            pairs.add((student.id, course.id))
+        existing = set(Student.courses.through.objects.filter(
+            student_id__in={s for s, _ in pairs}).values_list('student_id', 'course_id'))
+        # enrollment is stored on both sides (Student.courses and Course.students), keep them in sync
+        with transaction.atomic():
+            Student.courses.through.objects.bulk_create(
+                [Student.courses.through(student_id=s, course_id=c) for s, c in pairs], ignore_conflicts=True)
+            Course.students.through.objects.bulk_create(
+                [Course.students.through(student_id=s, course_id=c) for s, c in pairs], ignore_conflicts=True)
+            bootstrap.bump({s for s, _ in pairs - existing})
+        report.created += len(pairs - existing)
+        report.unchanged += len(pairs & existing)
+
+
+def import_uploaded_file(kind, uploaded_file, fmt=None, **options):
+    """Run an import on a Django UploadedFile (streamed, decoded as UTF-8)."""
+    fmt = fmt or format_from_filename(uploaded_file.name)
+    stream = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+    with Importer(**options) as importer:
+        return importer.run(kind, stream, fmt)
@@ -0,0 +1,195 @@
+"""Per-course leaderboards: the top students and the rank of any student.
+
+Students are ranked by their course grade (CourseGrade.final_grade) in
+buckets of a tenth of a point, the precision the pages show; a bucket shares
+its rank (1, 2, 2, 4). The rank of a student is 1 + the number of students in
+higher buckets, counted by a Fenwick tree (binary indexed tree) over the
+buckets in O(log buckets), independent of the number of students. The top N
+come from the (course, final_grade, student) index of CourseGrade.
+
+Every process keeps the trees of the courses it has served and updates them
+incrementally: lms.coursegrades logs each move of a final grade
+(LeaderboardChange: old and new grade) in the transaction that makes it, and
+a tree applies the entries after its cursor before answering.
+`manage.py persist_leaderboards` periodically stores the trees (Leaderboard:
+bucket counts and the last change included), rebuilt from CourseGrade so that
+rows removed without an entry (deleted students) drop out, and prunes the
+log. A process loads the stored counts instead of reading every grade, and
+reloads them when they are newer than its own tree.
+
+Ranks are exact per bucket, not per student: two grades in the same tenth of
+a point share a rank even if they differ further down. Queries run outside
+the process lock; it is held only to install a board or advance it by the
+changes read, and to compute ranks from it.
+"""
+import math
+import threading
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .models import CourseGrade, Leaderboard, LeaderboardChange
+
+RESOLUTION = 10  # buckets per grade point
+SIZE = 100 * RESOLUTION + 1  # grades 0..100 (lms.grading)
+
+Place = namedtuple('Place', 'rank student final_grade')
+Standing = namedtuple('Standing', 'rank total final_grade')
+
+
+def bucket(grade):
+    # the epsilon keeps 70.3 * 10 = 702.999... in bucket 703
+    return min(max(math.floor(grade * RESOLUTION + 1e-6), 0), SIZE - 1)
+
+
+def _key(grade):
+    return None if grade is None else bucket(grade)
+
+
+class Ranking:
+    """Students per grade bucket with O(log n) prefix counts (a Fenwick tree)."""
+
+    def __init__(self, counts=None):
+        self.counts = [0] * SIZE
+        for b, n in (counts or {}).items():
+            self.counts[int(b)] += n
+        self.total = sum(self.counts)
+        self.tree = [0] + self.counts
+        for i in range(1, SIZE + 1):  # build in O(n): pass each node's sum up to its parent
+            parent = i + (i & -i)
+            if parent <= SIZE:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, grade, n=1):
+        b = bucket(grade)
+        self.counts[b] += n
+        self.total += n
+        i = b + 1
+        while i <= SIZE:
+            self.tree[i] += n
+            i += i & -i
+
+    def move(self, old, new):
+        """A student's grade went from `old` to `new` (None: not ranked)."""
+        if old is not None:
+            self.add(old, -1)
+        if new is not None:
+            self.add(new, 1)
+
+    def count_upto(self, b):
+        """Students in buckets 0..b."""
+        count, i = 0, b + 1
+        while i > 0:
+            count += self.tree[i]
+            i -= i & -i
+        return count
+
+    def rank(self, grade):
+        return 1 + self.total - self.count_upto(bucket(grade))
+
+    def sparse_counts(self):
+        return {str(b): n for b, n in enumerate(self.counts) if n}
+
+
+# -- Log ------------------------------------------------------------------------------------------
+
+def log(moves):
+    """Record (course_id, old grade, new grade) moves that change a rank bucket; one INSERT."""
+    LeaderboardChange.objects.bulk_create(
+        [LeaderboardChange(course_id=course_id, old_grade=old, new_grade=new)
+         for course_id, old, new in moves if _key(old) != _key(new)], batch_size=500)
+
+
+# -- Rankings of this process ---------------------------------------------------------------------
+
+class _Board:
+    def __init__(self, ranking, cursor):
+        self.ranking = ranking
+        self.cursor = cursor  # id of the last LeaderboardChange included
+
+
+_boards = {}
+_lock = threading.Lock()
+
+
+def _rebuild(course_id):
+    """A _Board from the course grades themselves, O(students)."""
+    with transaction.atomic():  # the cursor and the grades as of the same moment
+        cursor = LeaderboardChange.objects.aggregate(last=Max('id'))['last'] or 0
+        grades = CourseGrade.objects.filter(course_id=course_id, final_grade__isnull=False)
+        counts = Counter(bucket(grade) for grade in grades.values_list('final_grade', flat=True))
+    return _Board(Ranking(counts), cursor)
+
+
+def _install(course_id, board):
+    """Make `board` the course's board unless a newer one got there first; returns the one in place."""
+    with _lock:
+        current = _boards.get(course_id)
+        if current is None or current.cursor <= board.cursor:
+            _boards[course_id] = current = board
+        return current
+
+
+def _current(course_id):
+    """This process's board of the course, caught up with the log; read its ranking with _lock held."""
+    with _lock:
+        board = _boards.get(course_id)
+    stored_cursor = Leaderboard.objects.filter(course_id=course_id).values_list('last_change_id', flat=True).first()
+    if board is None or (stored_cursor is not None and stored_cursor > board.cursor):
+        stored = Leaderboard.objects.filter(course_id=course_id).first()
+        board = _install(course_id, _Board(Ranking(stored.counts), stored.last_change_id) if stored
+                         else _rebuild(course_id))
+    changes = list(LeaderboardChange.objects.filter(course_id=course_id, id__gt=board.cursor).order_by('id')
+                   .values_list('id', 'old_grade', 'new_grade'))
+    with _lock:
+        for change_id, old, new in changes:
+            if change_id > board.cursor:  # not applied by another thread meanwhile
+                board.ranking.move(old, new)
+                board.cursor = change_id
+    return board
+
+
+def reset():
+    """Forget the rankings of this process (they are loaded again when needed)."""
+    with _lock:
+        _boards.clear()
+
+
+def top(course_id, n=None):
+    """The best `n` (default LEADERBOARD_TOP) graded students of the course as Places."""
+    n = n or settings.LEADERBOARD_TOP
+    rows = list(CourseGrade.objects.filter(course_id=course_id, final_grade__isnull=False)
+                .select_related('student__user').order_by('-final_grade', 'student_id')[:n])
+    board = _current(course_id)
+    with _lock:
+        return [Place(board.ranking.rank(row.final_grade), row.student, row.final_grade) for row in rows]
+
+
+def standing(course_id, student_id):
+    """Rank of the student among the graded students of the course, None before their first grade."""
+    grade = (CourseGrade.objects.filter(course_id=course_id, student_id=student_id)
+             .values_list('final_grade', flat=True).first())
+    if grade is None:
+        return None
+    board = _current(course_id)
+    with _lock:
+        return Standing(board.ranking.rank(grade), board.ranking.total, grade)
+
+
+# -- Persisting ---------------------------------------------------------------------------------
+
+def persist(course_ids=None):
+    """Store the rankings rebuilt from CourseGrade and prune the log; returns the number stored."""
+    if course_ids is None:
+        course_ids = (set(CourseGrade.objects.filter(final_grade__isnull=False).values_list('course_id', flat=True))
+                      | set(Leaderboard.objects.values_list('course_id', flat=True))
+                      | set(LeaderboardChange.objects.values_list('course_id', flat=True)))
+    for course_id in sorted(course_ids):
+        board = _rebuild(course_id)
+        Leaderboard.objects.update_or_create(
+            course_id=course_id, defaults={'counts': board.ranking.sparse_counts(), 'last_change_id': board.cursor})
+        LeaderboardChange.objects.filter(course_id=course_id, id__lte=board.cursor).delete()
+        _install(course_id, board)
+    return len(course_ids)
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.archive import archivable_courses, archive_course
+from lms.models import Course
+
+
+class Command(BaseCommand):
+    help = ('Move submissions and deadlines of courses closed more than ARCHIVE_AFTER_TERMS terms ago '
+            'to the archive tables. Safe to interrupt and run again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--terms', type=int, default=None,
+                            help='Archive courses closed at least this many terms ago (default: ARCHIVE_AFTER_TERMS).')
+        parser.add_argument('--course', type=int, action='append', default=[],
+                            help='Archive only this closed course (repeatable); ignores --terms.')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--dry-run', action='store_true', help='Only list the courses that would be archived.')
+
+    def handle(self, *args, **options):
+        if options['course']:
+            courses = Course.objects.filter(id__in=options['course'], archived_at__isnull=True).order_by('id')
+            if courses.filter(closed_at__isnull=True).exists():
+                raise CommandError('Only closed courses can be archived; set closed_at first.')
+        else:
+            courses = archivable_courses(options['terms'])
+
+        courses = list(courses)
+        if not courses:
+            self.stdout.write('Nothing to archive.')
+            return
+        for course in courses:
+            if options['dry_run']:
+                self.stdout.write(f"would archive {course.title} (#{course.id}), closed {course.closed_at:%Y-%m-%d}")
+                continue
+            started = time.monotonic()
+            result = archive_course(course, batch_size=options['batch_size'])
+            self.stdout.write(f"archived {result} in {time.monotonic() - started:.1f}s")
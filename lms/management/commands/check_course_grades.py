@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lms.coursegrades import check
+
+
+class Command(BaseCommand):
+    help = ('Recompute the weighted course grades from the submissions (archived ones included) and report '
+            'the CourseGrade rows that drifted; --repair rewrites them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Rewrite the rows that differ.')
+        parser.add_argument('--course', type=int, action='append', default=None,
+                            help='Only this course (may be repeated).')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        drifts = check(course_ids=options['course'], repair=options['repair'])
+        for drift in drifts:
+            self.stdout.write(f"student {drift.student_id}, course {drift.course_id}: "
+                              f"stored sum={drift.stored.weighted_sum} weight={drift.stored.weight_total} "
+                              f"graded={drift.stored.graded_count}, expected sum={drift.expected.weighted_sum} "
+                              f"weight={drift.expected.weight_total} graded={drift.expected.graded_count}")
+        state = 'repaired' if options['repair'] and drifts else 'found'
+        self.stdout.write(f"{len(drifts)} drifted course grades {state} in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from lms.autocheck import enqueue, run_worker
+from lms.models import HomeworkSubmission
+
+
+class Command(BaseCommand):
+    help = ('Run automatic checks of queued submissions in a process pool and store provisional grades. '
+            'Runs until interrupted unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: CHECK_WORKERS or CPU count, 0 = no pool).')
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty.')
+        parser.add_argument('--requeue-lesson', type=int, action='append', default=[],
+                            help='Queue all ungraded submissions of this lesson again (e.g. after fixing its checker).')
+        parser.add_argument('--reset-stale', action='store_true',
+                            help='Requeue every claimed submission, also those of workers on other hosts '
+                                 '(only when no other worker is running).')
+
+    def handle(self, *args, **options):
+        if options['requeue_lesson']:
+            queued = enqueue(HomeworkSubmission.objects.filter(lesson__in=options['requeue_lesson'], is_graded=False))
+            self.stdout.write(f"{queued} submissions queued")
+        try:
+            total = run_worker(workers=options['workers'], batch_size=options['batch_size'], once=options['once'],
+                               log=self.stdout.write, reset_all=options['reset_stale'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(f"{total} submissions checked")
@@ -0,0 +1,35 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.cloning import clone_course, default_shift
+from lms.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Copy a course with its lessons, checks and deadlines (shifted by a number of days) for a new term.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', type=int, help='Id of the course to copy.')
+        parser.add_argument('--title', help='Title of the copy (default: the same title).')
+        parser.add_argument('--shift-days', type=int, default=None,
+                            help=f'Move deadlines by this many days (default: one term, {default_shift().days}).')
+        parser.add_argument('--teacher', help='Username of the teacher of the copy (default: the same teacher).')
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.select_related('teacher').get(id=options['course'])
+        except Course.DoesNotExist:
+            raise CommandError(f"Course #{options['course']} does not exist.")
+        teacher = None
+        if options['teacher']:
+            try:
+                teacher = User.objects.get(username=options['teacher'], is_staff=True)
+            except User.DoesNotExist:
+                raise CommandError(f"No teacher named {options['teacher']!r}.")
+        shift = None if options['shift_days'] is None else timedelta(days=options['shift_days'])
+        started = time.monotonic()
+        result = clone_course(course, teacher=teacher, title=options['title'], shift=shift)
+        self.stdout.write(f"cloned {result} in {time.monotonic() - started:.2f}s")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from lms.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = ('Delete chunked uploads left unfinished for UPLOAD_EXPIRE_HOURS (or --hours) together with '
+            'their .part files, and .part files without an upload.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None,
+                            help='Idle time after which an upload expires (default: UPLOAD_EXPIRE_HOURS).')
+
+    def handle(self, *args, **options):
+        removed = expire_uploads(hours=options['hours'])
+        self.stdout.write(f"{removed} unfinished uploads expired")
@@ -0,0 +1,149 @@
+import asyncio
+import re
+import shutil
+import tempfile
+import uuid
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from lms import views
+from lms.models import Course, Deadline, HomeworkSubmission, Lesson, Student
+
+# "SCAN <table>" visits every row, with or without "USING [COVERING] INDEX";
+# "SEARCH ..." lines are index lookups. Aliases (U0, T4) are resolved from the SQL.
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)')
+ALIAS_RE = re.compile(r'"(\w+)" (?:AS )?"?(\w+)"?')
+NOT_TABLES = {'CONSTANT', 'SUBQUERY'}
+
+
+class _Rollback(Exception):
+    pass
+
+
+async def _await(coro):
+    return await coro
+
+
+class Command(BaseCommand):
+    help = ('Run the main views against sample data, EXPLAIN QUERY PLAN every SELECT they issue '
+            'and fail if a query does a full scan of a table larger than --threshold rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=int, default=1000,
+                            help='Fail on full scans of tables with more rows than this (default 1000).')
+        parser.add_argument('--students', type=int, default=150, help='Sample students to create.')
+        parser.add_argument('--lessons', type=int, default=10, help='Sample lessons to create.')
+        parser.add_argument('--deadlines', type=int, default=1500, help='Sample deadlines to create.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('explain_hot_queries uses SQLite EXPLAIN QUERY PLAN output.')
+        media_root = tempfile.mkdtemp()
+        problems = []
+        try:
+            # everything (sample data, avatars, sessions) is rolled back afterwards
+            with override_settings(MEDIA_ROOT=media_root), transaction.atomic():
+                problems = self._run(options)
+                raise _Rollback
+        except _Rollback:
+            pass
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        if problems:
+            raise CommandError(f"{len(problems)} query(ies) do full table scans above the threshold.")
+        self.stdout.write(self.style.SUCCESS('No full table scans above the threshold.'))
+
+    def _seed(self, students, lessons, deadlines):
+        tag = uuid.uuid4().hex[:8]
+        teacher = User.objects.create_user(username=f'explain-teacher-{tag}', is_staff=True)
+        course = Course.objects.create(title='Explain course', description='', teacher=teacher)
+        lesson_objs = Lesson.objects.bulk_create(
+            Lesson(course=course, title=f'Lesson {i}', content='') for i in range(lessons))
+        users = User.objects.bulk_create(
+            User(username=f'explain-student-{tag}-{i}') for i in range(students))
+        student_objs = Student.objects.bulk_create(Student(user=u) for u in users)
+        course.students.add(*student_objs)
+        Student.courses.through.objects.bulk_create(
+            Student.courses.through(student=s, course=course) for s in student_objs)
+        HomeworkSubmission.objects.bulk_create(
+            HomeworkSubmission(student=s, lesson=l, content='answer', is_graded=bool(i % 2), grade=i % 100)
+            for i, (s, l) in enumerate((s, l) for s in student_objs for l in lesson_objs))
+        now = timezone.now()
+        Deadline.objects.bulk_create(
+            Deadline(title=f'DL {i}', due_at=now + timedelta(days=i), lesson=lesson_objs[i % len(lesson_objs)],
+                     created_by=teacher)
+            for i in range(deadlines))
+        return teacher, student_objs[0], course, lesson_objs[0]
+
+    def _requests(self, teacher, student, course, lesson):
+        """(label, view, user, kwargs, query string) for every hot page."""
+        s_user = student.user
+        return [
+            ('course_list', views.course_list, AnonymousUser(), {}, ''),
+            ('course_detail', views.course_detail, s_user, {'course_id': course.id}, ''),
+            ('lesson_detail', views.lesson_detail, s_user, {'lesson_id': lesson.id}, ''),
+            ('student_dashboard', views.student_dashboard, s_user, {}, ''),
+            ('submissions_list', views.submissions_list, s_user, {}, 'graded=yes'),
+            ('student_grades', views.student_grades, s_user, {}, ''),
+            ('deadlines_api', views.deadlines_api, s_user, {}, ''),
+            ('teacher_dashboard', views.teacher_dashboard, teacher, {}, ''),
+            ('teacher_course_detail', views.teacher_course_detail, teacher, {'course_id': course.id}, ''),
+            ('teacher_lesson_submissions', views.teacher_lesson_submissions, teacher,
+             {'lesson_id': lesson.id}, 'graded=no'),
+        ]
+
+    def _run(self, options):
+        seeded = self._seed(options['students'], options['lessons'], options['deadlines'])
+        factory = RequestFactory()
+        threshold = options['threshold']
+        row_counts = {}
+        problems = []
+        for label, view, user, kwargs, query in self._requests(*seeded):
+            request = factory.get('/?' + query)
+            request.user = user
+            request.session = SessionBase()
+            request._messages = FallbackStorage(request)
+            with CaptureQueriesContext(connection) as ctx:
+                response = view(request, **kwargs)
+                if asyncio.iscoroutine(response):
+                    response = async_to_sync(_await)(response)
+                if hasattr(response, 'render'):
+                    response.render()
+            self.stdout.write(f"{label}: {len(ctx.captured_queries)} queries")
+            for sql in self._selects(ctx.captured_queries):
+                for table in self._full_scans(sql):
+                    if table not in row_counts:
+                        with connection.cursor() as cursor:
+                            cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+                            row_counts[table] = cursor.fetchone()[0]
+                    if row_counts[table] > threshold:
+                        problems.append((label, table, sql))
+                        self.stdout.write(self.style.ERROR(
+                            f"  full scan of {table} ({row_counts[table]} rows): {sql[:200]}"))
+        return problems
+
+    def _selects(self, captured):
+        for q in captured:
+            sql = q['sql']
+            if sql.lstrip().upper().startswith('SELECT'):
+                yield sql
+
+    def _full_scans(self, sql):
+        # captured SQL has its parameters already interpolated
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            rows = cursor.fetchall()
+        aliases = dict((alias, table) for table, alias in ALIAS_RE.findall(sql))
+        for row in rows:
+            m = FULL_SCAN_RE.match(row[-1])
+            if m and m.group(1) not in NOT_TABLES:
+                yield aliases.get(m.group(1), m.group(1))
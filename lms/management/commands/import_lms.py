@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lms.importer import DEFAULT_BATCH_SIZE, KINDS, Importer, kind_from_filename
+
+
+class Command(BaseCommand):
+    help = ('Import users/students, courses, lessons and enrollments from CSV or JSON Lines files. '
+            'The kind of each file is taken from its name (students.csv, courses.jsonl, ...) '
+            'unless --kind is given. Re-importing a file updates existing rows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--kind', choices=KINDS, help='What the files contain (default: from file name).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes for password hashing (default: CPU count, 0 = no pool).')
+        parser.add_argument('--update-passwords', action='store_true',
+                            help='Also reset passwords of existing users from the file.')
+
+    def handle(self, *args, **options):
+        files = []
+        for path in options['files']:
+            kind = options['kind'] or kind_from_filename(path)
+            if kind not in KINDS:
+                raise CommandError(f"Cannot tell what {path} contains; name it after one of "
+                                   f"{', '.join(KINDS)} or pass --kind.")
+            files.append((KINDS.index(kind), path, kind))
+        # users before courses before lessons before enrollments, whatever the argument order
+        files.sort()
+
+        failed = False
+        with Importer(batch_size=options['batch_size'], workers=options['workers'],
+                      update_passwords=options['update_passwords']) as importer:
+            for _, path, kind in files:
+                started = time.monotonic()
+                report = importer.run_file(path, kind)
+                self.stdout.write(f"{path}: {report} in {time.monotonic() - started:.1f}s")
+                for line, message in report.errors[:50]:
+                    self.stderr.write(f"  line {line}: {message}")
+                if len(report.errors) > 50:
+                    self.stderr.write(f"  ... {len(report.errors) - 50} more errors")
+                failed = failed or bool(report.errors)
+        if failed:
+            raise CommandError('Some rows were not imported.')
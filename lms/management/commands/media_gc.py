@@ -0,0 +1,47 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from lms import mediagc
+
+
+class Command(BaseCommand):
+    help = ('Find unreferenced files, duplicates (suffixed copies made by the storage) and leftover '
+            'certificate PNGs under MEDIA_ROOT, and move them to MEDIA_QUARANTINE_ROOT or delete them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be collected.')
+        parser.add_argument('--delete', action='store_true', help='Delete the files instead of quarantining them.')
+        parser.add_argument('--quarantine', default=None,
+                            help='Directory to move the files to (default: MEDIA_QUARANTINE_ROOT/<timestamp>).')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Skip files modified less than this many seconds ago (default: 3600).')
+        parser.add_argument('--workers', type=int, default=None, help='Threads listing and hashing files.')
+
+    def handle(self, *args, **options):
+        if options['delete'] and options['quarantine']:
+            raise CommandError('--delete and --quarantine exclude each other.')
+        started = time.monotonic()
+        findings = mediagc.find(workers=options['workers'], min_age=options['min_age'])
+        verbose = options['dry_run'] or options['verbosity'] > 1
+        for finding in findings:
+            if verbose:
+                keep = f" (same as {finding.keep})" if finding.keep else ''
+                self.stdout.write(f"{finding.reason:<9} {finding.size:>10}  {finding.name}{keep}")
+        counts, sizes = Counter(), Counter()
+        for finding in findings:
+            counts[finding.reason] += 1
+            sizes[finding.reason] += finding.size
+        summary = ', '.join(f"{counts[r]} {r} ({sizes[r]} bytes)" for r in sorted(counts)) or 'nothing to collect'
+        self.stdout.write(f"found {summary} in {time.monotonic() - started:.1f}s")
+        if options['dry_run'] or not findings:
+            return
+
+        quarantine = None
+        if not options['delete']:
+            quarantine = options['quarantine'] or settings.MEDIA_QUARANTINE_ROOT / time.strftime('%Y%m%d-%H%M%S')
+        freed = mediagc.collect(findings, quarantine=quarantine)
+        where = f"moved to {quarantine}" if quarantine else 'deleted'
+        self.stdout.write(f"{len(findings)} files ({freed} bytes) {where}")
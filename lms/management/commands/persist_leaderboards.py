@@ -0,0 +1,31 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from lms.leaderboard import persist
+
+
+class Command(BaseCommand):
+    help = ('Store the course leaderboards rebuilt from the course grades and prune their change log, '
+            'every LEADERBOARD_PERSIST_SECONDS. Runs until interrupted unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Persist once and exit.')
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Seconds between runs (default: LEADERBOARD_PERSIST_SECONDS).')
+        parser.add_argument('--course', type=int, action='append', default=None,
+                            help='Only this course (may be repeated).')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or settings.LEADERBOARD_PERSIST_SECONDS
+        try:
+            while True:
+                started = time.monotonic()
+                count = persist(options['course'])
+                self.stdout.write(f"{count} leaderboards stored in {time.monotonic() - started:.1f}s")
+                if options['once']:
+                    return
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            return
@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from lms.routers import PRIMARY, replicas
+
+
+class Command(BaseCommand):
+    help = ('Copy the primary SQLite database to every replica alias (DATABASE_REPLICAS) '
+            'using the online backup API. Local stand-in for real replication.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running and re-sync every N seconds (default: sync once).')
+
+    def handle(self, *args, **options):
+        aliases = replicas()
+        if not aliases:
+            raise CommandError('No replicas configured (settings.DATABASE_REPLICAS is empty).')
+        source = connections[PRIMARY].settings_dict
+        if source['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('replicate_db only supports SQLite databases.')
+        while True:
+            for alias in aliases:
+                target = connections[alias].settings_dict
+                connections[alias].close()
+                started = time.monotonic()
+                src = sqlite3.connect(str(source['NAME']))
+                dst = sqlite3.connect(str(target['NAME']))
+                try:
+                    # consistent snapshot even while the primary is being written
+                    src.backup(dst, pages=1024)
+                finally:
+                    dst.close()
+                    src.close()
+                self.stdout.write(f"{alias}: synced in {time.monotonic() - started:.2f}s")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from lms.models import Lesson
+from lms.similarity import rescan
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the near-duplicate index (MinHash signatures, LSH buckets, similar pairs) '
+            'of whole lessons. Signatures are computed in a process pool.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lesson', type=int, action='append', default=[],
+                            help='Lesson id (repeatable; default: all lessons).')
+        parser.add_argument('--course', type=int, action='append', default=[], help='All lessons of this course.')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: CPU count, 0 = no pool).')
+
+    def handle(self, *args, **options):
+        lessons = Lesson.objects.order_by('id')
+        if options['lesson'] or options['course']:
+            lessons = lessons.filter(id__in=options['lesson']) | lessons.filter(course__in=options['course'])
+        started = time.monotonic()
+        total = 0
+        for lesson_id, pairs in rescan(list(lessons.values_list('id', flat=True)), workers=options['workers']):
+            total += pairs
+            if pairs:
+                self.stdout.write(f"lesson #{lesson_id}: {pairs} similar pairs")
+        self.stdout.write(f"{total} similar pairs in {time.monotonic() - started:.1f}s")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from lms.deletion import run_worker
+
+
+class Command(BaseCommand):
+    help = ('Delete courses and users queued for deletion (from the admin) in small batches, '
+            'with pauses so the site stays responsive. Runs until interrupted unless --once is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Rows per transaction (default: DELETION_BATCH_SIZE).')
+        parser.add_argument('--pause', type=float, default=None,
+                            help='Seconds between transactions (default: DELETION_PAUSE_SECONDS).')
+        parser.add_argument('--once', action='store_true', help='Exit when no job is left.')
+        parser.add_argument('--poll', type=float, default=10, help='Seconds between looks for new jobs (default: 10).')
+
+    def handle(self, *args, **options):
+        try:
+            total = run_worker(batch_size=options['batch_size'], pause=options['pause'], once=options['once'],
+                               poll=options['poll'], log=self.stdout.write)
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(f"{total} deletions finished")
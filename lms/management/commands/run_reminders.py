@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from lms.reminders import ReminderScheduler
+
+
+class Command(BaseCommand):
+    help = ('Send deadline reminders by email at DEADLINE_REMINDER_OFFSETS before each deadline. '
+            'Runs until interrupted; use --once from cron instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send what is due now and exit.')
+        parser.add_argument('--poll', type=float, default=30,
+                            help='Longest sleep between checks, in seconds (default: 30).')
+        parser.add_argument('--rate', type=float, default=None, help='Messages per second (default: REMINDER_RATE).')
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler(rate=options['rate'])
+        if options['once']:
+            now = timezone.now()
+            scheduler.load(now)
+            self.stdout.write(f"{scheduler.run_pending(now)} reminders sent")
+            return
+        self.stdout.write(f"Reminding at {', '.join(f'{o // 60} min' for o in scheduler.offsets)} before deadlines")
+        try:
+            scheduler.run_forever(poll=options['poll'])
+        except KeyboardInterrupt:
+            pass
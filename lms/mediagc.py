@@ -0,0 +1,186 @@
+"""Garbage collection of files under MEDIA_ROOT (`manage.py media_gc`).
+
+Finds files that nothing uses any more:
+
+- duplicate: same content as another file. Suffixed copies Django's storage made
+  when a name was taken (``certificate-1_ijzpmJV.pdf`` next to
+  ``certificate-1.pdf``) are removed and their references moved to the kept
+  file. Identical files that are both referenced under unrelated names are
+  left alone;
+- png: intermediate images of the raster certificate renderer;
+- orphan: not referenced by any FileField, by an Avatar (avatars/) or by an
+  unfinished UploadSession (uploads/tmp/).
+
+The tree is listed with os.scandir in a thread pool, one directory per task;
+only files whose size matches another file's are hashed. Files younger than
+`min_age` seconds are skipped, as they may belong to a request still running.
+"""
+import hashlib
+import os
+import re
+import shutil
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+
+DUPLICATE = 'duplicate'
+PNG = 'png'
+ORPHAN = 'orphan'
+
+# managed by code, never collected
+PROTECTED_PREFIXES = ('certificates/templates/',)
+# name_XXXXXXX.ext: the name Storage.get_alternative_name() picks when name.ext exists
+SUFFIXED_RE = re.compile(r'^(?P<root>.+)_[A-Za-z0-9]{7}(?P<ext>\.[^./]*)?$')
+AVATAR_RE = re.compile(r'^avatars/[0-9a-f]{2}/(?P<digest>[0-9a-f]{64})/')
+PART_RE = re.compile(r'^uploads/tmp/(?P<id>[0-9a-f-]{36})\.part$')
+HASH_BLOCK = 1024 * 1024
+
+
+# name is relative to MEDIA_ROOT with forward slashes; keep is set for duplicates: the file that stays
+Finding = namedtuple('Finding', 'name size reason keep', defaults=(None,))
+
+
+def _list_dir(path):
+    files, dirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+    return files, dirs
+
+
+def scan(root, pool):
+    """Yield (path, size, mtime) of every regular file under root, listing directories in parallel."""
+    pending = {pool.submit(_list_dir, root)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            files, dirs = future.result()
+            yield from files
+            pending |= {pool.submit(_list_dir, d) for d in dirs}
+
+
+def file_fields():
+    """[(model, field name)] of every FileField (and subclass) of the installed models."""
+    return [(model, field.name) for model in apps.get_models() for field in model._meta.concrete_fields
+            if isinstance(field, models.FileField)]
+
+
+def referenced_names():
+    names = set()
+    for model, field in file_fields():
+        names.update(model._default_manager.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                     .values_list(field, flat=True).iterator())
+    return names
+
+
+def _digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while block := f.read(HASH_BLOCK):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _is_copy_of(name, keep):
+    match = SUFFIXED_RE.match(name)
+    return bool(match) and match['root'] + (match['ext'] or '') == keep
+
+
+def find(root=None, workers=None, min_age=3600):
+    """List what can be collected; returns [Finding]. Changes nothing."""
+    from .models import Avatar, UploadSession
+
+    root = str(root or settings.MEDIA_ROOT)
+    if not os.path.isdir(root):
+        return []
+    cutoff = time.time() - min_age
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        files = {}
+        for path, size, mtime in scan(root, pool):
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            if mtime <= cutoff and not name.startswith(PROTECTED_PREFIXES):
+                files[name] = size
+
+        referenced = referenced_names()
+        avatars = set(Avatar.objects.values_list('digest', flat=True).iterator())
+        uploads = {str(pk) for pk in UploadSession.objects.filter(stored_file__isnull=True)
+                   .values_list('id', flat=True).iterator()}
+
+        def in_use(name):
+            if name in referenced:
+                return True
+            if match := AVATAR_RE.match(name):
+                return match['digest'] in avatars
+            if match := PART_RE.match(name):
+                return match['id'] in uploads
+            return False
+
+        by_size = defaultdict(list)
+        for name, size in files.items():
+            if not AVATAR_RE.match(name) and not PART_RE.match(name):
+                by_size[size].append(name)
+        candidates = [name for names in by_size.values() if len(names) > 1 for name in names]
+        by_digest = defaultdict(list)
+        for name, digest in zip(candidates, pool.map(_digest, [os.path.join(root, n) for n in candidates])):
+            by_digest[digest].append(name)
+
+    findings, handled = [], set()  # handled: removed as duplicates or kept for a referenced copy
+    for names in by_digest.values():
+        if len(names) < 2:
+            continue
+        used = {n for n in names if in_use(n)}
+        used |= {n for n in names if any(_is_copy_of(m, n) for m in used)}
+        # keep a referenced file, or the original a referenced copy was made from
+        names.sort(key=lambda n: (n not in used, bool(SUFFIXED_RE.match(n)), len(n), n))
+        keep = names[0]
+        for name in names[1:]:
+            if not in_use(name) or _is_copy_of(name, keep):
+                findings.append(Finding(name, files[name], DUPLICATE, keep))
+                handled.add(name)
+                if in_use(name):
+                    handled.add(keep)
+
+    for name, size in sorted(files.items()):
+        if name in handled or in_use(name):
+            continue
+        png = name.startswith('certificates/generated/') and name.endswith('.png')
+        findings.append(Finding(name, size, PNG if png else ORPHAN))
+    return findings
+
+
+def _repoint(old, new):
+    for model, field in file_fields():
+        model._default_manager.filter(**{field: old}).update(**{field: new})
+
+
+def collect(findings, root=None, quarantine=None):
+    """Remove the files found, or move them under `quarantine` keeping their paths; returns bytes freed.
+
+    References to a removed duplicate are first moved to the file that is kept.
+    """
+    root = str(root or settings.MEDIA_ROOT)
+    freed = 0
+    for finding in findings:
+        path = os.path.join(root, finding.name)
+        if finding.keep:
+            with transaction.atomic():
+                _repoint(finding.name, finding.keep)
+        try:
+            if quarantine:
+                target = os.path.join(str(quarantine), finding.name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            continue
+        freed += finding.size
+    return freed
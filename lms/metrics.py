@@ -0,0 +1,394 @@
+"""Request, database, cache and certificate metrics in the Prometheus text format.
+
+No client library and no Prometheus server are needed: GET /metrics returns
+plain text any scraper (or curl) can read.
+
+Counters and histograms live in per-thread shards: a thread only ever writes
+its own dicts, so recording takes no lock. When a thread exits its shard is
+folded into one process-level aggregate and dropped, so thread-per-request
+servers do not accumulate shards. snapshot() merges the aggregate and the
+shards of the live threads. With several worker processes each one writes its snapshot to
+METRICS_DIR/<pid>-<token>.json (atomically, at most every
+METRICS_FLUSH_SECONDS and on every scrape) and the process answering the
+scrape sums all files. Files of processes that have exited are folded into
+METRICS_DIR/retired.json and removed, so the counters neither go backwards
+when a worker is recycled nor leave a file per worker ever started (the
+processes must share one host; folding needs fcntl, i.e. POSIX). Without
+METRICS_DIR every process reports only its own numbers.
+
+Queue depths are gauges read from the database at scrape time.
+"""
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import re
+import secrets
+import threading
+import time
+import weakref
+from asyncio import iscoroutinefunction
+from collections import defaultdict
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+try:
+    import fcntl
+except ImportError:  # Windows: snapshots of exited processes are summed but not folded
+    fcntl = None
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help); only these are rendered
+METRICS = {
+    'lms_http_requests_total': ('counter', 'HTTP requests by view, method and status code.'),
+    'lms_http_request_duration_seconds': ('histogram', 'Time spent producing the response, by view.'),
+    'lms_db_queries_total': ('counter', 'Database queries by the view that issued them.'),
+    'lms_db_query_seconds_total': ('counter', 'Time spent in database queries, by view.'),
+    'lms_cache_requests_total': ('counter', 'In-process cache lookups by cache and result (hit/miss).'),
+    'lms_certificate_render_seconds': ('histogram', 'Time to render one certificate PDF, by renderer.'),
+    'lms_queue_depth': ('gauge', 'Items waiting in background queues.'),
+}
+
+SNAPSHOT_RE = re.compile(r'^(\d+)-[0-9a-f]+\.json$')
+RETIRED = 'retired.json'
+
+_shards = set()
+_shards_lock = threading.Lock()  # taken when a thread's shard is created or retired, and by snapshot()
+_token = secrets.token_hex(4)
+_last_flush = [0.0]
+# [view name] of the request being handled; a list so process_view can fill it in
+# even where the context was copied (sync_to_async threads of async views)
+_current_view = contextvars.ContextVar('lms_metrics_view', default=None)
+
+
+class _Shard:
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., count above, sum]
+
+    def add(self, other):
+        for key, value in other.counters.copy().items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, buckets in other.histograms.copy().items():
+            merged = self.histograms.setdefault(key, [0] * len(buckets))
+            for i, value in enumerate(list(buckets)):
+                merged[i] += value
+
+
+class _Owner:
+    """Lives only in the thread-local storage of one thread: collected when the thread exits."""
+
+
+_exited = _Shard()  # threads that have exited, guarded by _shards_lock
+_local = threading.local()
+
+
+def _retire(shard):
+    with _shards_lock:
+        if shard in _shards:
+            _shards.discard(shard)
+            _exited.add(shard)
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = _Shard()
+        _local.owner = owner = _Owner()
+        weakref.finalize(owner, _retire, shard).atexit = False
+        with _shards_lock:
+            _shards.add(shard)
+        return shard
+
+
+def _reset_after_fork():
+    # a forked worker starts from zero: the parent reports its own numbers
+    global _local, _token, _shards_lock
+    _shards_lock = threading.Lock()  # may have been held by another thread of the parent
+    _shards.clear()
+    _exited.counters.clear()
+    _exited.histograms.clear()
+    _local = threading.local()
+    _token = secrets.token_hex(4)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    counters = _shard().counters
+    key = _key(name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    histograms = _shard().histograms
+    key = _key(name, labels)
+    buckets = histograms.get(key)
+    if buckets is None:
+        buckets = histograms[key] = [0] * (len(BUCKETS) + 2)
+    buckets[bisect.bisect_left(BUCKETS, value)] += 1
+    buckets[-1] += value
+
+
+def snapshot():
+    """(counters, histograms) of this process, merged over its threads."""
+    total = _Shard()
+    with _shards_lock:
+        total.add(_exited)
+        shards = list(_shards)
+    for shard in shards:
+        total.add(shard)
+    return total.counters, total.histograms
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR (if set)."""
+    directory = _metrics_dir()
+    if not directory:
+        return
+    counters, histograms = snapshot()
+    data = {'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, list(labels), buckets] for (name, labels), buckets in histograms.items()]}
+    os.makedirs(directory, exist_ok=True)
+    _write(os.path.join(directory, f'{os.getpid()}-{_token}.json'), data)
+    _last_flush[0] = time.monotonic()
+
+
+def maybe_flush():
+    if _metrics_dir() and time.monotonic() - _last_flush[0] >= settings.METRICS_FLUSH_SECONDS:
+        flush()
+
+
+atexit.register(flush)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):  # removed or being replaced meanwhile
+        return None
+
+
+def _write(path, data):
+    with open(f'{path}.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _add(counters, histograms, data):
+    for name, labels, value in data['counters']:
+        counters[(name, tuple(map(tuple, labels)))] += value
+    for name, labels, buckets in data['histograms']:
+        merged = histograms.setdefault((name, tuple(map(tuple, labels))), [0] * len(buckets))
+        for i, value in enumerate(buckets):
+            merged[i] += value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _fold_exited(directory):
+    """Add the snapshots of exited processes to RETIRED and remove them.
+
+    RETIRED lists the files it already includes, so a crash between writing it
+    and removing them does not count them twice.
+    """
+    exited = [entry.name for entry in os.scandir(directory)
+              if (m := SNAPSHOT_RE.match(entry.name)) and not _alive(int(m.group(1)))]
+    if not exited or fcntl is None:
+        return
+    with open(os.path.join(directory, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        path = os.path.join(directory, RETIRED)
+        retired = _read(path) or {'counters': [], 'histograms': [], 'folded': []}
+        counters, histograms = defaultdict(float), {}
+        _add(counters, histograms, retired)
+        folded = set(retired['folded'])
+        new = [name for name in exited if name not in folded]
+        for name in new:
+            data = _read(os.path.join(directory, name))
+            if data is not None:
+                _add(counters, histograms, data)
+        if new:
+            present = set(os.listdir(directory))
+            _write(path, {'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+                          'histograms': [[name, list(labels), buckets]
+                                         for (name, labels), buckets in histograms.items()],
+                          'folded': sorted((folded & present) | set(new))})
+        for name in exited:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def collect():
+    """(counters, histograms) of all processes sharing METRICS_DIR, or of this one."""
+    directory = _metrics_dir()
+    if not directory:
+        return snapshot()
+    flush()
+    _fold_exited(directory)
+    counters, histograms = defaultdict(float), {}
+    retired = _read(os.path.join(directory, RETIRED))
+    folded = set()
+    if retired is not None:
+        _add(counters, histograms, retired)
+        folded = set(retired['folded'])
+    for entry in os.scandir(directory):
+        if SNAPSHOT_RE.match(entry.name) and entry.name not in folded:
+            data = _read(entry.path)
+            if data is not None:
+                _add(counters, histograms, data)
+    return dict(counters), histograms
+
+
+def queue_depths():
+    """[(labels, value)] for lms_queue_depth, read from the database."""
+    from django.db.models import Count
+    from .models import HomeworkSubmission, UploadSession
+
+    depths = {'autocheck_queued': 0, 'autocheck_running': 0}
+    for row in (HomeworkSubmission.objects.filter(check_status__in=[HomeworkSubmission.CHECK_QUEUED,
+                                                                      HomeworkSubmission.CHECK_RUNNING])
+                .values('check_status').annotate(n=Count('id')).order_by()):
+        depths[f"autocheck_{row['check_status']}"] = row['n']
+    depths['uploads_open'] = UploadSession.objects.filter(stored_file__isnull=True).count()
+    return [((('queue', queue),), value) for queue, value in sorted(depths.items())]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render():
+    """The Prometheus text exposition (format 0.0.4)."""
+    counters, histograms = collect()
+    series = defaultdict(list)
+    for (name, labels), value in counters.items():
+        series[name].append((labels, value))
+    for (name, labels), buckets in histograms.items():
+        series[name].append((labels, buckets))
+    series['lms_queue_depth'] = queue_depths()
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels, value in sorted(series.get(name, ())):
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {_number(cumulative)}')
+            cumulative += value[len(BUCKETS)]
+            lines.append(f'{name}_bucket{_labels(labels, [("le", "+Inf")])} {_number(cumulative)}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {_number(cumulative)}')
+    return '\n'.join(lines) + '\n'
+
+
+# -- Collection -----------------------------------------------------------------------
+
+def _count_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        holder = _current_view.get()
+        view = holder[0] if holder else '-'
+        inc('lms_db_queries_total', view=view)
+        inc('lms_db_query_seconds_total', time.perf_counter() - started, view=view)
+
+
+def _install(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(_install, dispatch_uid='lms.metrics.count_queries')
+
+
+class MetricsMiddleware:
+    """Count requests and time them per view; DB queries are attributed to the same view."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        holder = _current_view.get()
+        if holder is not None and request.resolver_match:
+            holder[0] = request.resolver_match.view_name
+
+    def _record(self, request, response, started):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unmatched>'
+        observe('lms_http_request_duration_seconds', time.perf_counter() - started, view=view)
+        inc('lms_http_requests_total', view=view, method=request.method, status=response.status_code)
+        maybe_flush()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current_view.set(['<unmatched>'])
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            self._record(request, response, started)
+            return response
+        finally:
+            _current_view.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_view.set(['<unmatched>'])
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            self._record(request, response, started)
+            return response
+        finally:
+            _current_view.reset(token)
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:00
+
+from django.db import migrations, models
+
+
+def remove_duplicate_submissions(apps, schema_editor):
+    """Keep one submission per (student, lesson) before adding the constraint.
+
+    The graded row wins over ungraded ones (the newest among graded rows with
+    the same grade); without a graded row the student's latest answer is kept.
+    Newest means highest id: submissions have no timestamp at this point.
+    Duplicates graded differently abort the migration with a list: a migration
+    must not pick a grade.
+    """
+    HomeworkSubmission = apps.get_model('lms', 'HomeworkSubmission')
+    dupes = (HomeworkSubmission.objects.values('student_id', 'lesson_id')
+             .annotate(n=models.Count('id')).filter(n__gt=1))
+    drop, conflicts = [], []
+    for row in dupes:
+        rows = list(HomeworkSubmission.objects
+                    .filter(student_id=row['student_id'], lesson_id=row['lesson_id'])
+                    .order_by('-id').values_list('id', 'is_graded', 'grade'))
+        graded = [r for r in rows if r[1]]
+        if len({grade for _, _, grade in graded}) > 1:
+            conflicts.append(f"student {row['student_id']}, lesson {row['lesson_id']}: "
+                             + ', '.join(f"#{pk} = {grade}" for pk, _, grade in graded))
+            continue
+        keep = (graded or rows)[0][0]  # rows are newest first
+        drop.extend(pk for pk, _, _ in rows if pk != keep)
+    if conflicts:
+        raise RuntimeError('Submissions graded more than once for the same student and lesson; keep one of '
+                           'each and migrate again:\n' + '\n'.join(conflicts))
+    for start in range(0, len(drop), 500):
+        HomeworkSubmission.objects.filter(id__in=drop[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0008_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deadline',
+            index=models.Index(fields=['lesson', 'due_at'], name='deadline_lesson_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='deadline',
+            index=models.Index(fields=['due_at'], name='deadline_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homeworksubmission',
+            index=models.Index(fields=['lesson', 'is_graded'], name='submission_lesson_graded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='homeworksubmission',
+            index=models.Index(fields=['student', 'is_graded'], name='submission_student_graded_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_submissions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='homeworksubmission',
+            constraint=models.UniqueConstraint(fields=('student', 'lesson'), name='unique_submission_per_student_lesson'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:16
+
+from django.db import migrations, models
+import lms.fields
+
+BATCH = 500
+
+
+def _preview(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= 200 else text[:199] + '…'
+
+
+def compress_existing(apps, schema_editor):
+    """Rewrite plain-text bodies through CompressedTextField and fill content_preview."""
+    for model_name, extra in (('Lesson', []), ('HomeworkSubmission', ['content_preview'])):
+        model = apps.get_model('lms', model_name)
+        batch = []
+        for obj in model.objects.only('id', 'content').iterator(chunk_size=BATCH):
+            if extra:
+                obj.content_preview = _preview(obj.content)
+            batch.append(obj)
+            if len(batch) >= BATCH:
+                model.objects.bulk_update(batch, ['content'] + extra)
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['content'] + extra)
+
+
+def decompress_existing(apps, schema_editor):
+    """Store bodies as plain text again so the column can go back to TEXT."""
+    for model_name in ('Lesson', 'HomeworkSubmission'):
+        model = apps.get_model('lms', model_name)
+        table = schema_editor.quote_name(model._meta.db_table)
+        rows = []
+        with schema_editor.connection.cursor() as cursor:
+            for obj in model.objects.only('id', 'content').iterator(chunk_size=BATCH):
+                rows.append((obj.content, obj.id))
+                if len(rows) >= BATCH:
+                    cursor.executemany(f'UPDATE {table} SET content = %s WHERE id = %s', rows)
+                    rows = []
+            if rows:
+                cursor.executemany(f'UPDATE {table} SET content = %s WHERE id = %s', rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homeworksubmission',
+            name='content_preview',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='homeworksubmission',
+            name='content',
+            field=lms.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='lesson',
+            name='content',
+            field=lms.fields.CompressedTextField(),
+        ),
+        migrations.RunPython(compress_existing, decompress_existing),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:19
+
+from django.db import migrations, models
+import lms.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0010_compressed_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='closed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedSubmission',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('student_id', models.IntegerField()),
+                ('course_id', models.IntegerField()),
+                ('course_title', models.CharField(max_length=200)),
+                ('lesson_id', models.IntegerField()),
+                ('lesson_title', models.CharField(max_length=200)),
+                ('content', lms.fields.CompressedTextField()),
+                ('attachment_id', models.IntegerField(blank=True, null=True)),
+                ('is_graded', models.BooleanField(default=False)),
+                ('grade', models.IntegerField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['student_id', 'course_id'], name='archived_sub_student_idx'), models.Index(fields=['lesson_id'], name='archived_sub_lesson_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedDeadline',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField(blank=True)),
+                ('due_at', models.DateTimeField()),
+                ('course_id', models.IntegerField()),
+                ('lesson_id', models.IntegerField()),
+                ('created_by_id', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['due_at'],
+                'indexes': [models.Index(fields=['course_id', 'due_at'], name='archived_deadline_course_idx')],
+            },
+        ),
+    ]
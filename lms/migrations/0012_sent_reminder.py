@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0011_course_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.PositiveIntegerField(help_text='Seconds before due_at')),
+                ('due_at', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('recipients', models.PositiveIntegerField(default=0)),
+                ('deadline', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_reminders', to='lms.deadline')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sentreminder',
+            constraint=models.UniqueConstraint(fields=('deadline', 'offset', 'due_at'), name='unique_reminder_per_offset'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0013_submission_similarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LessonChecker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('exact', 'Точный ответ'), ('regex', 'Регулярное выражение'), ('numeric', 'Число с допуском'), ('python', 'Тесты на Python')], max_length=10)),
+                ('expected', models.TextField(help_text='Ответ (по одному варианту в строке), шаблон, число или код с функциями test_*')),
+                ('tolerance', models.FloatField(default=0, help_text='Допустимое отклонение для числового ответа')),
+                ('points', models.PositiveIntegerField(default=100, help_text='Оценка за полностью верный ответ')),
+                ('time_limit', models.FloatField(default=5, help_text='Секунд на запуск тестов')),
+                ('memory_limit_mb', models.PositiveIntegerField(default=256)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='homeworksubmission',
+            name='check_feedback',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='homeworksubmission',
+            name='check_status',
+            field=models.CharField(blank=True, choices=[('queued', 'В очереди'), ('running', 'Проверяется'), ('done', 'Проверено'), ('error', 'Ошибка проверки')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='homeworksubmission',
+            name='provisional_grade',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='homeworksubmission',
+            index=models.Index(condition=models.Q(('check_status__in', ['queued', 'running'])), fields=['check_status', 'id'], name='submission_check_queue_idx'),
+        ),
+        migrations.AddField(
+            model_name='lessonchecker',
+            name='lesson',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='checker', to='lms.lesson'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0014_autocheck'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='bootstrap_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('lms', '0015_student_bootstrap_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='deleting_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('course', 'Курс'), ('user', 'Пользователь')], max_length=10)),
+                ('object_id', models.IntegerField()),
+                ('label', models.CharField(help_text='Title or username when deletion was requested', max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('total', models.PositiveIntegerField(default=0, help_text='Rows to delete, counted when requested')),
+                ('deleted', models.PositiveIntegerField(default=0)),
+                ('files_removed', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['finished_at', 'id'], name='deletion_job_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def fill_course_grades(apps, schema_editor):
+    """Course grades of the existing submissions (every lesson weighs 1 so far, archived ones included)."""
+    HomeworkSubmission = apps.get_model('lms', 'HomeworkSubmission')
+    ArchivedSubmission = apps.get_model('lms', 'ArchivedSubmission')
+    CourseGrade = apps.get_model('lms', 'CourseGrade')
+    totals = {}
+    for queryset, course in ((HomeworkSubmission.objects, 'lesson__course_id'), (ArchivedSubmission.objects, 'course_id')):
+        rows = (queryset.filter(is_graded=True, grade__isnull=False).values_list('student_id', course)
+                .annotate(total=Sum('grade'), n=Count('id')).order_by())
+        for student_id, course_id, total, n in rows:
+            old_total, old_n = totals.get((student_id, course_id), (0, 0))
+            totals[student_id, course_id] = (old_total + total, old_n + n)
+    CourseGrade.objects.bulk_create(
+        [CourseGrade(student_id=student_id, course_id=course_id, weighted_sum=total, weight_total=n,
+                     graded_count=n, final_grade=total / n)
+         for (student_id, course_id), (total, n) in totals.items()], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0016_background_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='weight',
+            field=models.PositiveSmallIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='CourseGrade',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weighted_sum', models.BigIntegerField(default=0)),
+                ('weight_total', models.IntegerField(default=0)),
+                ('graded_count', models.IntegerField(default=0)),
+                ('final_grade', models.FloatField(blank=True, null=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_grades', to='lms.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='course_grades', to='lms.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['course', 'final_grade'], name='course_grade_rank_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='coursegrade',
+            constraint=models.UniqueConstraint(fields=('student', 'course'), name='unique_course_grade'),
+        ),
+        migrations.RunPython(fill_course_grades, migrations.RunPython.noop),
+    ]
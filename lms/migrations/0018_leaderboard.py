@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0017_course_grades'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Leaderboard',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='leaderboard', serialize=False, to='lms.course')),
+                ('counts', models.JSONField(default=dict)),
+                ('last_change_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LeaderboardChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('old_grade', models.FloatField(null=True)),
+                ('new_grade', models.FloatField(null=True)),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='coursegrade',
+            name='course_grade_rank_idx',
+        ),
+        migrations.AddIndex(
+            model_name='coursegrade',
+            index=models.Index(fields=['course', 'final_grade', 'student'], name='course_grade_rank_idx'),
+        ),
+        migrations.AddField(
+            model_name='leaderboardchange',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.course'),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardchange',
+            index=models.Index(fields=['course', 'id'], name='leaderboard_change_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.30 on 2026-10-19 07:54
+
+import os
+
+from django.db import migrations, models
+
+
+def fill_attachment_names(apps, schema_editor):
+    """Name existing attachments after their owner's own upload, never after another user's."""
+    Lesson = apps.get_model('lms', 'Lesson')
+    HomeworkSubmission = apps.get_model('lms', 'HomeworkSubmission')
+    UploadSession = apps.get_model('lms', 'UploadSession')
+
+    def neutral(stored):
+        return f"file-{stored.sha256[:8]}{os.path.splitext(stored.original_name)[1]}"
+
+    # lesson materials: the course's teacher's upload if there is one
+    lessons = (Lesson.objects.filter(attachment__isnull=False).select_related('attachment', 'course')
+               .only('id', 'attachment__sha256', 'attachment__original_name', 'course__teacher'))
+    batch = []
+    for lesson in lessons.iterator(chunk_size=500):
+        own = (UploadSession.objects.filter(user_id=lesson.course.teacher_id, stored_file_id=lesson.attachment_id)
+               .values_list('filename', flat=True).first())
+        lesson.attachment_name = own or neutral(lesson.attachment)
+        batch.append(lesson)
+        if len(batch) >= 500:
+            Lesson.objects.bulk_update(batch, ['attachment_name'])
+            batch = []
+    Lesson.objects.bulk_update(batch, ['attachment_name'])
+
+    submissions = HomeworkSubmission.objects.filter(attachment__isnull=False).select_related('attachment', 'student')
+    batch = []
+    for sub in submissions.only('id', 'attachment__sha256', 'attachment__original_name', 'student__user').iterator(chunk_size=500):
+        own = (UploadSession.objects.filter(user_id=sub.student.user_id, stored_file_id=sub.attachment_id)
+               .values_list('filename', flat=True).first())
+        sub.attachment_name = own or neutral(sub.attachment)
+        batch.append(sub)
+        if len(batch) >= 500:
+            HomeworkSubmission.objects.bulk_update(batch, ['attachment_name'])
+            batch = []
+    HomeworkSubmission.objects.bulk_update(batch, ['attachment_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0018_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedsubmission',
+            name='attachment_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='homeworksubmission',
+            name='attachment_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='attachment_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.RunPython(fill_attachment_names, migrations.RunPython.noop),
+    ]
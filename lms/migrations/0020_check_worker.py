@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0019_attachment_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='homeworksubmission',
+            name='check_worker',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+    ]
@@ -0,0 +1,82 @@
+"""MinHash signatures and LSH band keys for near-duplicate text detection.
+
+Pure functions without Django imports, so process-pool workers can use them
+without setting Django up.
+
+- shingles: the set of character k-grams of the normalized text;
+- signature: one-permutation MinHash. Every shingle is hashed once; the hash
+  picks one of `num_perm` bins and the bin keeps its smallest value. Empty bins
+  borrow the value of the next filled bin (densification). The share of equal
+  positions in two signatures estimates the Jaccard similarity of the shingle
+  sets, at the cost of one hash per shingle instead of `num_perm`;
+- band_keys: the signature cut into `bands` bands of `rows` values, each band
+  hashed (with its number) to one key. Two texts land in the same bucket of some
+  band with probability 1 - (1 - s**rows)**bands, so only those are compared.
+"""
+import hashlib
+import re
+import zlib
+from array import array
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+# fixed so that signatures computed by different processes are comparable
+_A, _B = 0x1F0B2C8A6D3E5F41 % MERSENNE_PRIME, 0x5DEECE66D2B7A3C1 % MERSENNE_PRIME
+_DENSIFY_STEP = 0x9E3779B1
+
+_non_word = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(text):
+    return ' '.join(_non_word.sub(' ', (text or '').lower()).split())
+
+
+def shingles(text, size=5):
+    text = normalize(text)
+    if len(text) < size:
+        return set()
+    return {zlib.crc32(text[i:i + size].encode('utf-8')) for i in range(len(text) - size + 1)}
+
+
+def signature(text, num_perm=64, shingle_size=5, min_length=50):
+    """MinHash signature as bytes (num_perm unsigned 32-bit values), or None for short texts."""
+    if len(normalize(text)) < min_length:
+        return None
+    bins = [None] * num_perm
+    for h in shingles(text, shingle_size):
+        x = (_A * h + _B) % MERSENNE_PRIME
+        i = x % num_perm
+        value = (x // num_perm) & MAX_HASH
+        if bins[i] is None or value < bins[i]:
+            bins[i] = value
+    filled = [i for i, value in enumerate(bins) if value is not None]
+    for i, value in enumerate(bins):
+        if value is None:
+            # nearest filled bin to the right (wrapping around), shifted by the distance
+            j = next((k for k in filled if k > i), filled[0])
+            bins[i] = (bins[j] + ((j - i) % num_perm) * _DENSIFY_STEP) & MAX_HASH
+    return array('I', bins).tobytes()
+
+
+def _values(sig):
+    values = array('I')
+    values.frombytes(bytes(sig))
+    return values
+
+
+def band_keys(sig, bands=16, rows=4):
+    """[(band, key)] with key a signed 64-bit int (fits a BigIntegerField)."""
+    values = _values(sig)
+    keys = []
+    for band in range(bands):
+        chunk = values[band * rows:(band + 1) * rows].tobytes()
+        # the band number is part of the key, so one index on key serves all bands
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest()
+        keys.append((band, int.from_bytes(digest, 'big', signed=True)))
+    return keys
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the texts behind two signatures."""
+    a, b = _values(sig_a), _values(sig_b)
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
@@ -1,44 +1,247 @@
 from django.db import models
 from django.contrib.auth.models import User
 import uuid
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 import os
+from .fields import CompressedTextField
+
+PREVIEW_LENGTH = 200
+
+
+def make_preview(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 1] + '…'
+
+class VisibleCourseManager(models.Manager):
+    """Courses not waiting for deletion (the default manager, so related managers hide them too)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleting_at__isnull=True)
 
 class Course(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField()
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='teaching_courses')
     students = models.ManyToManyField('Student', blank=True, related_name='enrolled_courses')
+    # set when the course is over; closed courses are archived later (see lms.archive)
+    closed_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # set when deletion was requested; the rows are removed in batches by lms.deletion
+    deleting_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = VisibleCourseManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.title
 
+    @property
+    def is_archived(self):
+        return self.archived_at is not None
+
 class Lesson(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='lessons')
     title = models.CharField(max_length=200)
-    content = models.TextField()
+    content = CompressedTextField()
+    attachment = models.ForeignKey('StoredFile', null=True, blank=True, on_delete=models.SET_NULL, related_name='lessons')
+    # the name the file was uploaded under here (StoredFile is shared by everyone who uploads the same bytes)
+    attachment_name = models.CharField(max_length=255, blank=True)
+    # share of the lesson's grade in the course grade (lms.coursegrades); 0 leaves it out
+    weight = models.PositiveSmallIntegerField(default=1)
 
     def __str__(self):
         return f"{self.title} ({self.course.title})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'weight' in field_names:
+            instance._stored_weight = instance.weight  # a changed weight recomputes the course grades
+        return instance
+
 class Student(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='student_profile')
     courses = models.ManyToManyField(Course, blank=True, related_name='students_set')
+    # bumped whenever the data of /api/me/bootstrap/ changes (lms.bootstrap)
+    bootstrap_version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.user.get_full_name() or self.user.username
 
+class LessonChecker(models.Model):
+    """Automatic check of a lesson's answers; runs in the lms.autocheck worker pool."""
+    KIND_CHOICES = (
+        ('exact', 'Точный ответ'),
+        ('regex', 'Регулярное выражение'),
+        ('numeric', 'Число с допуском'),
+        ('python', 'Тесты на Python'),
+    )
+    lesson = models.OneToOneField(Lesson, on_delete=models.CASCADE, related_name='checker')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    expected = models.TextField(help_text='Ответ (по одному варианту в строке), шаблон, число или код с функциями test_*')
+    tolerance = models.FloatField(default=0, help_text='Допустимое отклонение для числового ответа')
+    points = models.PositiveIntegerField(default=100, help_text='Оценка за полностью верный ответ')
+    time_limit = models.FloatField(default=5, help_text='Секунд на запуск тестов')
+    memory_limit_mb = models.PositiveIntegerField(default=256)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} check for {self.lesson}"
+
+    def as_spec(self):
+        """Plain data for lms.checkers (sent to worker processes)."""
+        return {f: getattr(self, f) for f in ('kind', 'expected', 'tolerance', 'points', 'time_limit', 'memory_limit_mb')}
+
+class SubmissionQuerySet(models.QuerySet):
+    """Fills content_preview on the bulk paths too (save() does it for single rows)."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.content_preview = make_preview(obj.content)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if 'content' in fields:
+            objs = list(objs)
+            for obj in objs:
+                obj.content_preview = make_preview(obj.content)
+            fields = [*fields, 'content_preview']
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
 class HomeworkSubmission(models.Model):
+    CHECK_QUEUED = 'queued'
+    CHECK_RUNNING = 'running'
+    CHECK_DONE = 'done'
+    CHECK_ERROR = 'error'
+    CHECK_STATUS_CHOICES = (
+        (CHECK_QUEUED, 'В очереди'),
+        (CHECK_RUNNING, 'Проверяется'),
+        (CHECK_DONE, 'Проверено'),
+        (CHECK_ERROR, 'Ошибка проверки'),
+    )
+
     lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='submissions')
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='submissions')
-    content = models.TextField()
+    content = CompressedTextField()
+    # first characters of content, so lists can defer() the (compressed) body
+    content_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True, editable=False)
+    attachment = models.ForeignKey('StoredFile', null=True, blank=True, on_delete=models.SET_NULL, related_name='submissions')
+    attachment_name = models.CharField(max_length=255, blank=True)
     is_graded = models.BooleanField(default=False)
     grade = models.IntegerField(null=True, blank=True)
+    # automatic check (lms.autocheck); the grade becomes final when the teacher confirms it
+    check_status = models.CharField(max_length=10, choices=CHECK_STATUS_CHOICES, blank=True, default='')
+    provisional_grade = models.IntegerField(null=True, blank=True)
+    check_feedback = models.CharField(max_length=500, blank=True)
+    # "<host>:<pid>:<token>" of the worker that claimed the row for checking
+    check_worker = models.CharField(max_length=100, blank=True, default='')
+
+    objects = SubmissionQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # one submission per student and lesson; also serves (student, lesson) lookups
+            models.UniqueConstraint(fields=['student', 'lesson'], name='unique_submission_per_student_lesson'),
+        ]
+        indexes = [
+            models.Index(fields=['lesson', 'is_graded'], name='submission_lesson_graded_idx'),
+            models.Index(fields=['student', 'is_graded'], name='submission_student_graded_idx'),
+            # the check queue: small, since only pending rows are indexed
+            models.Index(fields=['check_status', 'id'], name='submission_check_queue_idx',
+                         condition=models.Q(check_status__in=['queued', 'running'])),
+        ]
 
     def __str__(self):
         return f"Submission by {self.student} for {self.lesson}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'is_graded' in field_names and 'grade' in field_names:
+            # the grade as stored: saves move CourseGrade by the difference (lms.coursegrades)
+            instance._stored_grade = (instance.is_graded, instance.grade)
+        return instance
+
+    def save(self, *args, **kwargs):
+        if 'content' in self.__dict__:  # not deferred
+            self.content_preview = make_preview(self.content)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'content' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'content_preview'}
+        super().save(*args, **kwargs)
+
+class SubmissionFingerprint(models.Model):
+    """MinHash signature of a submission's text (see lms.similarity)."""
+    submission = models.OneToOneField(HomeworkSubmission, primary_key=True, on_delete=models.CASCADE,
+                                      related_name='fingerprint')
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='+')
+    digest = models.CharField(max_length=64)  # sha256 of the normalized text, skips unchanged re-saves
+    signature = models.BinaryField()
+
+    def __str__(self):
+        return f"Fingerprint of submission {self.submission_id}"
+
+class SubmissionBucket(models.Model):
+    """LSH bucket membership: one row per submission and signature band."""
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='+')
+    band = models.PositiveSmallIntegerField()
+    key = models.BigIntegerField()  # hash of the band number and its signature values
+    submission = models.ForeignKey(HomeworkSubmission, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [models.Index(fields=['lesson', 'key'], name='submission_bucket_idx')]
+
+class SimilarPair(models.Model):
+    """Two submissions of a lesson whose texts are nearly the same (first.id < second.id)."""
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name='similar_pairs')
+    first = models.ForeignKey(HomeworkSubmission, on_delete=models.CASCADE, related_name='+')
+    second = models.ForeignKey(HomeworkSubmission, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['-score']
+        constraints = [models.UniqueConstraint(fields=['first', 'second'], name='unique_similar_pair')]
+
+    def __str__(self):
+        return f"{self.first_id} ~ {self.second_id} ({self.score:.0%})"
+
+class StoredFile(models.Model):
+    """Uploaded file stored once per content hash (see lms.uploads)."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='uploads/', max_length=255)
+    size = models.BigIntegerField()
+    original_name = models.CharField(max_length=255)  # of the first upload; pages show attachment_name
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.original_name} ({self.sha256[:12]})"
+
+class UploadSession(models.Model):
+    """State of a chunked, resumable upload: bytes received so far and the result."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    stored_file = models.ForeignKey(StoredFile, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def is_complete(self):
+        return self.stored_file_id is not None
+
+    def __str__(self):
+        return f"Upload {self.filename} ({self.offset}/{self.size})"
+
+class VisibleDeadlineManager(models.Manager):
+    """Deadlines not belonging to a course waiting for deletion (calendars, APIs, reminders)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            models.Q(lesson__isnull=True) | models.Q(lesson__course__deleting_at__isnull=True))
+
 class Deadline(models.Model):
     """Represents a deadline that may be attached to a lesson (optional)."""
     title = models.CharField(max_length=200)
@@ -49,13 +252,88 @@ class Deadline(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = VisibleDeadlineManager()
+    all_objects = models.Manager()
+
     class Meta:
         ordering = ['due_at']
+        indexes = [
+            models.Index(fields=['lesson', 'due_at'], name='deadline_lesson_due_idx'),
+            models.Index(fields=['due_at'], name='deadline_due_idx'),
+        ]
 
     def __str__(self):
         target = f" for {self.lesson}" if self.lesson else ""
         return f"{self.title}{target} - due {self.due_at.isoformat()}"
 
+class SentReminder(models.Model):
+    """A deadline reminder that went out (or is being sent), one per deadline and offset.
+
+    The unique constraint is what keeps two scheduler processes, or a restarted
+    one, from reminding the same students twice (see lms.reminders).
+    """
+    deadline = models.ForeignKey(Deadline, on_delete=models.CASCADE, related_name='sent_reminders')
+    offset = models.PositiveIntegerField(help_text='Seconds before due_at')
+    due_at = models.DateTimeField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+    recipients = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['deadline', 'offset', 'due_at'], name='unique_reminder_per_offset'),
+        ]
+
+    def __str__(self):
+        return f"Reminder {self.offset}s before {self.deadline_id} ({self.recipients} recipients)"
+
+class ArchivedSubmission(models.Model):
+    """HomeworkSubmission of an archived course (moved here by lms.archive).
+
+    Keeps the id of the original row and plain ids instead of foreign keys, so
+    the table can live in a separate database (settings.ARCHIVE_DATABASE).
+    Course and lesson titles are copied for the read-only grade pages.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    student_id = models.IntegerField()
+    course_id = models.IntegerField()
+    course_title = models.CharField(max_length=200)
+    lesson_id = models.IntegerField()
+    lesson_title = models.CharField(max_length=200)
+    content = CompressedTextField()
+    attachment_id = models.IntegerField(null=True, blank=True)
+    attachment_name = models.CharField(max_length=255, blank=True)
+    is_graded = models.BooleanField(default=False)
+    grade = models.IntegerField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['student_id', 'course_id'], name='archived_sub_student_idx'),
+            models.Index(fields=['lesson_id'], name='archived_sub_lesson_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived submission {self.id} for {self.lesson_title} ({self.course_title})"
+
+class ArchivedDeadline(models.Model):
+    """Deadline of an archived course; same layout rules as ArchivedSubmission."""
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    due_at = models.DateTimeField()
+    course_id = models.IntegerField()
+    lesson_id = models.IntegerField()
+    created_by_id = models.IntegerField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['due_at']
+        indexes = [models.Index(fields=['course_id', 'due_at'], name='archived_deadline_course_idx')]
+
+    def __str__(self):
+        return f"Archived deadline {self.title} - due {self.due_at.isoformat()}"
+
 class Certificate(models.Model):
     """Certificate issued to a student for a course.
 
@@ -75,26 +353,24 @@ class Certificate(models.Model):
         return f"Certificate {self.certificate_id} for {self.student} - {self.course.title}"
 
     def generate_certificate_files(self):
-        """Generate a PNG with text overlay and a PDF containing this image.
+        """Render the PDF (lms.certificates, settings.CERTIFICATE_RENDERER) and attach it.
 
-        Try to use ReportLab for PDF creation; if it's not available, fall back to
-        Pillow's PDF saving. Save PDF into media/certificates/ (in 'generated' subfolder).
+        Save PDF into media/certificates/ (in 'generated' subfolder).
         If the PDF already exists, skip regeneration.
         """
         from django.conf import settings
-        from django.core.files import File as DjangoFile
-        from PIL import Image, ImageDraw, ImageFont
-        from django.utils import timezone
+        from . import certificates
 
-        template_path = os.path.join(settings.MEDIA_ROOT, 'certificates', 'templates', 'background.png')
-        if not os.path.exists(template_path):
+        if not os.path.exists(certificates.template_path()):
             return
 
         out_dir = os.path.join(settings.MEDIA_ROOT, 'certificates', 'generated')
         os.makedirs(out_dir, exist_ok=True)
 
-        pdf_filename = f"certificate-{self.id}.pdf"
-        pdf_path = os.path.join(out_dir, pdf_filename)
+        # The file is written under its final name and the field just points at it:
+        # going through pdf_file.save() would make the storage add a suffixed copy.
+        pdf_name = certificates.pdf_name(self)
+        pdf_path = os.path.join(settings.MEDIA_ROOT, pdf_name)
 
         # If PDF already exists on disk and field points to it, skip generation
         if self.pdf_file and self.pdf_file.name:
@@ -103,86 +379,161 @@ class Certificate(models.Model):
                     return
             except Exception:
                 pass
-        if os.path.exists(pdf_path):
-            # Attach existing file to model if not attached
-            if not (self.pdf_file and self.pdf_file.name):
-                with open(pdf_path, 'rb') as f:
-                    self.pdf_file.save(pdf_filename, DjangoFile(f), save=True)
+        if not os.path.exists(pdf_path) and not certificates.write_pdf(pdf_path, self):
             return
 
-        # Open base image and draw
-        img = Image.open(template_path).convert('RGBA')
-        draw = ImageDraw.Draw(img)
-        w, h = img.size
-
-        student_name = self.student.user.get_full_name() or self.student.user.username
-        course_title = self.course.title
-        teacher_name = self.course.teacher.get_full_name() or self.course.teacher.username
-        date_str = (self.issued_at or timezone.now()).strftime('%d.%m.%Y')
-        id_str = str(self.certificate_id)
-
-        try:
-            font_large = ImageFont.truetype('arial.ttf', size=int(w*0.045))
-            font_medium = ImageFont.truetype('arial.ttf', size=int(w*0.03))
-            font_small = ImageFont.truetype('arial.ttf', size=int(w*0.018))
-        except Exception:
-            font_large = ImageFont.load_default()
-            font_medium = ImageFont.load_default()
-            font_small = ImageFont.load_default()
-
-        def draw_centered(text, y_frac, font, fill=(0,0,0)):
-            try:
-                bbox = draw.textbbox((0, 0), text, font=font)
-                text_w = bbox[2] - bbox[0]
-                text_h = bbox[3] - bbox[1]
-            except Exception:
-                # fallback for older/newer Pillow versions
-                try:
-                    text_w, text_h = font.getsize(text)
-                except Exception:
-                    text_w, text_h = (0, 0)
-            x = (w - text_w) / 2
-            y = int(h * y_frac) - text_h/2
-            draw.text((x, y), text, font=font, fill=fill)
-
-        draw_centered(student_name, 0.36, font_large)
-        draw_centered(course_title, 0.48, font_medium)
-        draw_centered(f"Instructor: {teacher_name}", 0.78, font_small)
-        draw.text((int(w*0.06), int(h*0.9)), f"Certificate ID: {id_str}", font=font_small, fill=(0,0,0))
-        draw.text((int(w*0.76), int(h*0.9)), f"Date: {date_str}", font=font_small, fill=(0,0,0))
-
-        img_filename = f"certificate-{self.id}.png"
-        img_path = os.path.join(out_dir, img_filename)
-        img.convert('RGB').save(img_path, 'PNG')
-
-        # Try ReportLab first
-        try:
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.utils import ImageReader
-            c = canvas.Canvas(pdf_path, pagesize=(w, h))
-            c.drawImage(ImageReader(img_path), 0, 0, width=w, height=h)
-            c.showPage()
-            c.save()
-        except Exception:
-            # Fallback: Pillow's PDF save
-            try:
-                img_rgb = Image.open(img_path).convert('RGB')
-                img_rgb.save(pdf_path, 'PDF', resolution=100.0)
-            except Exception:
-                # If PDF generation fails, clean up and exit
-                try:
-                    if os.path.exists(img_path):
-                        os.remove(img_path)
-                except Exception:
-                    pass
-                return
-
         # Attach PDF to model
-        try:
-            with open(pdf_path, 'rb') as f:
-                self.pdf_file.save(pdf_filename, DjangoFile(f), save=True)
-        except Exception:
-            return
+        self.pdf_file.name = pdf_name
+        self.save(update_fields=['pdf_file'])
+
+
+class CourseGrade(models.Model):
+    """Weighted grade of a student in a course, maintained by lms.coursegrades.
+
+    weighted_sum and weight_total add up grade × Lesson.weight and the weight
+    over the student's graded submissions of the course (archived ones
+    included); final_grade is their ratio, None while nothing is graded.
+    """
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='course_grades')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='course_grades')
+    weighted_sum = models.BigIntegerField(default=0)
+    weight_total = models.IntegerField(default=0)
+    graded_count = models.IntegerField(default=0)
+    final_grade = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'course'], name='unique_course_grade'),
+        ]
+        indexes = [
+            # a course's students ordered by grade (the leaderboard's top N, ties by student)
+            models.Index(fields=['course', 'final_grade', 'student'], name='course_grade_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.student} in {self.course}: {self.final_grade}"
+
+
+class Leaderboard(models.Model):
+    """Stored ranking of a course (lms.leaderboard): students per course grade bucket.
+
+    Includes every LeaderboardChange up to last_change_id; later ones are
+    applied on top when the ranking is loaded.
+    """
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='leaderboard')
+    counts = models.JSONField(default=dict)  # {bucket: number of students}, non-empty buckets only
+    last_change_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Leaderboard of {self.course}"
+
+
+class LeaderboardChange(models.Model):
+    """A course grade that moved (None: not ranked), logged by lms.coursegrades for lms.leaderboard."""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    old_grade = models.FloatField(null=True)
+    new_grade = models.FloatField(null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['course', 'id'], name='leaderboard_change_idx')]
+
+
+class DeletionJob(models.Model):
+    """A course or user being deleted in the background (lms.deletion, `manage.py run_deletions`)."""
+    COURSE = 'course'
+    USER = 'user'
+    KIND_CHOICES = ((COURSE, 'Курс'), (USER, 'Пользователь'))
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.IntegerField()
+    label = models.CharField(max_length=200, help_text='Title or username when deletion was requested')
+    requested_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    total = models.PositiveIntegerField(default=0, help_text='Rows to delete, counted when requested')
+    deleted = models.PositiveIntegerField(default=0)
+    files_removed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['finished_at', 'id'], name='deletion_job_pending_idx')]
+
+    def __str__(self):
+        return f"Deletion of {self.get_kind_display().lower()} {self.label}"
+
+    @property
+    def progress(self):
+        if self.finished_at:
+            return 100
+        return min(99, 100 * self.deleted // self.total) if self.total else 0
+
+
+class Avatar(models.Model):
+    """Locally stored avatar of a user (identicon or uploaded image).
+
+    digest is the SHA-256 of the source image; rendered sizes live under
+    media/avatars/<digest[:2]>/<digest>/ (see lms.avatars).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='avatar')
+    digest = models.CharField(max_length=64, db_index=True)
+    uploaded = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Avatar {self.digest[:12]} for {self.user}"
+
+
+def issue_certificates(course, student_ids):
+    """Issue missing certificates to those of the students who have a graded
+    submission for every lesson of the course (set-based version of
+    create_certificate_on_course_complete, for bulk grading)."""
+    lesson_count = course.lessons.count()
+    if not lesson_count:
+        return []
+    completed = (HomeworkSubmission.objects.filter(lesson__course=course, is_graded=True, student_id__in=student_ids)
+                 .values('student_id').annotate(done=models.Count('lesson_id', distinct=True))
+                 .filter(done=lesson_count).values_list('student_id', flat=True))
+    have = set(Certificate.objects.filter(course=course, student_id__in=student_ids).values_list('student_id', flat=True))
+    issued = []
+    for student_id in completed:
+        if student_id in have:
+            continue
+        cert, created = Certificate.objects.get_or_create(student_id=student_id, course=course)
+        if created:
+            cert.generate_certificate_files()
+            issued.append(cert)
+    return issued
+
+
+@receiver(post_save, sender=Avatar)
+def cache_avatar_digest(sender, instance, **kwargs):
+    from . import avatars
+    avatars.avatar_changed(instance)
+
+
+@receiver(post_delete, sender=Avatar)
+def forget_avatar_digest(sender, instance, **kwargs):
+    from . import avatars
+    avatars.avatar_changed(instance, deleted=True)
+
+
+@receiver(post_save, sender=HomeworkSubmission)
+def index_submission_text(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the near-duplicate index current when a submission's text is saved."""
+    if raw or 'content' not in instance.__dict__:
+        return
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    from . import similarity
+    similarity.index_submission(instance)
+
+
+@receiver([post_save, post_delete], sender=Deadline)
+def reschedule_deadline_reminders(sender, instance, **kwargs):
+    from . import reminders
+    reminders.deadline_changed(instance, deleted=kwargs['signal'] is post_delete)
 
 
 @receiver(post_save, sender=HomeworkSubmission)
@@ -213,3 +564,77 @@ def create_certificate_on_course_complete(sender, instance, **kwargs):
     if created:
         # generate image and PDF and attach to the record
         cert.generate_certificate_files()
+
+
+# -- /api/me/bootstrap/ versions (lms.bootstrap) ----------------------------------------------
+
+@receiver([post_save, post_delete], sender=HomeworkSubmission)
+@receiver([post_save, post_delete], sender=Certificate)
+def bump_bootstrap_of_student(sender, instance, **kwargs):
+    from . import bootstrap
+    bootstrap.bump([instance.student_id])
+
+
+@receiver(post_save, sender=Course)
+@receiver(pre_delete, sender=Course)
+@receiver(post_save, sender=Lesson)
+@receiver(pre_delete, sender=Lesson)
+def bump_bootstrap_of_course(sender, instance, **kwargs):
+    # before a delete: the enrollments are deleted with the course
+    from . import bootstrap
+    bootstrap.bump_courses([instance.id if sender is Course else instance.course_id])
+
+
+@receiver(pre_save, sender=Deadline)
+def bump_bootstrap_of_moved_deadline(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    old = Deadline.objects.filter(pk=instance.pk).values_list('lesson_id', flat=True)
+    if old and old[0] != instance.lesson_id:
+        from . import bootstrap
+        bootstrap.bump_lesson(old[0])
+
+
+@receiver([post_save, post_delete], sender=Deadline)
+def bump_bootstrap_of_deadline(sender, instance, **kwargs):
+    from . import bootstrap
+    bootstrap.bump_lesson(instance.lesson_id)
+
+
+@receiver(m2m_changed, sender=Student.courses.through)
+def bump_bootstrap_of_enrollment(sender, instance, action, reverse, pk_set, **kwargs):
+    from . import bootstrap
+    if not reverse:  # student.courses.add(...)
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bootstrap.bump([instance.id])
+    elif action in ('post_add', 'post_remove'):  # course.students_set.add(...)
+        bootstrap.bump(pk_set)
+    elif action == 'pre_clear':
+        bootstrap.bump(instance.students_set.values_list('id', flat=True))
+
+
+# -- Course grades (lms.coursegrades) -----------------------------------------------------------
+
+@receiver(post_save, sender=HomeworkSubmission)
+def update_course_grade(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not {'grade', 'is_graded'} & set(update_fields)):
+        return
+    from . import coursegrades
+    coursegrades.submission_saved(instance, created)
+
+
+@receiver(pre_delete, sender=HomeworkSubmission)
+def withdraw_course_grade(sender, instance, **kwargs):
+    # before the delete: a lesson deleted along with the submission can still be read
+    from . import coursegrades
+    coursegrades.submission_deleted(instance)
+
+
+@receiver(post_save, sender=Lesson)
+def reweigh_course_grades(sender, instance, created, raw=False, **kwargs):
+    stored = getattr(instance, '_stored_weight', None)
+    if raw or created or stored is None or stored == instance.weight:
+        return
+    from . import coursegrades
+    coursegrades.recompute(course_ids=[instance.course_id])
+    instance._stored_weight = instance.weight
@@ -0,0 +1,254 @@
+"""Deadline reminders by email.
+
+ReminderScheduler keeps a min-heap of (fire_at, deadline id, offset, due_at)
+where fire_at = due_at - offset for every offset in
+settings.DEADLINE_REMINDER_OFFSETS. Only deadlines due within the look-ahead
+window are kept; they are loaded with one range query on the indexed due_at
+column and reloaded every REMINDER_RELOAD_SECONDS, which also picks up changes
+made by other processes. Deadline save/delete signals update the schedulers
+running in the current process right away.
+
+Heap entries are never removed in place: a popped entry whose due_at no longer
+matches the deadline (moved or deleted) is dropped. A SentReminder row is
+claimed before sending, so a reminder goes out once per deadline, offset and
+due date even with several schedulers or after a restart. If sending fails the
+error is logged, the claim is deleted and the reminder is tried again after
+REMINDER_RETRY_SECONDS (students of batches that had already gone out may then
+get it twice); the loop of run_forever keeps running.
+
+Recipients of one reminder come from a single query (students of the course
+who have an email and have not submitted the lesson yet). Messages go out over
+one connection per tick, in batches of REMINDER_BATCH_SIZE and at most
+REMINDER_RATE messages per second.
+"""
+import heapq
+import logging
+import threading
+import time
+import weakref
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Course, Deadline, HomeworkSubmission, SentReminder, Student
+
+logger = logging.getLogger(__name__)
+
+_schedulers = weakref.WeakSet()
+
+
+def reminder_offsets():
+    """Offsets in seconds, largest first."""
+    return sorted(getattr(settings, 'DEADLINE_REMINDER_OFFSETS', (24 * 3600, 3600)), reverse=True)
+
+
+def deadline_changed(deadline, deleted=False):
+    """Signal hook: keep the schedulers of this process in step with Deadline."""
+    for scheduler in list(_schedulers):
+        if deleted:
+            scheduler.discard(deadline.id)
+        else:
+            scheduler.schedule(deadline)
+
+
+def recipients(deadline):
+    """(email, first name, username) of the students to remind, in one query.
+
+    Deadlines without a lesson are shown to every student, so they remind everybody.
+    """
+    users = User.objects.filter(is_active=True, student_profile__isnull=False).exclude(email='')
+    if deadline.lesson_id is not None:
+        # enrollment is stored on both sides (Student.courses and Course.students)
+        enrolled = Student.courses.through.objects.filter(course__lessons=deadline.lesson_id).values('student_id')
+        enrolled_too = Course.students.through.objects.filter(course__lessons=deadline.lesson_id).values('student_id')
+        submitted = HomeworkSubmission.objects.filter(lesson=deadline.lesson_id).values('student_id')
+        users = users.filter(Q(student_profile__in=enrolled) | Q(student_profile__in=enrolled_too)).exclude(
+            student_profile__in=submitted)
+    return users.order_by('id').values_list('email', 'first_name', 'username')
+
+
+def build_message(deadline, email, name, connection=None):
+    due = deadline.due_at.strftime('%d.%m.%Y %H:%M')
+    where = f" по уроку «{deadline.lesson.title}»" if deadline.lesson_id else ''
+    body = (f"Здравствуйте, {name}!\n\n"
+            f"Напоминаем: срок сдачи «{deadline.title}»{where} — {due}.\n\n"
+            "MiniLMS")
+    return EmailMessage(f"Дедлайн {due}: {deadline.title}", body, to=[email], connection=connection)
+
+
+class RateLimiter:
+    """Allows `rate` messages per second on average; 0 disables the limit."""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self._next = 0.0
+
+    def wait(self, count):
+        if not self.rate:
+            return
+        now = self.clock()
+        if self._next > now:
+            self.sleep(self._next - now)
+            now = self._next
+        self._next = now + count / self.rate
+
+
+class ReminderScheduler:
+    def __init__(self, offsets=None, window=None, batch_size=None, rate=None, limiter=None):
+        self.offsets = sorted(offsets, reverse=True) if offsets else reminder_offsets()
+        self.window = timedelta(seconds=window or settings.REMINDER_WINDOW_SECONDS)
+        self.batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+        self.limiter = limiter or RateLimiter(settings.REMINDER_RATE if rate is None else rate)
+        self.retry = timedelta(seconds=getattr(settings, 'REMINDER_RETRY_SECONDS', 300))
+        self._heap = []
+        self._due = {}  # deadline id -> due_at the heap entries were computed for
+        self._lock = threading.Lock()
+        self.loaded_at = None
+        _schedulers.add(self)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def horizon(self, now):
+        return now + self.window + timedelta(seconds=self.offsets[0])
+
+    def load(self, now=None):
+        """Rebuild the heap from the deadlines due within the window."""
+        now = now or timezone.now()
+        deadlines = Deadline.objects.filter(due_at__gt=now, due_at__lte=self.horizon(now)).only('id', 'due_at')
+        with self._lock:
+            self._heap = []
+            self._due = {}
+            for deadline in deadlines:
+                self._heap.extend(self._entries(deadline.id, deadline.due_at, now))
+            heapq.heapify(self._heap)
+        self.loaded_at = now
+
+    def _entries(self, deadline_id, due_at, now):
+        self._due[deadline_id] = due_at
+        passed = [o for o in self.offsets if due_at - timedelta(seconds=o) <= now]
+        # all future offsets, plus the closest one that already passed (late start)
+        return [(due_at - timedelta(seconds=offset), deadline_id, offset, due_at)
+                for offset in [o for o in self.offsets if o not in passed] + passed[-1:]]
+
+    def schedule(self, deadline, now=None):
+        now = now or timezone.now()
+        with self._lock:
+            if self._due.get(deadline.id) == deadline.due_at:
+                return  # other fields changed; the entries in the heap are still right
+            self._due.pop(deadline.id, None)
+            if now < deadline.due_at <= self.horizon(now):
+                for entry in self._entries(deadline.id, deadline.due_at, now):
+                    heapq.heappush(self._heap, entry)
+
+    def discard(self, deadline_id):
+        with self._lock:
+            self._due.pop(deadline_id, None)
+
+    def retry_later(self, deadline_id, offset, due_at, now):
+        with self._lock:
+            if self._due.get(deadline_id) == due_at:
+                heapq.heappush(self._heap, (now + self.retry, deadline_id, offset, due_at))
+
+    def next_fire_at(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        entries = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, deadline_id, offset, due_at = heapq.heappop(self._heap)
+                if self._due.get(deadline_id) == due_at and due_at > now:
+                    entries.append((deadline_id, offset, due_at))
+        return entries
+
+    def run_pending(self, now=None):
+        """Send every reminder that is due; returns the number of messages sent."""
+        now = now or timezone.now()
+        entries = self.pop_due(now)
+        if not entries:
+            return 0
+        deadlines = (Deadline.objects.select_related('lesson').defer('lesson__content')
+                     .in_bulk({deadline_id for deadline_id, _, _ in entries}))
+        connection = None
+        sent = 0
+        try:
+            for deadline_id, offset, due_at in entries:
+                deadline = deadlines.get(deadline_id)
+                if deadline is None or deadline.due_at != due_at:
+                    continue
+                try:
+                    with transaction.atomic():
+                        record = SentReminder.objects.create(deadline=deadline, offset=offset, due_at=due_at)
+                except IntegrityError:
+                    continue  # already sent by another scheduler or before a restart
+                try:
+                    if connection is None:
+                        connection = get_connection()
+                        connection.open()
+                    record.recipients = self._deliver(deadline, connection)
+                except Exception:
+                    logger.exception('Reminder %ss before deadline %s failed, retrying in %ss',
+                                     offset, deadline_id, self.retry.total_seconds())
+                    record.delete()  # release the claim
+                    self.retry_later(deadline_id, offset, due_at, now)
+                    connection = self._drop(connection)
+                    continue
+                record.save(update_fields=['recipients'])
+                sent += record.recipients
+        finally:
+            if connection is not None:
+                connection.close()
+        return sent
+
+    @staticmethod
+    def _drop(connection):
+        """Close a connection that failed; the next reminder opens a new one."""
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        return None
+
+    def _deliver(self, deadline, connection):
+        sent = 0
+        batch = []
+        for email, first_name, username in recipients(deadline).iterator(chunk_size=self.batch_size):
+            batch.append(build_message(deadline, email, first_name or username, connection))
+            if len(batch) >= self.batch_size:
+                sent += self._send_batch(connection, batch)
+                batch = []
+        if batch:
+            sent += self._send_batch(connection, batch)
+        return sent
+
+    def _send_batch(self, connection, messages):
+        self.limiter.wait(len(messages))
+        return connection.send_messages(messages) or 0
+
+    def run_forever(self, poll=30, stop=None):
+        """Main loop of `manage.py run_reminders`; `stop` is an optional threading.Event."""
+        reload_every = timedelta(seconds=settings.REMINDER_RELOAD_SECONDS)
+        while not (stop and stop.is_set()):
+            now = timezone.now()
+            try:
+                if self.loaded_at is None or now - self.loaded_at >= reload_every:
+                    self.load(now)
+                self.run_pending(now)
+            except Exception:  # the database or mail server is away: try again next round
+                logger.exception('Sending deadline reminders failed')
+            next_at = self.next_fire_at()
+            delay = poll if next_at is None else min(poll, max((next_at - timezone.now()).total_seconds(), 0.05))
+            if stop:
+                stop.wait(delay)
+            else:
+                time.sleep(delay)
@@ -17,6 +17,18 @@ def get_deadline(pk):
         # treat DB issues as not found
         raise Http404("Deadline not found")
 
+async def aget_deadline(pk, queryset=None):
+    """Async variant of get_deadline (lesson/course and author are fetched in the same query).
+
+    `queryset` replaces the default one, e.g. to fetch only some columns.
+    """
+    if queryset is None:
+        queryset = Deadline.objects.select_related('lesson__course', 'created_by')
+    try:
+        return await queryset.aget(id=pk)
+    except (Deadline.DoesNotExist, DatabaseError):
+        raise Http404("Deadline not found")
+
 def create_deadline(**kwargs):
     try:
         return Deadline.objects.create(**kwargs)
@@ -0,0 +1,155 @@
+"""Read/write database routing.
+
+Reads go to one of ``settings.DATABASE_REPLICAS`` (if any), writes go to the
+primary (``default``). Reads are pinned to the primary when:
+
+- the code runs inside ``use_primary()`` (context manager or decorator);
+- the current request/context has already written something;
+- a transaction is open on the primary;
+- the user wrote something less than ``REPLICA_STICKY_SECONDS`` ago, so they
+  always see their own changes even if the replica lags behind
+  (``ReplicaStickinessMiddleware`` tracks this with a cookie).
+
+``ArchiveRouter`` sends the cold archive tables (lms.archive) to
+``settings.ARCHIVE_DATABASE`` when one is configured.
+"""
+import contextvars
+import random
+import time
+from contextlib import ContextDecorator
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.db import connections
+
+PRIMARY = 'default'
+STICKY_COOKIE = 'lms_primary_until'
+
+_force_primary = contextvars.ContextVar('lms_force_primary', default=0)
+_wrote = contextvars.ContextVar('lms_wrote', default=False)
+
+
+ARCHIVE_MODELS = {'archivedsubmission', 'archiveddeadline'}
+
+
+def archive_database():
+    return getattr(settings, 'ARCHIVE_DATABASE', None)
+
+
+def replicas():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+class use_primary(ContextDecorator):
+    """Force all reads in the block (or decorated function) to the primary."""
+
+    def __enter__(self):
+        self._token = _force_primary.set(_force_primary.get() + 1)
+        return self
+
+    def __exit__(self, *exc):
+        _force_primary.reset(self._token)
+        return False
+
+
+def reset_request_state():
+    """Start a fresh routing context (called at the beginning of each request)."""
+    _wrote.set(False)
+    _force_primary.set(0)
+
+
+def wrote_in_context():
+    return _wrote.get()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or _force_primary.get() or _wrote.get():
+            return PRIMARY
+        if connections[PRIMARY].in_atomic_block:
+            return PRIMARY
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copied from the primary by `manage.py replicate_db`
+        return db not in replicas()
+
+
+class ArchiveRouter:
+    """Keep archive tables in their own database; must come before PrimaryReplicaRouter."""
+
+    def _is_archive(self, model):
+        return model._meta.app_label == 'lms' and model._meta.model_name in ARCHIVE_MODELS
+
+    def db_for_read(self, model, **hints):
+        if archive_database() and self._is_archive(model):
+            return archive_database()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = archive_database()
+        if not alias:
+            return None
+        is_archive = app_label == 'lms' and model_name in ARCHIVE_MODELS
+        if db == alias:
+            return is_archive
+        return False if is_archive else None
+
+
+class ReplicaStickinessMiddleware:
+    """Read-your-writes: pin a user to the primary for a while after they write."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pinned(self, request):
+        reset_request_state()
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _finish(self, response):
+        if wrote_in_context() and replicas():
+            window = sticky_seconds()
+            response.set_cookie(STICKY_COOKIE, str(time.time() + window), max_age=window,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self._pinned(request):
+            with use_primary():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        return self._finish(response)
+
+    async def __acall__(self, request):
+        if self._pinned(request):
+            with use_primary():
+                response = await self.get_response(request)
+        else:
+            response = await self.get_response(request)
+        return self._finish(response)
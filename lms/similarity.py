@@ -0,0 +1,150 @@
+"""Near-duplicate detection for homework submissions.
+
+Every saved submission gets a MinHash signature (lms.minhash) and one
+SubmissionBucket row per LSH band. Checking a new submission looks up only the
+buckets it falls into, through the (lesson, key) index, so the work
+depends on the number of likely matches rather than on the number of
+submissions. Candidates whose estimated similarity reaches
+SIMILARITY_THRESHOLD are stored as SimilarPair rows and shown on the
+teacher's submissions page.
+
+`manage.py rescan_similarity` rebuilds whole lessons, computing the signatures
+in a process pool.
+"""
+import hashlib
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import combinations
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from . import minhash
+from .models import HomeworkSubmission, SimilarPair, SubmissionBucket, SubmissionFingerprint
+
+
+def _options():
+    return {
+        'num_perm': settings.SIMILARITY_BANDS * settings.SIMILARITY_ROWS,
+        'shingle_size': settings.SIMILARITY_SHINGLE_SIZE,
+        'min_length': settings.SIMILARITY_MIN_LENGTH,
+    }
+
+
+def _digest(text):
+    return hashlib.sha256(minhash.normalize(text).encode('utf-8')).hexdigest()
+
+
+def _bands(sig):
+    return minhash.band_keys(sig, settings.SIMILARITY_BANDS, settings.SIMILARITY_ROWS)
+
+
+def _pair(lesson_id, a, b, score):
+    first, second = sorted((a, b))
+    return SimilarPair(lesson_id=lesson_id, first_id=first, second_id=second, score=score)
+
+
+def index_submission(submission):
+    """(Re)index one submission; returns the SimilarPair rows found, or None if the text is unchanged."""
+    digest = _digest(submission.content)
+    current = SubmissionFingerprint.objects.filter(submission=submission).values_list('digest', flat=True).first()
+    if current == digest:
+        return None
+    sig = minhash.signature(submission.content, **_options())
+    with transaction.atomic():
+        SubmissionBucket.objects.filter(submission=submission).delete()
+        SimilarPair.objects.filter(Q(first=submission) | Q(second=submission)).delete()
+        if sig is None:
+            # too short to compare meaningfully
+            SubmissionFingerprint.objects.filter(submission=submission).delete()
+            return []
+        SubmissionFingerprint.objects.update_or_create(
+            submission=submission, defaults={'lesson_id': submission.lesson_id, 'digest': digest, 'signature': sig})
+
+        keys = _bands(sig)
+        candidates = (SubmissionBucket.objects.filter(lesson_id=submission.lesson_id, key__in=[k for _, k in keys])
+                      .values('submission_id').distinct())
+        pairs = []
+        for other_id, other_sig in SubmissionFingerprint.objects.filter(submission__in=candidates).values_list(
+                'submission_id', 'signature'):
+            score = minhash.similarity(sig, other_sig)
+            if score >= settings.SIMILARITY_THRESHOLD:
+                pairs.append(_pair(submission.lesson_id, submission.id, other_id, score))
+
+        SubmissionBucket.objects.bulk_create(
+            [SubmissionBucket(lesson_id=submission.lesson_id, band=band, key=key, submission_id=submission.id)
+             for band, key in keys])
+        SimilarPair.objects.bulk_create(pairs)
+    return pairs
+
+
+def rescan_lesson(lesson_id, pool=None):
+    """Rebuild fingerprints, buckets and pairs of one lesson; returns the number of pairs."""
+    rows = list(HomeworkSubmission.objects.filter(lesson_id=lesson_id).values_list('id', 'content'))
+    compute = partial(minhash.signature, **_options())
+    texts = [content for _, content in rows]
+    if pool is not None and len(rows) > 1:
+        sigs = list(pool.map(compute, texts, chunksize=max(1, len(texts) // 32)))
+    else:
+        sigs = [compute(text) for text in texts]
+
+    fingerprints, buckets = [], []
+    members = defaultdict(list)  # (band, key) -> submission ids
+    signatures = {}
+    for (sub_id, content), sig in zip(rows, sigs):
+        if sig is None:
+            continue
+        signatures[sub_id] = sig
+        fingerprints.append(SubmissionFingerprint(submission_id=sub_id, lesson_id=lesson_id,
+                                                  digest=_digest(content), signature=sig))
+        for band, key in _bands(sig):
+            buckets.append(SubmissionBucket(lesson_id=lesson_id, band=band, key=key, submission_id=sub_id))
+            members[(band, key)].append(sub_id)
+
+    candidates = set()
+    for ids in members.values():
+        candidates.update(combinations(sorted(ids), 2))
+    pairs = []
+    for a, b in candidates:
+        score = minhash.similarity(signatures[a], signatures[b])
+        if score >= settings.SIMILARITY_THRESHOLD:
+            pairs.append(_pair(lesson_id, a, b, score))
+
+    with transaction.atomic():
+        SubmissionFingerprint.objects.filter(lesson_id=lesson_id).delete()
+        SubmissionBucket.objects.filter(lesson_id=lesson_id).delete()
+        SimilarPair.objects.filter(lesson_id=lesson_id).delete()
+        SubmissionFingerprint.objects.bulk_create(fingerprints, batch_size=500)
+        SubmissionBucket.objects.bulk_create(buckets, batch_size=2000)
+        SimilarPair.objects.bulk_create(pairs, batch_size=500)
+    return len(pairs)
+
+
+def rescan(lesson_ids, workers=None):
+    """Rescan several lessons, sharing one process pool; yields (lesson id, pairs found)."""
+    if workers == 0:
+        for lesson_id in lesson_ids:
+            yield lesson_id, rescan_lesson(lesson_id)
+        return
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for lesson_id in lesson_ids:
+            yield lesson_id, rescan_lesson(lesson_id, pool)
+
+
+def similar_pairs(lesson):
+    return (SimilarPair.objects.filter(lesson=lesson)
+            .select_related('first__student__user', 'second__student__user')
+            .defer('first__content', 'second__content'))
+
+
+def best_scores(submission_ids):
+    """{submission id: highest similarity to any other submission} for the given ids."""
+    best = {}
+    for first, second, score in SimilarPair.objects.filter(
+            Q(first__in=submission_ids) | Q(second__in=submission_ids)).values_list('first_id', 'second_id', 'score'):
+        for sub_id in (first, second):
+            best[sub_id] = max(best.get(sub_id, 0), score)
+    return best
@@ -0,0 +1,128 @@
+"""Fingerprinted, precompressed static files.
+
+``PrecompressedManifestStaticFilesStorage`` is used by ``manage.py collectstatic``:
+on top of Django's manifest storage (hashed names + staticfiles.json, which the
+``{% static %}`` tag reads) it writes ``.gz`` and, if the ``brotli`` package is
+installed, ``.br`` variants of every compressible asset.
+
+``serve_static`` serves STATIC_ROOT, picking the precompressed variant the
+client accepts with the highest q-value in ``Accept-Encoding`` (``q=0`` refuses
+an encoding). Hashed names never change content, so they get far-future
+immutable cache headers.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, Http404
+from django.utils._os import safe_join
+from django.views.decorators.http import require_http_methods
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are written without it
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.ico', '.txt', '.html', '.json', '.xml', '.map'}
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# (suffix, Content-Encoding) in order of preference
+ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+
+def _compress(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        # no point keeping a variant that is not smaller than the original
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+class PrecompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and self.exists(name):
+                _compress(self.path(name))
+
+
+# (hashed_files dict, its size, set of its values): rebuilt when the storage loads another manifest
+_hashed_names = (None, 0, frozenset())
+
+
+def _is_hashed(name):
+    global _hashed_names
+    hashed_files = getattr(staticfiles_storage, 'hashed_files', None)
+    if not hashed_files:
+        return False
+    source, size, names = _hashed_names
+    if source is not hashed_files or size != len(hashed_files):
+        names = frozenset(hashed_files.values())
+        _hashed_names = (hashed_files, len(hashed_files), names)
+    return name in names
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header; '*' stands for the codings not listed."""
+    accepted = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def _pick_encoding(header):
+    """ENCODINGS entries the client accepts, best q first (ties in our order of preference)."""
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get('*', 0.0)
+    ranked = [(accepted.get(coding, wildcard), -i, suffix, coding) for i, (suffix, coding) in enumerate(ENCODINGS)]
+    return [(suffix, coding) for q, _, suffix, coding in sorted(ranked, reverse=True) if q > 0]
+
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_static(request, path):
+    name = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(str(settings.STATIC_ROOT), name)
+    except Exception:
+        raise Http404('Not found')
+    if not os.path.isfile(full_path):
+        raise Http404('Not found')
+
+    serve_path, encoding = full_path, None
+    for suffix, coding in _pick_encoding(request.headers.get('Accept-Encoding')):
+        if os.path.isfile(full_path + suffix):
+            serve_path, encoding = full_path + suffix, coding
+            break
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    response = FileResponse(open(serve_path, 'rb'), content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    if _is_hashed(name):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
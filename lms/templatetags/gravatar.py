@@ -1,11 +1,17 @@
-import hashlib
 from django import template
 
+from lms import avatars
+
 register = template.Library()
 
 @register.filter
-def gravatar_url(user, size=80):
-    """Return the gravatar image URL for a user (by email)."""
-    email = getattr(user, 'email', '') or ''
-    email_hash = hashlib.md5(email.strip().lower().encode('utf-8')).hexdigest()
-    return f"https://www.gravatar.com/avatar/{email_hash}?s={size}&d=identicon"
+def avatar_url(user, size=80):
+    """Return the local avatar image URL for a user.
+
+    The avatar digest is kept in the Django cache per user (AVATAR_CACHE_SECONDS);
+    the URL for each size is built from it.
+    """
+    return avatars.avatar_url(user, size)
+
+# Kept for templates that still use the old name
+register.filter('gravatar_url', avatar_url)
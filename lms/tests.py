@@ -208,6 +208,12 @@ class DeadlineApiTests(TestCase):
 
 class TeacherSubmissionsTests(TestCase):
     def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        # grading the only lesson completes the course and renders a certificate PDF
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
         self.teacher = User.objects.create_user(username='teach2', password='t')
         self.teacher.is_staff = True
         self.teacher.save()
@@ -257,3 +263,1794 @@ class TeacherSubmissionsTests(TestCase):
         page_obj2 = resp2.context['page_obj']
         self.assertEqual(len(page_obj2.object_list), 2)
 
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+
+import os
+import shutil
+import tempfile
+from django.core.cache import cache
+from django.test import override_settings
+from . import avatars
+
+
+class AvatarTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        cache.clear()
+        self.user = User.objects.create_user(username='ava', password='p', email='ava@example.com')
+
+    def tearDown(self):
+        self.override.disable()
+        cache.clear()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_identicon_is_deterministic_and_prerendered(self):
+        url = avatars.avatar_url(self.user, 36)
+        digest = self.user.avatar.digest
+        self.assertEqual(url, reverse('avatar_image', args=[digest, 36]))
+        for size in avatars.avatar_sizes():
+            self.assertTrue(os.path.exists(avatars.avatar_path(digest, size)))
+        self.assertEqual(avatars.store_identicon('ava@example.com'), digest)
+
+    def test_url_lookup_is_memoized(self):
+        avatars.avatar_url(self.user, 80)
+        with self.assertNumQueries(0):
+            avatars.avatar_url(self.user, 80)
+            avatars.avatar_url(self.user, 70)  # snaps to the same standard size
+            # another request: a fresh user object, the digest comes from the cache
+            avatars.avatar_url(User(pk=self.user.pk), 36)
+
+    def test_avatar_served_with_immutable_headers(self):
+        url = avatars.avatar_url(self.user, 120)
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'image/png')
+        self.assertIn('immutable', resp['Cache-Control'])
+
+    def test_upload_replaces_avatar_url(self):
+        from io import BytesIO
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        old_url = avatars.avatar_url(self.user, 80)
+        buf = BytesIO()
+        Image.new('RGB', (200, 150), (10, 120, 200)).save(buf, 'PNG')
+        self.client.login(username='ava', password='p')
+        resp = self.client.post(reverse('profile'), {'image': SimpleUploadedFile('a.png', buf.getvalue(), 'image/png')})
+        self.assertEqual(resp.status_code, 302)
+        self.user.avatar.refresh_from_db()
+        self.assertTrue(self.user.avatar.uploaded)
+        # the next request (a fresh user object) sees the new avatar through the cache
+        new_url = avatars.avatar_url(User.objects.get(pk=self.user.pk), 80)
+        self.assertNotEqual(new_url, old_url)
+        self.assertEqual(new_url, reverse('avatar_image', args=[self.user.avatar.digest, 80]))
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media, UPLOAD_CHUNK_SIZE=1024)
+        self.override.enable()
+        self.user = User.objects.create_user(username='up', password='p')
+        self.client.login(username='up', password='p')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def _start(self, data, filename='a.zip'):
+        resp = self.client.post(reverse('upload_start_api'), json.dumps({'filename': filename, 'size': len(data)}),
+                                content_type='application/json')
+        self.assertEqual(resp.status_code, 201)
+        return reverse('upload_detail_api', args=[resp.json()['upload_id']])
+
+    def _put(self, url, data, start, end):
+        return self.client.put(url, data[start:end + 1], content_type='application/octet-stream',
+                               HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{len(data)}')
+
+    def test_resume_after_wrong_offset_and_hash(self):
+        import hashlib
+        from .models import StoredFile
+        data = os.urandom(2500)
+        url = self._start(data)
+        self.assertEqual(self._put(url, data, 0, 1023).json()['offset'], 1024)
+        # client lost track and resends from the start -> server reports the resume offset
+        resp = self._put(url, data, 0, 1023)
+        self.assertEqual(resp.status_code, 409)
+        self.assertEqual(resp.json()['offset'], 1024)
+        self.assertEqual(self.client.get(url).json()['offset'], 1024)
+        self._put(url, data, 1024, 2047)
+        state = self._put(url, data, 2048, 2499).json()
+        self.assertTrue(state['complete'])
+        self.assertEqual(state['sha256'], hashlib.sha256(data).hexdigest())
+        stored = StoredFile.objects.get(id=state['file_id'])
+        with stored.file.open('rb') as f:
+            self.assertEqual(f.read(), data)
+
+    def test_failed_and_concurrent_chunks_keep_the_digest(self):
+        import fcntl
+        import hashlib
+        import io
+        from . import uploads
+        from .models import UploadSession
+        data = os.urandom(2500)
+        url = self._start(data)
+        self._put(url, data, 0, 1023)
+        session = UploadSession.objects.get()
+
+        class Disconnected(io.BytesIO):
+            def read(self, size=-1):
+                if self.tell():
+                    raise OSError('client went away')
+                return super().read(min(size, 100))
+        with self.assertRaises(OSError):
+            uploads.write_chunk(session, Disconnected(data[1024:2048]), f'bytes 1024-2047/{len(data)}')
+
+        # a chunk arriving while another one of the upload is being written
+        with open(uploads.part_path(session), 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            resp = self._put(url, data, 1024, 2047)
+        self.assertEqual((resp.status_code, resp.json()['offset']), (409, 1024))
+
+        stale = UploadSession.objects.get()
+        self.assertEqual(self._put(url, data, 1024, 2047).json()['offset'], 2048)
+        # a request that read the session before the previous chunk moved the offset
+        with self.assertRaises(uploads.UploadError) as raised:
+            uploads.write_chunk(stale, io.BytesIO(data[1024:2048]), f'bytes 1024-2047/{len(data)}')
+        self.assertEqual((raised.exception.status, raised.exception.offset), (409, 2048))
+
+        state = self._put(url, data, 2048, 2499).json()
+        self.assertEqual(state['sha256'], hashlib.sha256(data).hexdigest())
+
+    def test_identical_files_are_deduplicated(self):
+        from .models import StoredFile
+        data = b'same content' * 10
+        ids = []
+        for _ in range(2):
+            url = self._start(data)
+            ids.append(self._put(url, data, 0, len(data) - 1).json()['file_id'])
+        self.assertEqual(ids[0], ids[1])
+        self.assertEqual(StoredFile.objects.count(), 1)
+
+    def test_submission_attaches_completed_upload(self):
+        teacher = User.objects.create_user(username='upt', password='t')
+        course = Course.objects.create(title='UC', description='d', teacher=teacher)
+        lesson = Lesson.objects.create(course=course, title='UL', content='c')
+        student = Student.objects.create(user=self.user)
+        data = b'homework archive'
+        url = self._start(data)
+        self._put(url, data, 0, len(data) - 1)
+        upload_id = url.rstrip('/').rsplit('/', 1)[-1]
+        self.client.post(reverse('lesson_detail', args=[lesson.id]), {'content': 'see file', 'upload_id': upload_id})
+        sub = HomeworkSubmission.objects.get(student=student, lesson=lesson)
+        self.assertEqual(sub.attachment.size, len(data))
+        resp = self.client.get(reverse('attachment_download', args=[sub.attachment_id]))
+        self.assertEqual(b''.join(resp.streaming_content), data)
+
+    def _attach(self, username, lesson, data, filename):
+        user = User.objects.create_user(username=username, password='p')
+        student = Student.objects.create(user=user)
+        lesson.course.students.add(student)
+        self.client.login(username=username, password='p')
+        upload_id = self._start(data, filename).rstrip('/').rsplit('/', 1)[-1]
+        self._put(reverse('upload_detail_api', args=[upload_id]), data, 0, len(data) - 1)
+        self.client.post(reverse('lesson_detail', args=[lesson.id]), {'content': 'file', 'upload_id': upload_id})
+        return HomeworkSubmission.objects.get(student=student, lesson=lesson)
+
+    def test_shared_file_keeps_each_uploaders_name_and_access(self):
+        teacher = User.objects.create_user(username='upt', password='t', is_staff=True)
+        course = Course.objects.create(title='UC', description='d', teacher=teacher)
+        lesson = Lesson.objects.create(course=course, title='UL', content='c')
+        data = b'identical bytes'
+        first = self._attach('ivanov', lesson, data, 'ivanov_ivan_hw1.pdf')
+        second = self._attach('petrov', lesson, data, 'hw1.pdf')
+        self.assertEqual(first.attachment_id, second.attachment_id)
+        self.assertEqual(second.attachment_name, 'hw1.pdf')
+        page = self.client.get(reverse('lesson_detail', args=[lesson.id])).content.decode()
+        self.assertIn('hw1.pdf', page)
+        self.assertNotIn('ivanov', page)
+        resp = self.client.get(reverse('attachment_download', args=[second.attachment_id]))
+        self.assertIn('filename="hw1.pdf"', resp['Content-Disposition'])
+
+        # lesson materials: students of the course and its teacher only
+        lesson.attachment, lesson.attachment_name = first.attachment, 'lecture.pdf'
+        lesson.save()
+        User.objects.create_user(username='outsider', password='p', is_staff=True)
+        self.client.login(username='outsider', password='p')
+        self.assertEqual(self.client.get(reverse('attachment_download', args=[lesson.attachment_id])).status_code, 403)
+        self.client.login(username='upt', password='t')
+        resp = self.client.get(reverse('attachment_download', args=[lesson.attachment_id]))
+        self.assertIn('filename="lecture.pdf"', resp['Content-Disposition'])
+
+    def test_abandoned_uploads_expire(self):
+        from . import uploads
+        from .models import UploadSession
+        data = b'x' * 2000
+        url = self._start(data)
+        self._put(url, data, 0, 1023)
+        session = UploadSession.objects.get()
+        self.assertIn(session.id, uploads._hashers)
+        orphan = os.path.join(self.media, 'uploads', 'tmp', '00000000-0000-0000-0000-000000000000.part')
+        open(orphan, 'wb').close()
+        self.assertEqual(uploads.expire_uploads(), 0)
+        self.assertEqual(uploads.expire_uploads(now=timezone.now() + timezone.timedelta(days=2)), 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media, 'uploads', 'tmp')), [])
+        self.assertNotIn(session.id, uploads._hashers)
+
+
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.override = override_settings(STATIC_ROOT=self.root, STORAGES={
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'lms.staticfiles.PrecompressedManifestStaticFilesStorage'},
+        })
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_collectstatic_fingerprints_and_compresses(self):
+        from django.core.management import call_command
+        from django.templatetags.static import static
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'staticfiles.json')))
+        url = static('css/site.css')
+        self.assertRegex(url, r'^/static/css/site\.[0-9a-f]{12}\.css$')
+        hashed = url[len('/static/'):]
+        self.assertTrue(os.path.exists(os.path.join(self.root, hashed + '.gz')))
+
+        resp = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(resp['Content-Type'], 'text/css')
+        self.assertIn('immutable', resp['Cache-Control'])
+
+        plain = self.client.get(url)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        unhashed = self.client.get('/static/css/site.css')
+        self.assertNotIn('immutable', unhashed['Cache-Control'])
+        refused = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0, identity')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+
+    def test_accept_encoding_q_values(self):
+        from .staticfiles import _pick_encoding
+        self.assertEqual(_pick_encoding('gzip, br'), [('.br', 'br'), ('.gz', 'gzip')])
+        self.assertEqual(_pick_encoding('br;q=0.5, gzip'), [('.gz', 'gzip'), ('.br', 'br')])
+        self.assertEqual(_pick_encoding('br;q=0, *'), [('.gz', 'gzip')])
+        self.assertEqual(_pick_encoding('x-gzip, deflate'), [])
+        self.assertEqual(_pick_encoding(None), [])
+
+
+class SqliteProfileTests(TestCase):
+    def test_production_pragmas_enable_wal(self):
+        import sqlite3
+        from django.conf import settings
+        from .db import apply_pragmas
+        tmp = tempfile.mkdtemp()
+        try:
+            conn = sqlite3.connect(os.path.join(tmp, 'x.sqlite3'))
+            result = apply_pragmas(conn.cursor(), settings.SQLITE_PRODUCTION_PRAGMAS)
+            conn.close()
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.assertEqual(result['journal_mode'], 'wal')
+        self.assertEqual(result['busy_timeout'], 5000)
+        self.assertEqual(result['temp_store'], 2)  # MEMORY
+
+    def test_invalid_pragma_rejected(self):
+        import sqlite3
+        from .db import apply_pragmas
+        conn = sqlite3.connect(':memory:')
+        with self.assertRaises(ValueError):
+            apply_pragmas(conn.cursor(), {'cache_size': '1; DROP TABLE x'})
+        conn.close()
+
+
+from django.test import SimpleTestCase, RequestFactory
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        from . import routers
+        self.routers = routers
+        self.router = routers.PrimaryReplicaRouter()
+        routers.reset_request_state()
+
+    def test_reads_go_to_replica_and_writes_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Course), 'replica')
+        self.assertEqual(self.router.db_for_write(Course), 'default')
+        # after a write in the same context reads see the primary
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+
+    def test_use_primary_forces_reads(self):
+        with self.routers.use_primary():
+            self.assertEqual(self.router.db_for_read(Course), 'default')
+        self.assertEqual(self.router.db_for_read(Course), 'replica')
+
+        @self.routers.use_primary()
+        def read():
+            return self.router.db_for_read(Course)
+        self.assertEqual(read(), 'default')
+
+    def test_sticky_cookie_after_write(self):
+        from django.http import HttpResponse
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Course))
+            if request.method == 'POST':
+                self.router.db_for_write(Course)
+            return HttpResponse('ok')
+
+        mw = self.routers.ReplicaStickinessMiddleware(view)
+        rf = RequestFactory()
+        resp = mw(rf.post('/'))
+        self.assertIn(self.routers.STICKY_COOKIE, resp.cookies)
+        follow_up = rf.get('/')
+        follow_up.COOKIES[self.routers.STICKY_COOKIE] = resp.cookies[self.routers.STICKY_COOKIE].value
+        mw(follow_up)
+        mw(rf.get('/'))
+        self.assertEqual(seen, ['replica', 'default', 'replica'])
+
+
+class HotQueryIndexTests(TestCase):
+    def test_one_submission_per_student_and_lesson(self):
+        from django.db import IntegrityError, transaction
+        teacher = User.objects.create_user(username='ix-t', password='t')
+        course = Course.objects.create(title='IX', description='d', teacher=teacher)
+        lesson = Lesson.objects.create(course=course, title='L', content='c')
+        student = Student.objects.create(user=User.objects.create_user(username='ix-s', password='p'))
+        HomeworkSubmission.objects.create(lesson=lesson, student=student, content='a')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            HomeworkSubmission.objects.create(lesson=lesson, student=student, content='b')
+
+    def test_explain_hot_queries_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        out = StringIO()
+        call_command('explain_hot_queries', students=5, lessons=2, deadlines=5, stdout=out)
+        self.assertIn('teacher_lesson_submissions', out.getvalue())
+        # sample data is rolled back
+        self.assertFalse(Course.objects.exists())
+        # course_list scans lms_course, so a zero threshold must fail
+        with self.assertRaises(CommandError):
+            call_command('explain_hot_queries', threshold=0, students=2, lessons=1, deadlines=1, stdout=StringIO())
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        teacher = User.objects.create_user(username='as-t', password='t', is_staff=True)
+        self.course = Course.objects.create(title='AsyncCourse', description='d', teacher=teacher)
+        self.lesson = Lesson.objects.create(course=self.course, title='AsyncLesson', content='c')
+        self.user = User.objects.create_user(username='as-s', password='p')
+        self.student = Student.objects.create(user=self.user)
+        self.student.courses.add(self.course)
+        self.course.students.add(self.student)
+        self.async_client.force_login(self.user)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_hot_read_views_are_coroutines(self):
+        from asgiref.sync import iscoroutinefunction
+        from . import views
+        for view in (views.deadlines_api, views.deadline_detail_api, views.course_list,
+                     views.course_detail, views.student_dashboard):
+            self.assertTrue(iscoroutinefunction(view), view.__name__)
+
+    async def test_course_detail_and_dashboard_under_async_client(self):
+        resp = await self.async_client.get(reverse('course_detail', args=[self.course.id]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.context['is_enrolled'])
+        self.assertContains(resp, 'AsyncLesson')
+        resp = await self.async_client.get(reverse('student_dashboard'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['courses_data'][0]['lessons'][0]['lesson'].id, self.lesson.id)
+
+    async def test_async_views_require_login_and_method(self):
+        from django.test import AsyncClient
+        resp = await AsyncClient().get(reverse('deadlines_api'))
+        self.assertEqual(resp.status_code, 302)
+        resp = await self.async_client.patch(reverse('deadlines_api'))
+        self.assertEqual(resp.status_code, 405)
+        resp = await self.async_client.get(reverse('course_detail', args=[999]))
+        self.assertEqual(resp.status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_import_command_is_idempotent(self):
+        from io import StringIO
+        from django.core.management import call_command
+        users = self._write('users.csv', 'username,email,first_name,password,role\n'
+                            'prof,prof@example.com,Prof,secret,teacher\n'
+                            + ''.join(f's{i},s{i}@example.com,S{i},pw{i},student\n' for i in range(6)))
+        courses = self._write('courses.jsonl', '{"title": "Imported", "teacher": "prof", "description": "d"}\n')
+        lessons = self._write('lessons.csv', 'course,title,content\nImported,L1,c1\nImported,L2,c2\n')
+        enrollments = self._write('enrollments.csv', 'username,course\n'
+                                  + ''.join(f's{i},Imported\n' for i in range(6)))
+        # order of arguments does not matter: users are imported first
+        call_command('import_lms', enrollments, lessons, courses, users, workers=2, stdout=StringIO())
+        call_command('import_lms', users, courses, lessons, enrollments, workers=0, stdout=StringIO())
+
+        self.assertEqual(User.objects.filter(username__startswith='s').count(), 6)
+        self.assertTrue(User.objects.get(username='prof').is_staff)
+        self.assertTrue(User.objects.get(username='s3').check_password('pw3'))
+        course = Course.objects.get(title='Imported')
+        self.assertEqual(course.lessons.count(), 2)
+        self.assertEqual(course.students.count(), 6)
+        self.assertEqual(Student.objects.get(user__username='s0').courses.get(), course)
+
+    def test_invalid_rows_are_reported(self):
+        from .importer import Importer
+        path = self._write('users.csv', 'username,email,role\nok,ok@example.com,student\n,x@example.com,student\n'
+                           'bad,not-an-email,student\nodd,odd@example.com,admin\n')
+        with Importer(workers=0) as importer:
+            report = importer.run_file(path)
+        self.assertEqual(report.created, 1)
+        self.assertEqual([line for line, _ in report.errors], [3, 4, 5])
+        self.assertFalse(User.objects.get(username='ok').has_usable_password())
+
+    def test_staff_upload_page(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        User.objects.create_user(username='staff', password='p', is_staff=True)
+        self.client.login(username='staff', password='p')
+        upload = SimpleUploadedFile('u.csv', b'username,role\nfromweb,student\n', 'text/csv')
+        resp = self.client.post(reverse('import_data'), {'kind': 'users', 'file': upload})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context['report'].created, 1)
+        self.assertTrue(Student.objects.filter(user__username='fromweb').exists())
+
+    def test_teacher_upload_cannot_touch_staff_accounts(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        User.objects.create_user(username='staff', password='p', is_staff=True)
+        User.objects.create_superuser(username='root', password='p', email='root@example.com')
+        self.client.login(username='staff', password='p')
+        upload = SimpleUploadedFile('u.csv', b'username,email,role\nboss,b@example.com,teacher\n'
+                                    b'root,evil@example.com,student\nplain,p@example.com,student\n', 'text/csv')
+        report = self.client.post(reverse('import_data'), {'kind': 'users', 'file': upload}).context['report']
+        self.assertEqual((report.created, [line for line, _ in report.errors]), (1, [2, 3]))
+        self.assertFalse(User.objects.filter(username='boss').exists())
+        self.assertEqual(User.objects.get(username='root').email, 'root@example.com')
+        self.assertFalse(Student.objects.filter(user__username='root').exists())
+
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class CompressedContentTests(TestCase):
+    def setUp(self):
+        teacher = User.objects.create_user(username='t', password='p', is_staff=True)
+        self.course = Course.objects.create(title='C', description='d', teacher=teacher)
+        self.lesson = Lesson.objects.create(course=self.course, title='L', content='lesson text ' * 500)
+        self.user = User.objects.create_user(username='s', password='p')
+        self.student = Student.objects.create(user=self.user)
+
+    def _stored(self, model, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT content FROM {model._meta.db_table} WHERE id = %s', [pk])
+            return bytes(cursor.fetchone()[0])
+
+    def test_round_trip_and_storage(self):
+        from .fields import compress_text, decompress_text
+        long_text = 'Ответ на задание. ' * 300
+        self.assertEqual(decompress_text(compress_text(long_text)), long_text)
+        self.assertEqual(compress_text('short'), b'rshort')
+
+        stored = self._stored(Lesson, self.lesson.pk)
+        self.assertEqual(stored[:1], b'z')
+        self.assertLess(len(stored), len(self.lesson.content) // 10)
+        self.assertEqual(Lesson.objects.get(pk=self.lesson.pk).content, self.lesson.content)
+
+    def test_preview_is_kept_in_sync(self):
+        sub = HomeworkSubmission.objects.create(student=self.student, lesson=self.lesson, content='x' * 1000)
+        self.assertEqual(len(sub.content_preview), 200)
+        sub.content = 'short answer'
+        sub.save(update_fields=['content'])
+        sub.refresh_from_db()
+        self.assertEqual(sub.content_preview, 'short answer')
+        # saving a deferred instance leaves the preview alone
+        deferred = HomeworkSubmission.objects.defer('content').get(pk=sub.pk)
+        deferred.grade = 5
+        deferred.save()
+        self.assertEqual(HomeworkSubmission.objects.get(pk=sub.pk).content_preview, 'short answer')
+
+    def test_preview_on_bulk_writes(self):
+        HomeworkSubmission.objects.bulk_create(
+            [HomeworkSubmission(student=self.student, lesson=self.lesson, content='bulk answer')])
+        sub = HomeworkSubmission.objects.get(student=self.student, lesson=self.lesson)
+        self.assertEqual(sub.content_preview, 'bulk answer')
+        sub.content = 'edited'
+        HomeworkSubmission.objects.bulk_update([sub], ['content'])
+        self.assertEqual(HomeworkSubmission.objects.get(pk=sub.pk).content_preview, 'edited')
+
+    def test_lists_do_not_load_bodies(self):
+        HomeworkSubmission.objects.create(student=self.student, lesson=self.lesson, content='answer ' * 200)
+        self.client.login(username='s', password='p')
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(reverse('submissions_list'))
+        self.assertContains(resp, 'answer answer')
+        selects = [q['sql'] for q in ctx.captured_queries if 'lms_homeworksubmission' in q['sql']]
+        self.assertTrue(selects)
+        self.assertFalse(any('"lms_homeworksubmission"."content",' in sql or '"lms_lesson"."content"' in sql
+                             for sql in selects))
+
+
+from .models import Certificate
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        teacher = User.objects.create_user(username='t', password='p', is_staff=True)
+        self.old = Course.objects.create(title='Old', description='d', teacher=teacher,
+                                         closed_at=timezone.now() - timedelta(days=400))
+        self.recent = Course.objects.create(title='Recent', description='d', teacher=teacher,
+                                            closed_at=timezone.now() - timedelta(days=30))
+        self.user = User.objects.create_user(username='s', password='p')
+        self.student = Student.objects.create(user=self.user)
+        for course in (self.old, self.recent):
+            for i in range(3):
+                lesson = Lesson.objects.create(course=course, title=f'{course.title} {i}', content='c')
+                HomeworkSubmission.objects.create(student=self.student, lesson=lesson, content=f'answer {i}',
+                                                  is_graded=True, grade=4 + i % 2)
+                Deadline.objects.create(title='D', due_at=timezone.now(), lesson=lesson)
+        self.certificate = Certificate.objects.get(course=self.old)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_moves_old_courses_only(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import ArchivedDeadline, ArchivedSubmission
+        call_command('archive_courses', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(HomeworkSubmission.objects.filter(lesson__course=self.old).count(), 0)
+        self.assertEqual(Deadline.objects.filter(lesson__course=self.old).count(), 0)
+        self.assertEqual(HomeworkSubmission.objects.filter(lesson__course=self.recent).count(), 3)
+        self.assertEqual(ArchivedSubmission.objects.filter(course_id=self.old.id).count(), 3)
+        self.assertEqual(ArchivedDeadline.objects.count(), 3)
+        self.assertEqual(ArchivedSubmission.objects.get(lesson_title='Old 1').content, 'answer 1')
+        self.old.refresh_from_db()
+        self.assertTrue(self.old.is_archived)
+        self.assertTrue(Certificate.objects.filter(pk=self.certificate.pk).exists())
+
+        # nothing left: a second run is a no-op
+        out = StringIO()
+        call_command('archive_courses', stdout=out)
+        self.assertIn('Nothing to archive', out.getvalue())
+
+    def test_resumes_after_partial_copy(self):
+        from .archive import archive_course
+        from .models import ArchivedSubmission
+        # a previous run copied one row but died before deleting it
+        sub = HomeworkSubmission.objects.filter(lesson__course=self.old).select_related('lesson__course').first()
+        ArchivedSubmission.objects.create(id=sub.id, student_id=sub.student_id, course_id=self.old.id,
+                                          course_title='Old', lesson_id=sub.lesson_id, lesson_title=sub.lesson.title,
+                                          content=sub.content, is_graded=True, grade=sub.grade)
+        result = archive_course(self.old)
+        self.assertEqual(result.submissions, 3)
+        self.assertEqual(ArchivedSubmission.objects.count(), 3)
+
+    def test_student_sees_archived_grades_read_only(self):
+        from .archive import archive_course
+        archive_course(self.old)
+        self.client.login(username='s', password='p')
+        resp = self.client.get(reverse('student_grades'))
+        self.assertContains(resp, reverse('student_grades_archive'))
+        resp = self.client.get(reverse('student_grades_archive'))
+        self.assertContains(resp, 'Old 2')
+        self.assertNotContains(resp, 'Recent 0')
+
+        lesson = self.old.lessons.get(title='Old 1')
+        resp = self.client.get(reverse('lesson_detail', args=[lesson.id]))
+        self.assertContains(resp, 'answer 1')
+        self.assertIsNone(resp.context['form'])
+        self.client.post(reverse('lesson_detail', args=[lesson.id]), {'content': 'late'})
+        self.assertFalse(HomeworkSubmission.objects.filter(lesson=lesson).exists())
+
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+
+
+class CountingEmailBackend(LocmemEmailBackend):
+    """locmem backend that counts how often a connection is opened."""
+    opened = 0
+
+    def open(self):
+        CountingEmailBackend.opened += 1
+        return True
+
+
+@override_settings(EMAIL_BACKEND='lms.tests.CountingEmailBackend', REMINDER_RATE=0, REMINDER_BATCH_SIZE=50)
+class DeadlineReminderTests(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        self.now = timezone.now()
+        teacher = User.objects.create_user(username='t', password='p', is_staff=True)
+        self.course = Course.objects.create(title='C', description='d', teacher=teacher)
+        self.lesson = Lesson.objects.create(course=self.course, title='L1', content='c')
+        self.students = []
+        for i in range(120):
+            user = User.objects.create_user(username=f's{i}', email=f's{i}@example.com' if i else '')
+            student = Student.objects.create(user=user)
+            self.students.append(student)
+        self.course.students.add(*self.students[:60])
+        for student in self.students[60:]:
+            student.courses.add(self.course)
+        HomeworkSubmission.objects.create(student=self.students[1], lesson=self.lesson, content='done')
+        Student.objects.create(user=User.objects.create_user(username='other', email='other@example.com'))
+        self.deadline = Deadline.objects.create(title='HW1', lesson=self.lesson, due_at=self.now + timedelta(minutes=30))
+        CountingEmailBackend.opened = 0
+
+    def test_sends_one_batched_reminder_per_offset(self):
+        from datetime import timedelta
+        from .reminders import ReminderScheduler
+        scheduler = ReminderScheduler()
+        scheduler.load(self.now)
+        # 24h mark already passed, so only the closest offset (1h) is pending
+        self.assertEqual(len(scheduler), 1)
+        with self.assertNumQueries(6):  # recipients are one query whatever the course size
+            sent = scheduler.run_pending(self.now)
+        # 120 students, one without email, one already submitted, one not enrolled
+        self.assertEqual(sent, 118)
+        self.assertEqual(len(mail.outbox), 118)
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(mail.outbox[0].to, ['s2@example.com'])
+
+        # a restarted scheduler does not remind again
+        again = ReminderScheduler()
+        again.load(self.now + timedelta(minutes=1))
+        self.assertEqual(again.run_pending(self.now + timedelta(minutes=1)), 0)
+        self.assertEqual(len(mail.outbox), 118)
+
+    def test_signals_update_running_scheduler(self):
+        from datetime import timedelta
+        from .reminders import ReminderScheduler
+        scheduler = ReminderScheduler(offsets=[3600])
+        scheduler.load(self.now)
+        # moved far away: the old entry is dropped, the new one fires later
+        self.deadline.due_at = self.now + timedelta(hours=3)
+        self.deadline.save()
+        self.assertEqual(scheduler.run_pending(self.now + timedelta(minutes=1)), 0)
+        self.assertEqual(scheduler.next_fire_at(), self.now + timedelta(hours=2))
+
+        later = Deadline.objects.create(title='HW2', lesson=self.lesson, due_at=self.now + timedelta(hours=4))
+        self.assertEqual(len(scheduler.pop_due(self.now + timedelta(hours=3, minutes=1))), 1)
+        later.delete()
+        self.assertEqual(scheduler.pop_due(self.now + timedelta(hours=3, minutes=59)), [])
+
+    def test_failed_send_releases_the_claim_and_retries(self):
+        from unittest.mock import patch
+        from .models import SentReminder
+        from .reminders import ReminderScheduler
+        scheduler = ReminderScheduler()
+        scheduler.load(self.now)
+        with patch.object(CountingEmailBackend, 'send_messages', side_effect=OSError('SMTP is down')), \
+                self.assertLogs('lms.reminders', 'ERROR'):
+            self.assertEqual(scheduler.run_pending(self.now), 0)
+        self.assertFalse(SentReminder.objects.exists())
+        self.assertEqual(scheduler.next_fire_at(), self.now + scheduler.retry)
+        self.assertEqual(scheduler.run_pending(self.now + scheduler.retry), 118)
+        self.assertEqual(SentReminder.objects.get().recipients, 118)
+
+    def test_rate_limiter(self):
+        from .reminders import RateLimiter
+        clock = [0.0]
+        slept = []
+        limiter = RateLimiter(10, clock=lambda: clock[0], sleep=lambda s: slept.append(s))
+        limiter.wait(50)
+        limiter.wait(50)
+        self.assertEqual(slept, [5.0])
+
+
+class SimilarityTests(TestCase):
+    ESSAY = ("Цикл for в Python проходит по элементам любой последовательности: списка, строки или range. "
+             "На каждой итерации переменная получает очередное значение, а тело цикла выполняется заново. ")
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()  # graded copies complete the course: certificates are rendered
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        self.teacher = User.objects.create_user(username='t', password='p', is_staff=True)
+        course = Course.objects.create(title='C', description='d', teacher=self.teacher)
+        self.lesson = Lesson.objects.create(course=course, title='L', content='c')
+        self.students = [Student.objects.create(user=User.objects.create_user(username=f's{i}')) for i in range(4)]
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def _submit(self, student, text):
+        return HomeworkSubmission.objects.create(student=student, lesson=self.lesson, content=text)
+
+    def test_minhash_estimates_similarity(self):
+        from . import minhash
+        a = minhash.signature(self.ESSAY * 2, num_perm=128)
+        b = minhash.signature(self.ESSAY * 2 + 'Я добавил одно предложение от себя.', num_perm=128)
+        c = minhash.signature('Совсем другой ответ про словари и множества, ничего общего с циклами. ' * 2,
+                              num_perm=128)
+        self.assertGreater(minhash.similarity(a, b), 0.8)
+        self.assertLess(minhash.similarity(a, c), 0.3)
+        self.assertIsNone(minhash.signature('ok'))
+
+    def test_copies_are_paired_on_save(self):
+        from .models import SimilarPair
+        original = self._submit(self.students[0], self.ESSAY)
+        self._submit(self.students[1], 'Мой ответ: списки, кортежи и словари хранят данные по-разному, '
+                                       'словарь отображает ключи в значения.')
+        copy = self._submit(self.students[2], self.ESSAY.upper().replace(',', ''))
+        pair = SimilarPair.objects.get()
+        self.assertEqual((pair.first_id, pair.second_id), (original.id, copy.id))
+        self.assertGreaterEqual(pair.score, 0.7)
+
+        # grading does not re-index; rewriting the answer drops the pair
+        copy.grade, copy.is_graded = 5, True
+        copy.save(update_fields=['grade', 'is_graded'])
+        copy.content = 'Переписал всё своими словами: итерация по range(10) печатает числа от нуля до девяти.'
+        copy.save()
+        self.assertFalse(SimilarPair.objects.exists())
+
+    def test_rescan_and_teacher_page(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from .models import SimilarPair, SubmissionBucket
+        self._submit(self.students[0], self.ESSAY)
+        self._submit(self.students[3], self.ESSAY + ' Конец.')
+        SimilarPair.objects.all().delete()
+        SubmissionBucket.objects.all().delete()
+        call_command('rescan_similarity', lesson=[self.lesson.id], workers=2, stdout=StringIO())
+        self.assertEqual(SimilarPair.objects.count(), 1)
+        self.assertEqual(SubmissionBucket.objects.count(), 2 * 16)
+
+        self.client.login(username='t', password='p')
+        resp = self.client.get(reverse('teacher_lesson_submissions', args=[self.lesson.id]))
+        self.assertContains(resp, 'Похожие работы')
+        self.assertContains(resp, 'похоже:', count=2)
+
+
+class AutocheckTests(TestCase):
+    TESTS = ("def test_add():\n    assert add(2, 3) == 5\n"
+             "def test_negative():\n    assert add(-1, 1) == 0\n")
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        self.teacher = User.objects.create_user(username='t', password='p', is_staff=True)
+        self.course = Course.objects.create(title='C', description='d', teacher=self.teacher)
+        self.lesson = Lesson.objects.create(course=self.course, title='Add', content='write add(a, b)')
+        self.students = [Student.objects.create(user=User.objects.create_user(username=f's{i}', password='p'))
+                         for i in range(3)]
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_checkers(self):
+        from .checkers import run_check
+        spec = {'points': 10, 'tolerance': 0.01, 'time_limit': 5, 'memory_limit_mb': 256}
+        self.assertEqual(run_check(dict(spec, kind='exact', expected='Paris\nПариж'), ' париж ')[0], 10)
+        self.assertEqual(run_check(dict(spec, kind='regex', expected=r'\d+ ?(кг|kg)'), '12 кг')[0], 10)
+        self.assertEqual(run_check(dict(spec, kind='numeric', expected='3.14'), '3,141')[0], 10)
+        self.assertEqual(run_check(dict(spec, kind='numeric', expected='3.14'), 'пи')[:2], (0, 'Ответ не число'))
+        self.assertTrue(run_check(dict(spec, kind='regex', expected='('), 'x')[2])
+
+        python = dict(spec, kind='python', expected=self.TESTS)
+        self.assertEqual(run_check(python, 'def add(a, b):\n    return a + b\n')[0], 10)
+        self.assertEqual(run_check(python, 'def add(a, b):\n    return abs(a) + b\n')[0], 5)
+        grade, feedback, error = run_check(dict(python, time_limit=1), 'while True:\n    pass\n')
+        self.assertEqual((grade, error), (0, False))
+        self.assertIn('время', feedback)
+
+    def test_python_answer_cannot_report_its_own_result(self):
+        from .checkers import run_check
+        python = {'kind': 'python', 'expected': self.TESTS, 'points': 10, 'time_limit': 5, 'memory_limit_mb': 256}
+        forged = ('import __main__, json, os, sys\n'
+                  'nonce = getattr(__main__, "nonce", None) or sys.stdin.readline().strip()\n'
+                  'print("\\n" + str(nonce) + json.dumps({"passed": 2, "total": 2, "failures": []}), flush=True)\n'
+                  'os._exit(0)\n')
+        self.assertEqual(run_check(python, forged)[0], 0)
+        # values the tests get back are plain data, whatever the answer returns
+        grade, feedback, _ = run_check(python, 'def add(a, b):\n    return type("X", (), {"__eq__": lambda *_: True})()\n')
+        self.assertEqual(grade, 0)
+        self.assertIn('TypeError', feedback)
+
+    def test_queue_check_and_confirm(self):
+        from .autocheck import run_worker
+        from .models import LessonChecker
+        self.client.login(username='t', password='p')
+        self.client.post(reverse('lesson_checker', args=[self.lesson.id]), {
+            'kind': 'python', 'expected': self.TESTS, 'tolerance': 0, 'points': 100,
+            'time_limit': 5, 'memory_limit_mb': 256})
+        self.assertTrue(LessonChecker.objects.filter(lesson=self.lesson).exists())
+
+        answers = ['def add(a, b):\n    return a + b\n', 'def add(a, b):\n    return abs(a) + b\n', 'add = None']
+        for student, answer in zip(self.students, answers):
+            self.client.login(username=student.user.username, password='p')
+            self.client.post(reverse('lesson_detail', args=[self.lesson.id]), {'content': answer})
+        self.assertEqual(HomeworkSubmission.objects.filter(check_status='queued').count(), 3)
+
+        self.assertEqual(run_worker(workers=0, once=True), 3)
+        grades = dict(HomeworkSubmission.objects.values_list('student__user__username', 'provisional_grade'))
+        self.assertEqual(grades, {'s0': 100, 's1': 50, 's2': 0})
+        self.assertFalse(HomeworkSubmission.objects.filter(is_graded=True).exists())
+
+        # one submission graded by hand keeps its grade
+        manual = HomeworkSubmission.objects.get(student=self.students[1])
+        manual.grade, manual.is_graded = 70, True
+        manual.save()
+
+        self.client.login(username='t', password='p')
+        resp = self.client.get(reverse('teacher_lesson_submissions', args=[self.lesson.id]))
+        self.assertContains(resp, 'Подтвердить автооценки (2)')
+        self.client.post(reverse('teacher_lesson_submissions', args=[self.lesson.id]), {'confirm_checks': '1'})
+        grades = dict(HomeworkSubmission.objects.values_list('student__user__username', 'grade'))
+        self.assertEqual(grades, {'s0': 100, 's1': 70, 's2': 0})
+        # the only lesson of the course is graded: certificates are issued in bulk too
+        self.assertEqual(Certificate.objects.filter(course=self.course).count(), 3)
+
+    def test_edited_answer_is_checked_again(self):
+        from .autocheck import confirm_provisional_grades, run_worker
+        from .models import LessonChecker
+        LessonChecker.objects.create(lesson=self.lesson, kind='python', expected=self.TESTS, points=100)
+        student = self.students[0]
+        self.client.login(username=student.user.username, password='p')
+        self.client.post(reverse('lesson_detail', args=[self.lesson.id]),
+                         {'content': 'def add(a, b):\n    return a + b\n'})
+        run_worker(workers=0, once=True)
+        sub = HomeworkSubmission.objects.get(student=student)
+        self.assertEqual((sub.check_status, sub.provisional_grade), ('done', 100))
+
+        self.client.post(reverse('submission_edit', args=[sub.id]), {'content': 'add = None'})
+        sub.refresh_from_db()
+        self.assertEqual((sub.check_status, sub.provisional_grade), ('queued', None))
+        # the grade of the old answer is not confirmed for the new one
+        self.assertEqual(confirm_provisional_grades(self.lesson), 0)
+        self.assertFalse(HomeworkSubmission.objects.get(pk=sub.pk).is_graded)
+
+    def test_only_claims_of_exited_workers_are_reset(self):
+        import subprocess
+        from . import autocheck
+        from .models import LessonChecker
+        LessonChecker.objects.create(lesson=self.lesson, kind='exact', expected='4', points=10)
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        workers = [f'{autocheck.HOST}:{os.getpid()}:live', f'{autocheck.HOST}:{exited.pid}:gone', 'elsewhere:1:x']
+        subs = [HomeworkSubmission.objects.create(student=student, lesson=self.lesson, content='4',
+                                                  check_status='running', check_worker=worker)
+                for student, worker in zip(self.students, workers)]
+
+        self.assertEqual(autocheck.reset_stale(), 1)
+        statuses = [HomeworkSubmission.objects.get(pk=s.pk).check_status for s in subs]
+        self.assertEqual(statuses, ['running', 'queued', 'running'])
+        # rows claimed by another worker are not written by this one
+        self.assertEqual(autocheck.check_batch([s.pk for s in subs]), 0)
+        self.assertEqual(autocheck.run_worker(workers=0, once=True), 1)
+        self.assertIsNone(HomeworkSubmission.objects.get(pk=subs[0].pk).provisional_grade)
+        self.assertEqual(HomeworkSubmission.objects.get(pk=subs[1].pk).provisional_grade, 10)
+
+        self.assertEqual(autocheck.reset_stale(everything=True), 2)
+
+
+class BatchGradingTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        self.teacher = User.objects.create_user(username='t', password='p', is_staff=True)
+        self.course = Course.objects.create(title='C', description='d', teacher=self.teacher)
+        self.lesson = Lesson.objects.create(course=self.course, title='L', content='c')
+        self.submissions = []
+        for i in range(40):
+            student = Student.objects.create(user=User.objects.create_user(username=f's{i}'))
+            self.submissions.append(HomeworkSubmission.objects.create(student=student, lesson=self.lesson,
+                                                                      content=f'answer {i}'))
+        other_teacher = User.objects.create_user(username='t2', password='p', is_staff=True)
+        other_lesson = Lesson.objects.create(course=Course.objects.create(title='X', description='d',
+                                                                          teacher=other_teacher),
+                                             title='X', content='c')
+        self.foreign = HomeworkSubmission.objects.create(student=self.submissions[0].student, lesson=other_lesson,
+                                                         content='x')
+        self.client.login(username='t', password='p')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def test_page_of_40_in_one_request(self):
+        url = reverse('teacher_lesson_submissions', args=[self.lesson.id]) + '?per_page=40'
+        resp = self.client.get(url)
+        self.assertEqual(len(resp.context['page_obj'].object_list), 40)
+        data = {'batch': '1'}
+        data.update({f'grade-{s.id}': str(50 + i) for i, s in enumerate(self.submissions)})
+        data[f'grade-{self.submissions[0].id}'] = ''  # left empty: not graded
+        resp = self.client.post(url, data)
+        self.assertRedirects(resp, url, fetch_redirect_response=False)
+        self.assertEqual(HomeworkSubmission.objects.filter(lesson=self.lesson, is_graded=True).count(), 39)
+        self.assertEqual(HomeworkSubmission.objects.get(pk=self.submissions[5].pk).grade, 55)
+        # the course has one lesson: everybody graded got a certificate, in the same request
+        self.assertEqual(Certificate.objects.filter(course=self.course).count(), 39)
+
+    def test_api_checks_ownership_for_the_whole_batch(self):
+        url = reverse('grades_api')
+        body = {'grades': [{'submission_id': s.id, 'grade': 90} for s in self.submissions[:3]]}
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(url, json.dumps(body), content_type='application/json')
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "lms_homeworksubmission"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(resp.json(), {'status': 'ok', 'submitted': 3, 'updated': 3})
+
+        body['grades'].append({'submission_id': self.foreign.id, 'grade': 10})
+        resp = self.client.post(url, json.dumps(body), content_type='application/json')
+        self.assertEqual(resp.status_code, 403)
+        self.assertFalse(HomeworkSubmission.objects.get(pk=self.foreign.pk).is_graded)
+
+        resp = self.client.post(url, json.dumps({'grades': [{'submission_id': self.submissions[0].id,
+                                                             'grade': 101}]}), content_type='application/json')
+        self.assertEqual(resp.status_code, 400)
+from django.conf import settings
+
+
+class CertificateMediaMixin:
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        os.makedirs(os.path.join(self.media, 'certificates', 'templates'))
+        shutil.copy(os.path.join(settings.BASE_DIR, 'media', 'certificates', 'templates', 'background.png'),
+                    os.path.join(self.media, 'certificates', 'templates', 'background.png'))
+        self.teacher = User.objects.create_user(username='t', password='p', is_staff=True)
+        self.course = Course.objects.create(title='Курс', description='d', teacher=self.teacher)
+        self.certs = [Certificate.objects.create(
+            student=Student.objects.create(user=User.objects.create_user(username=f's{i}', first_name='Иван')),
+            course=self.course) for i in range(3)]
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+
+class CertificateRenderingTests(CertificateMediaMixin, TestCase):
+    def test_vector_certificate(self):
+        cert = self.certs[0]
+        cert.generate_certificate_files()
+        cert.refresh_from_db()
+        path = os.path.join(self.media, cert.pdf_file.name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b'%PDF'))
+        self.assertIn(b'/DCTDecode', data)
+        self.assertIn(b'/FontFile2', data)  # Cyrillic name: TTF subset embedded
+        self.assertFalse(os.path.exists(os.path.join(os.path.dirname(path), f'certificate-{cert.id}.png')))
+
+    @override_settings(CERTIFICATE_RENDERER='raster')
+    def test_raster_certificate(self):
+        cert = self.certs[0]
+        cert.generate_certificate_files()
+        cert.refresh_from_db()
+        self.assertEqual(cert.pdf_file.name, f'certificates/generated/certificate-{cert.id}.pdf')
+        # the intermediate PNG is not left behind
+        self.assertEqual(os.listdir(os.path.join(self.media, 'certificates', 'generated')),
+                         [f'certificate-{cert.id}.pdf'])
+
+    def test_course_pdf_shares_the_background(self):
+        self.client.login(username='t', password='p')
+        resp = self.client.get(reverse('course_certificates_pdf', args=[self.course.id]))
+        self.assertEqual(resp['Content-Type'], 'application/pdf')
+        data = resp.content
+        self.assertEqual(data.count(b'/Type /Page\n'), 3)
+        self.assertEqual(data.count(b'/Subtype /Image'), 1)
+
+        User.objects.create_user(username='t2', password='p', is_staff=True)
+        self.client.login(username='t2', password='p')
+        resp = self.client.get(reverse('course_certificates_pdf', args=[self.course.id]))
+        self.assertEqual(resp.status_code, 403)
+
+
+class CertificateExportTests(CertificateMediaMixin, TestCase):
+    def read_zip(self, resp):
+        import io
+        import zipfile
+        self.assertFalse(hasattr(resp, 'content'))  # streamed, not buffered
+        return zipfile.ZipFile(io.BytesIO(b''.join(resp.streaming_content)))
+
+    def test_zip_renders_missing_pdfs(self):
+        self.certs[0].generate_certificate_files()
+        self.client.login(username='t', password='p')
+        with override_settings(CERTIFICATE_EXPORT_WORKERS=1, CERTIFICATE_EXPORT_BATCH=2):
+            resp = self.client.get(reverse('course_certificates_zip', args=[self.course.id]))
+            archive = self.read_zip(resp)
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(len(archive.namelist()), 3)
+        self.assertTrue(all(name.startswith('s') and name.endswith('.pdf') for name in archive.namelist()))
+        for cert in Certificate.objects.filter(course=self.course):
+            self.assertEqual(cert.pdf_file.name, f'certificates/generated/certificate-{cert.id}.pdf')
+        for cert in Certificate.objects.filter(course=self.course):
+            with open(os.path.join(self.media, cert.pdf_file.name), 'rb') as f:
+                self.assertEqual(archive.read(f's{self.certs.index(cert)}-{cert.certificate_id}.pdf'), f.read())
+
+    def test_zip_stream_is_chunked(self):
+        from lms import zipstream
+        path = os.path.join(self.media, 'big.bin')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(300 * 1024))
+        chunks = list(zipstream.stream_zip([('a.bin', path, (2024, 1, 1, 0, 0, 0)),
+                                            ('b.bin', path, (2024, 1, 1, 0, 0, 0))], chunk_size=64 * 1024))
+        self.assertGreater(len(chunks), 8)
+        self.assertLess(max(len(c) for c in chunks), 65 * 1024)
+        import io
+        import zipfile
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        with open(path, 'rb') as f:
+            self.assertEqual(archive.read('b.bin'), f.read())
+
+    def test_zip_is_streamed_under_asgi(self):
+        import io
+        import zipfile
+        from asgiref.sync import async_to_sync
+        self.async_client.force_login(User.objects.get(username='t'))
+        pulled = []
+
+        def archive(course):
+            for i in range(3):
+                pulled.append(i)
+                yield b'chunk'
+
+        async def first_chunk_then_rest():
+            resp = await self.async_client.get(reverse('course_certificates_zip', args=[self.course.id]))
+            self.assertTrue(resp.is_async)
+            chunks = aiter(resp.streaming_content)
+            first = await anext(chunks)
+            self.assertEqual(pulled, [0])  # sent before the rest is built
+            return [first] + [chunk async for chunk in chunks]
+
+        with patch('lms.certificates.course_archive', archive):
+            self.assertEqual(async_to_sync(first_chunk_then_rest)(), [b'chunk'] * 3)
+
+        async def whole():
+            resp = await self.async_client.get(reverse('course_certificates_zip', args=[self.course.id]))
+            return b''.join([chunk async for chunk in resp.streaming_content])
+        self.certs[0].generate_certificate_files()
+        with override_settings(CERTIFICATE_EXPORT_WORKERS=0):
+            self.assertEqual(len(zipfile.ZipFile(io.BytesIO(async_to_sync(whole)())).namelist()), 3)
+
+    def test_zip_only_for_the_course_teacher(self):
+        User.objects.create_user(username='t2', password='p', is_staff=True)
+        self.client.login(username='t2', password='p')
+        resp = self.client.get(reverse('course_certificates_zip', args=[self.course.id]))
+        self.assertEqual(resp.status_code, 403)
+
+
+class MediaGCTests(CertificateMediaMixin, TestCase):
+    def write(self, name, data=b'x'):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def test_regenerating_does_not_copy(self):
+        cert = self.certs[0]
+        cert.generate_certificate_files()
+        Certificate.objects.filter(pk=cert.pk).update(pdf_file='')
+        Certificate.objects.get(pk=cert.pk).generate_certificate_files()
+        self.assertEqual(os.listdir(os.path.join(self.media, 'certificates', 'generated')),
+                         [f'certificate-{cert.id}.pdf'])
+
+    def test_find_and_collect(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from lms import mediagc
+        first, second = self.certs[:2]
+        # the copy Django's storage used to make, referenced by the record
+        self.write(f'certificates/generated/certificate-{first.id}.pdf', b'pdf one')
+        self.write(f'certificates/generated/certificate-{first.id}_ijzpmJV.pdf', b'pdf one')
+        Certificate.objects.filter(pk=first.pk).update(pdf_file=f'certificates/generated/certificate-{first.id}_ijzpmJV.pdf')
+        self.write(f'certificates/generated/certificate-{second.id}.pdf', b'pdf two')
+        Certificate.objects.filter(pk=second.pk).update(pdf_file=f'certificates/generated/certificate-{second.id}.pdf')
+        self.write(f'certificates/generated/certificate-{second.id}.png', b'png')
+        self.write('submissions/2025/old.docx', b'old')
+        self.write('avatars/ab/' + 'ab' * 32 + '/36.png', b'avatar')
+
+        findings = {f.name: f for f in mediagc.find(min_age=0)}
+        self.assertEqual(findings[f'certificates/generated/certificate-{first.id}_ijzpmJV.pdf'].keep,
+                         f'certificates/generated/certificate-{first.id}.pdf')
+        self.assertEqual(findings[f'certificates/generated/certificate-{second.id}.png'].reason, mediagc.PNG)
+        self.assertEqual(findings['submissions/2025/old.docx'].reason, mediagc.ORPHAN)
+        self.assertEqual(findings['avatars/ab/' + 'ab' * 32 + '/36.png'].reason, mediagc.ORPHAN)
+        self.assertEqual(len(findings), 4)  # the template and the referenced PDFs stay
+        self.assertEqual(mediagc.find(min_age=3600), [])  # everything is too new
+
+        out = StringIO()
+        call_command('media_gc', '--dry-run', '--min-age=0', stdout=out)
+        self.assertIn('1 duplicate', out.getvalue())
+        self.assertEqual(len(mediagc.find(min_age=0)), 4)
+
+        quarantine = os.path.join(self.media, '..', os.path.basename(self.media) + '-quarantine')
+        self.addCleanup(shutil.rmtree, quarantine, True)
+        call_command('media_gc', '--min-age=0', f'--quarantine={quarantine}', stdout=StringIO())
+        self.assertEqual(mediagc.find(min_age=0), [])
+        self.assertTrue(os.path.exists(os.path.join(quarantine, 'submissions', '2025', 'old.docx')))
+        self.assertEqual(Certificate.objects.get(pk=first.pk).pdf_file.name,
+                         f'certificates/generated/certificate-{first.id}.pdf')
+        self.assertTrue(os.path.exists(os.path.join(self.media, 'certificates', 'templates', 'background.png')))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        from lms import metrics
+        self.metrics = metrics
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def value(self, text, line_start):
+        for line in text.splitlines():
+            if line.startswith(line_start + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_scrape(self):
+        teacher = User.objects.create_user(username='t', password='p', is_staff=True)
+        Course.objects.create(title='C', description='d', teacher=teacher)
+        with override_settings(METRICS_TOKEN='scrape'):
+            before = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').content.decode()
+            for _ in range(3):
+                self.client.get(reverse('course_list'))
+            resp = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(resp['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = resp.content.decode()
+        requests = 'lms_http_requests_total{method="GET",status="200",view="course_list"}'
+        self.assertEqual(self.value(text, requests) - self.value(before, requests), 3)
+        count = 'lms_http_request_duration_seconds_count{view="course_list"}'
+        self.assertEqual(self.value(text, count) - self.value(before, count), 3)
+        self.assertIn('lms_http_request_duration_seconds_bucket{view="course_list",le="+Inf"}', text)
+        self.assertGreater(self.value(text, 'lms_db_queries_total{view="course_list"}'), 0)
+        self.assertIn('lms_queue_depth{queue="autocheck_queued"} 0', text)
+
+    def test_scrape_needs_token_or_superuser(self):
+        # a request relayed by a local reverse proxy comes from 127.0.0.1 too
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        resp = self.client.get('/metrics', REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(resp.status_code, 403)
+        with override_settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+        User.objects.create_superuser(username='root', password='p', email='root@example.com')
+        self.client.login(username='root', password='p')
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_threads_and_processes_are_summed(self):
+        import threading
+        m = self.metrics
+        threads = [threading.Thread(target=lambda: [m.inc('lms_cache_requests_total', cache='t', result='hit')
+                                                    for _ in range(1000)]) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        counters, _ = m.snapshot()
+        self.assertEqual(counters[('lms_cache_requests_total', (('cache', 't'), ('result', 'hit')))], 4000)
+        # the shards of exited threads were folded into the process aggregate and dropped
+        self.assertLessEqual(len(m._shards), 1)
+
+        with override_settings(METRICS_DIR=self.dir):
+            # a snapshot left by another worker process
+            with open(os.path.join(self.dir, '999999-abcd.json'), 'w') as f:
+                json.dump({'counters': [['lms_cache_requests_total', [['cache', 't'], ['result', 'hit']], 5]],
+                           'histograms': [['lms_certificate_render_seconds', [['renderer', 'vector']],
+                                           [1] + [0] * (len(m.BUCKETS) + 1) + [0.004]]]}, f)
+            text = m.render()
+        self.assertIn('lms_cache_requests_total{cache="t",result="hit"} 4005', text)
+        self.assertIn('lms_certificate_render_seconds_bucket{renderer="vector",le="0.005"} 1', text)
+        # the exited worker's file was folded into the aggregate: counted once, not kept
+        self.assertNotIn('999999-abcd.json', os.listdir(self.dir))
+        with override_settings(METRICS_DIR=self.dir):
+            self.assertIn('lms_cache_requests_total{cache="t",result="hit"} 4005', m.render())
+
+
+class DeadlineFieldsTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='fteach', password='t', is_staff=True)
+        self.course = Course.objects.create(title='C', description='d', teacher=self.teacher)
+        self.lesson = Lesson.objects.create(course=self.course, title='L', content='c')
+        self.student_user = User.objects.create_user(username='fstud', password='p')
+        Student.objects.create(user=self.student_user).courses.add(self.course)
+        self.deadline = Deadline.objects.create(title='Эссе', description='Длинное описание ' * 20,
+                                                due_at='2030-01-01T12:00:00', lesson=self.lesson,
+                                                created_by=self.teacher)
+        self.client.login(username='fstud', password='p')
+
+    def _deadline_select(self, queries):
+        return next(q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'FROM "lms_deadline"' in q['sql'])
+
+    def test_selected_fields_only_are_fetched(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('deadlines_api'), {'fields': 'id,title,due_at'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'deadlines': [
+            {'id': self.deadline.id, 'title': 'Эссе', 'due_at': '2030-01-01T12:00:00'}]})
+        sql = self._deadline_select(ctx.captured_queries)
+        self.assertEqual(sql.split(' FROM ')[0],
+                         'SELECT "lms_deadline"."id", "lms_deadline"."title", "lms_deadline"."due_at"')
+        self.assertNotIn('auth_user', sql)
+
+    def test_related_field_joins_only_its_table(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('deadlines_api'), {'fields': 'title,lesson_title'})
+        self.assertEqual(response.json()['deadlines'], [{'title': 'Эссе', 'lesson_title': 'L'}])
+        sql = self._deadline_select(ctx.captured_queries)
+        self.assertIn('"lms_lesson"', sql)
+        self.assertNotIn('auth_user', sql)
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('deadlines_api'), {'fields': 'title,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_columns_format(self):
+        response = self.client.get(reverse('deadlines_api'), {'fields': 'id,title'},
+                                   HTTP_ACCEPT='application/vnd.lms.columns+json')
+        self.assertEqual(response['Content-Type'], 'application/vnd.lms.columns+json')
+        self.assertIn('Accept', response['Vary'])
+        self.assertEqual(json.loads(response.content),
+                         {'fields': ['id', 'title'], 'deadlines': [[self.deadline.id, 'Эссе']]})
+
+    @override_settings(API_GZIP_MIN_BYTES=200)
+    def test_large_responses_are_gzipped(self):
+        import gzip
+
+        response = self.client.get(reverse('deadlines_api'), HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content))['deadlines'][0]['id'], self.deadline.id)
+        small = self.client.get(reverse('deadlines_api'), {'fields': 'id'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+        plain = self.client.get(reverse('deadlines_api'))
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+    def test_detail_fields_keep_enrollment_check(self):
+        url = reverse('deadline_detail_api', args=[self.deadline.id])
+        response = self.client.get(url, {'fields': 'title'})
+        self.assertEqual(response.json(), {'title': 'Эссе'})
+        self.student_user.student_profile.courses.clear()
+        self.assertEqual(self.client.get(url, {'fields': 'title'}).status_code, 403)
+
+    def test_msgpack_format(self):
+        from . import api
+
+        response = self.client.get(reverse('deadlines_api'), {'fields': 'id', 'format': 'msgpack'})
+        if api.msgpack is None:
+            self.assertEqual(response.status_code, 400)
+            return
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(api.msgpack.unpackb(response.content), {'fields': ['id'], 'deadlines': [[self.deadline.id]]})
+
+
+from django.utils import timezone
+from . import grading
+
+
+class BootstrapTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()  # bundles are keyed by student id, which the test database reuses
+        self.teacher = User.objects.create_user(username='bteach', password='t', is_staff=True)
+        self.course = Course.objects.create(title='Алгоритмы', description='d', teacher=self.teacher)
+        self.lessons = [Lesson.objects.create(course=self.course, title=f'L{i}', content='c') for i in range(2)]
+        self.user = User.objects.create_user(username='bstud', password='p')
+        self.student = Student.objects.create(user=self.user)
+        self.student.courses.add(self.course)
+        self.submission = HomeworkSubmission.objects.create(student=self.student, lesson=self.lessons[0], content='x')
+        now = timezone.now()
+        self.upcoming = Deadline.objects.create(title='Скоро', due_at=now + timezone.timedelta(hours=1),
+                                                lesson=self.lessons[1])
+        Deadline.objects.create(title='Прошёл', due_at=now - timezone.timedelta(hours=1), lesson=self.lessons[1])
+        other = Course.objects.create(title='Other', description='d', teacher=self.teacher)
+        Deadline.objects.create(title='Чужой', due_at=now + timezone.timedelta(hours=2),
+                                lesson=Lesson.objects.create(course=other, title='O', content='c'))
+        self.client.login(username='bstud', password='p')
+        self.url = reverse('bootstrap_api')
+
+    def _rows(self, data, table):
+        return [dict(zip(data[table]['fields'], row)) for row in data[table]['rows']]
+
+    def test_bundle_contents(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([c['title'] for c in self._rows(data, 'courses')], ['Алгоритмы'])
+        self.assertEqual([l['title'] for l in self._rows(data, 'lessons')], ['L0', 'L1'])
+        self.assertEqual(self._rows(data, 'submissions'),
+                         [{'id': self.submission.id, 'lesson_id': self.lessons[0].id, 'status': 'submitted', 'grade': None}])
+        self.assertEqual([d['title'] for d in self._rows(data, 'deadlines')], ['Скоро'])
+        self.assertEqual(data['certificates']['rows'], [])
+
+    def test_query_count_does_not_grow_with_data(self):
+        avatars.avatar_url(self.student.user)  # create the avatar: the queries below are the bundle's
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url)
+        for i in range(3):
+            course = Course.objects.create(title=f'More {i}', description='d', teacher=self.teacher)
+            self.student.courses.add(course)
+            for j in range(3):
+                lesson = Lesson.objects.create(course=course, title=f'M{j}', content='c')
+                HomeworkSubmission.objects.create(student=self.student, lesson=lesson, content='y')
+                Deadline.objects.create(title='D', due_at=timezone.now() + timezone.timedelta(days=1), lesson=lesson)
+        with CaptureQueriesContext(connection) as large:  # the changes bumped the bundle's version
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.json()['lessons']['rows']), 11)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_revalidation_until_data_changes(self):
+        first = self.client.get(self.url)
+        etag = first['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertFalse(any('lms_homeworksubmission' in q['sql'] for q in ctx.captured_queries))
+
+        # batch grading updates rows without signals and bumps the version itself
+        grading.apply_grades(self.teacher, {self.submission.id: 90})
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual(self._rows(changed.json(), 'submissions')[0]['grade'], 90)
+
+    def test_signals_bump_the_version(self):
+        def version():
+            return Student.objects.get(id=self.student.id).bootstrap_version
+
+        before = version()
+        HomeworkSubmission.objects.create(student=self.student, lesson=self.lessons[1], content='z')
+        self.assertGreater(version(), before)
+        before = version()
+        self.upcoming.title = 'Перенесён'
+        self.upcoming.save()
+        self.assertGreater(version(), before)
+        before = version()
+        self.course.students_set.remove(self.student)
+        self.assertGreater(version(), before)
+
+    def test_passed_deadline_rebuilds_the_bundle(self):
+        from unittest import mock
+
+        etag = self.client.get(self.url)['ETag']
+        later = timezone.now() + timezone.timedelta(hours=3)
+        with mock.patch('lms.bootstrap.timezone.now', return_value=later):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['deadlines']['rows'], [])
+
+    def test_teacher_is_refused(self):
+        self.client.login(username='bteach', password='t')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+from datetime import datetime
+from .models import ArchivedDeadline, LessonChecker, StoredFile
+from . import cloning
+
+
+class CourseCloneTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='cteach', password='t', is_staff=True)
+        self.course = Course.objects.create(title='Python', description='Осенний семестр', teacher=self.teacher)
+        self.stored = StoredFile.objects.create(sha256='a' * 64, file='uploads/x.pdf', size=3, original_name='x.pdf')
+        lessons = Lesson.objects.bulk_create(
+            Lesson(course=self.course, title=f'Урок {i}', content='Текст урока ' * (i + 1),
+                   attachment=self.stored if i % 10 == 0 else None) for i in range(100))
+        LessonChecker.objects.create(lesson=lessons[0], kind='exact', expected='42', points=80)
+        self.due = timezone.make_aware(datetime(2030, 9, 1, 12)) if settings.USE_TZ else datetime(2030, 9, 1, 12)
+        Deadline.objects.bulk_create(
+            Deadline(title=f'Дедлайн {i}', due_at=self.due + timezone.timedelta(days=i % 30),
+                     lesson=lessons[i % 100], created_by=self.teacher) for i in range(300))
+
+    def test_clone_copies_lessons_checkers_and_shifted_deadlines(self):
+        with self.assertNumQueries(12):
+            result = cloning.clone_course(self.course, title='Python, весна', shift=timezone.timedelta(days=182))
+        clone = result.course
+        self.assertEqual((result.lessons, result.checkers, result.deadlines), (100, 1, 300))
+        self.assertEqual(clone.title, 'Python, весна')
+        lessons = list(clone.lessons.order_by('id'))
+        self.assertEqual([l.title for l in lessons], [f'Урок {i}' for i in range(100)])
+        self.assertEqual(lessons[3].content, 'Текст урока ' * 4)
+        self.assertEqual(lessons[10].attachment_id, self.stored.id)
+        self.assertEqual(StoredFile.objects.count(), 1)
+        self.assertEqual(lessons[0].checker.points, 80)
+        first = Deadline.objects.filter(lesson__course=clone).order_by('due_at', 'id').first()
+        self.assertEqual(first.due_at, self.due + timezone.timedelta(days=182))
+        self.assertEqual(first.lesson.course_id, clone.id)
+        # the source is untouched
+        self.assertEqual(Deadline.objects.filter(lesson__course=self.course).count(), 300)
+
+    def test_archived_deadlines_are_cloned(self):
+        lesson = self.course.lessons.order_by('id').first()
+        Deadline.objects.all().delete()
+        ArchivedDeadline.objects.create(id=1, title='Старый', due_at=self.due, course_id=self.course.id,
+                                        lesson_id=lesson.id, created_at=self.due)
+        Course.objects.filter(id=self.course.id).update(archived_at=timezone.now())
+        self.course.refresh_from_db()
+        result = cloning.clone_course(self.course, shift=timezone.timedelta(days=7))
+        self.assertEqual(list(Deadline.objects.filter(lesson__course=result.course).values_list('title', 'due_at')),
+                         [('Старый', self.due + timezone.timedelta(days=7))])
+
+    def test_clone_view(self):
+        url = reverse('course_clone', args=[self.course.id])
+        other = User.objects.create_user(username='cother', password='t', is_staff=True)
+        self.client.login(username='cother', password='t')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.login(username='cteach', password='t')
+        self.assertContains(self.client.get(url), 'value="182"')
+        response = self.client.post(url, {'title': 'Копия', 'shift_days': 14})
+        clone = Course.objects.get(title='Копия')
+        self.assertRedirects(response, reverse('teacher_course_detail', args=[clone.id]))
+        self.assertEqual(clone.teacher, self.teacher)
+        self.assertEqual(clone.lessons.count(), 100)
+        self.assertFalse(Course.objects.filter(teacher=other).exists())
+
+    def test_command(self):
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('clone_course', self.course.id, '--shift-days', '0', '--title', 'Из консоли', stdout=out)
+        self.assertIn('100 lessons, 1 checkers, 300 deadlines', out.getvalue())
+        self.assertEqual(Deadline.objects.filter(lesson__course__title='Из консоли', due_at=self.due).count(), 10)
+
+
+from .models import DeletionJob
+from . import deletion
+
+
+@override_settings(DELETION_PAUSE_SECONDS=0)
+class BackgroundDeletionTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)
+        self.override.enable()
+        self.teacher = User.objects.create_user(username='dteach', password='t', is_staff=True)
+        self.course = Course.objects.create(title='Удаляемый', description='d', teacher=self.teacher)
+        self.lessons = [Lesson.objects.create(course=self.course, title=f'L{i}', content='c') for i in range(3)]
+        self.files = [self._stored(i) for i in range(2)]
+        self.lessons[0].attachment = self.files[0]
+        self.lessons[0].save()
+        self.students = [Student.objects.create(user=User.objects.create_user(username=f'ds{i}', password='p'))
+                         for i in range(10)]
+        for student in self.students:
+            student.courses.add(self.course)
+            self.course.students.add(student)
+            for lesson in self.lessons:
+                HomeworkSubmission.objects.create(student=student, lesson=lesson, content='answer',
+                                                  attachment=self.files[1] if lesson is self.lessons[1] else None)
+        self.deadline = Deadline.objects.create(title='DL', due_at='2030-01-01T12:00:00', lesson=self.lessons[0],
+                                                created_by=self.teacher)
+        self.cert = Certificate.objects.create(student=self.students[0], course=self.course)
+        self.cert.pdf_file.name = self._media_file(f'certificates/generated/certificate-{self.cert.id}.pdf')
+        self.cert.save()
+        # the same StoredFile attached in another course stays
+        other = Course.objects.create(title='Другой', description='d', teacher=self.teacher)
+        Lesson.objects.create(course=other, title='O', content='c', attachment=self.files[1])
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def _media_file(self, name):
+        path = os.path.join(self.media, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'data')
+        return name
+
+    def _stored(self, i):
+        name = self._media_file(f'uploads/{i}/file{i}.pdf')
+        return StoredFile.objects.create(sha256=str(i) * 64, file=name, size=4, original_name=f'file{i}.pdf')
+
+    def test_course_is_hidden_at_once_and_deleted_in_batches(self):
+        job = deletion.schedule_course(self.course, requested_by=self.teacher)
+        self.assertFalse(Course.objects.filter(id=self.course.id).exists())
+        self.assertTrue(Course.all_objects.filter(id=self.course.id).exists())
+        self.assertEqual(list(self.students[0].courses.all()), [])
+        self.assertEqual(self.client.get(reverse('course_detail', args=[self.course.id])).status_code, 404)
+        self.assertEqual(HomeworkSubmission.objects.count(), 30)  # nothing deleted yet
+        self.assertEqual(job.total, 1 + 30 + 1 + 3 + 10 + 10 + 1)
+        # its deadlines leave the calendars and the API at once too
+        from .repositories import get_all_deadlines
+        self.assertFalse(get_all_deadlines().filter(id=self.deadline.id).exists())
+        self.assertTrue(Deadline.all_objects.filter(id=self.deadline.id).exists())
+        self.client.force_login(self.teacher)
+        self.assertEqual(self.client.get(reverse('deadline_detail_api', args=[self.deadline.id])).status_code, 404)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(deletion.run_job(job, batch_size=7))
+        deletes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('DELETE FROM "lms_homeworksubmission"')]
+        self.assertEqual(len(deletes), 5)  # 30 rows, 7 per transaction
+
+        self.assertFalse(Course.all_objects.filter(id=self.course.id).exists())
+        self.assertFalse(HomeworkSubmission.objects.exists())
+        self.assertFalse(Deadline.all_objects.exists())
+        self.assertFalse(Certificate.objects.exists())
+        self.assertFalse(Student.courses.through.objects.exists())
+        self.assertEqual(Student.objects.count(), 10)
+        job.refresh_from_db()
+        self.assertEqual((job.deleted, job.progress), (job.total, 100))
+        # the certificate and the attachment only this course used are gone, the shared one stays
+        self.assertFalse(os.path.exists(os.path.join(self.media, self.cert.pdf_file.name)))
+        self.assertFalse(StoredFile.objects.filter(id=self.files[0].id).exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media, self.files[0].file.name)))
+        self.assertTrue(os.path.exists(os.path.join(self.media, self.files[1].file.name)))
+        self.assertEqual(job.files_removed, 2)
+
+    def test_user_deletion(self):
+        colleague = User.objects.create_user(username='dcol', password='t', is_staff=True)
+        kept = Course.objects.create(title='Чужой', description='d', teacher=colleague)
+        kept_lesson = Lesson.objects.create(course=kept, title='K', content='c')
+        foreign = Deadline.objects.create(title='F', due_at='2030-01-01T12:00:00', lesson=kept_lesson,
+                                          created_by=self.teacher)
+        job = deletion.schedule_user(self.teacher)
+        self.teacher.refresh_from_db()
+        self.assertFalse(self.teacher.is_active)
+        self.assertFalse(Course.objects.filter(teacher=self.teacher).exists())
+        self.assertTrue(deletion.run_job(job, batch_size=50))
+        self.assertFalse(User.objects.filter(id=self.teacher.id).exists())
+        self.assertEqual(list(Course.all_objects.all()), [kept])
+        foreign.refresh_from_db()
+        self.assertIsNone(foreign.created_by)
+
+    def test_admin_delete_schedules_a_job(self):
+        User.objects.create_superuser(username='droot', password='r', email='r@example.com')
+        self.client.login(username='droot', password='r')
+        url = reverse('admin:lms_course_delete', args=[self.course.id])
+        self.assertContains(self.client.get(url), 'Удаляемый')
+        self.client.post(url, {'post': 'yes'})
+        job = DeletionJob.objects.get(kind=DeletionJob.COURSE, object_id=self.course.id)
+        self.assertEqual(HomeworkSubmission.objects.count(), 30)
+        self.assertContains(self.client.get(reverse('admin:lms_deletionjob_changelist')), '0%')
+
+        from io import StringIO
+        from django.core.management import call_command
+
+        out = StringIO()
+        call_command('run_deletions', '--once', stdout=out)
+        self.assertIn('1 deletions finished', out.getvalue())
+        job.refresh_from_db()
+        self.assertIsNotNone(job.finished_at)
+        self.assertFalse(HomeworkSubmission.objects.exists())
+
+
+from io import StringIO
+from django.core.management import call_command
+from .models import CourseGrade
+from . import archive, autocheck, coursegrades
+
+
+class CourseGradeTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media)  # certificates of completed courses
+        self.override.enable()
+        self.teacher = User.objects.create_user(username='gteach', password='t', is_staff=True)
+        self.course = Course.objects.create(title='Взвешенный', description='d', teacher=self.teacher)
+        self.lessons = [Lesson.objects.create(course=self.course, title=f'L{i}', content='c', weight=weight)
+                        for i, weight in enumerate((1, 3, 2))]
+        self.students = []
+        for i in range(3):
+            student = Student.objects.create(user=User.objects.create_user(username=f'gs{i}', password='p'))
+            student.courses.add(self.course)
+            self.course.students.add(student)
+            self.students.append(student)
+        self.subs = {(s.id, l.id): HomeworkSubmission.objects.create(student=s, lesson=l, content='a')
+                     for s in self.students for l in self.lessons}
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media, ignore_errors=True)
+
+    def _grade(self, student, lesson, grade):
+        sub = HomeworkSubmission.objects.get(id=self.subs[student.id, lesson.id].id)
+        sub.grade, sub.is_graded = grade, True
+        sub.save()
+
+    def _row(self, student):
+        g = CourseGrade.objects.get(student=student, course=self.course)
+        return g.weighted_sum, g.weight_total, g.graded_count, g.final_grade
+
+    def test_saves_move_the_aggregate_by_deltas(self):
+        student = self.students[0]
+        self._grade(student, self.lessons[0], 60)
+        self._grade(student, self.lessons[1], 100)
+        self.assertEqual(self._row(student), (360, 4, 2, 90.0))
+        with CaptureQueriesContext(connection) as ctx:
+            self._grade(student, self.lessons[1], 80)  # regrade: +(80-100)*3
+        grade_sql = [q['sql'] for q in ctx.captured_queries if 'lms_coursegrade' in q['sql']]
+        self.assertTrue(grade_sql[0].startswith('UPDATE'))
+        self.assertFalse([q for q in ctx.captured_queries if 'SUM(' in q['sql']])  # no recomputation
+        self.assertEqual(self._row(student), (300, 4, 2, 75.0))
+        # saving without a grade change does not touch the row
+        with CaptureQueriesContext(connection) as ctx:
+            sub = HomeworkSubmission.objects.get(id=self.subs[student.id, self.lessons[1].id].id)
+            sub.content = 'edited'
+            sub.save()
+        self.assertFalse([q for q in ctx.captured_queries if 'lms_coursegrade' in q['sql']])
+        HomeworkSubmission.objects.get(id=self.subs[student.id, self.lessons[0].id].id).delete()
+        self.assertEqual(self._row(student), (240, 3, 1, 80.0))
+        self.assertEqual(coursegrades.check(), [])
+
+    def test_bulk_grading_and_confirmed_autocheck(self):
+        grades = {self.subs[s.id, self.lessons[1].id].id: 50 + 10 * i for i, s in enumerate(self.students)}
+        grading.apply_grades(self.teacher, grades)
+        self.assertEqual([self._row(s)[3] for s in self.students], [50.0, 60.0, 70.0])
+        HomeworkSubmission.objects.filter(lesson=self.lessons[2]).update(check_status='done', provisional_grade=100)
+        autocheck.confirm_provisional_grades(self.lessons[2])
+        self.assertEqual(self._row(self.students[0]), (350, 5, 2, 70.0))
+        self.assertEqual(coursegrades.check(), [])
+
+    def test_weight_change_recomputes_the_course(self):
+        for student in self.students[:2]:
+            self._grade(student, self.lessons[0], 100)
+            self._grade(student, self.lessons[1], 0)
+        lesson = Lesson.objects.get(id=self.lessons[1].id)
+        lesson.weight = 1
+        lesson.save()
+        self.assertEqual(self._row(self.students[1]), (100, 2, 2, 50.0))
+        self.assertEqual(coursegrades.check(), [])
+
+    def test_archiving_keeps_the_grades(self):
+        self._grade(self.students[0], self.lessons[2], 90)
+        archive.archive_course(self.course)
+        self.assertFalse(HomeworkSubmission.objects.filter(lesson__course=self.course).exists())
+        self.assertEqual(self._row(self.students[0]), (180, 2, 1, 90.0))
+        self.assertEqual(coursegrades.check(), [])
+
+    def test_checker_reports_and_repairs_drift(self):
+        self._grade(self.students[0], self.lessons[0], 70)
+        self._grade(self.students[1], self.lessons[0], 40)
+        CourseGrade.objects.filter(student=self.students[0]).update(weighted_sum=1, final_grade=1)
+        CourseGrade.objects.filter(student=self.students[1]).delete()
+        CourseGrade.objects.create(student=self.students[2], course=self.course, weighted_sum=5, weight_total=1,
+                                   graded_count=1, final_grade=5)
+        out = StringIO()
+        call_command('check_course_grades', stdout=out)
+        self.assertIn('3 drifted course grades found', out.getvalue())
+        self.assertEqual(CourseGrade.objects.get(student=self.students[0]).weighted_sum, 1)  # report only
+        call_command('check_course_grades', '--repair', stdout=out)
+        self.assertEqual(self._row(self.students[0]), (70, 1, 1, 70.0))
+        self.assertEqual(self._row(self.students[1]), (40, 1, 1, 40.0))
+        self.assertFalse(CourseGrade.objects.filter(student=self.students[2]).exists())
+        self.assertEqual(coursegrades.check(), [])
+
+    def test_dashboards_show_and_sort_by_course_grade(self):
+        for student, grade in zip(self.students, (70, 95)):
+            self._grade(student, self.lessons[0], grade)
+        self.client.login(username='gteach', password='t')
+        response = self.client.get(reverse('teacher_course_detail', args=[self.course.id]) + '?sort=-grade')
+        self.assertEqual([s.user.username for s in response.context['students']], ['gs1', 'gs0', 'gs2'])
+        self.assertContains(response, '<strong>95.0</strong>')
+        response = self.client.get(reverse('teacher_dashboard'))
+        self.assertEqual(response.context['courses_data'][0]['average_grade'], 82.5)
+        self.client.login(username='gs0', password='p')
+        response = self.client.get(reverse('student_dashboard'))
+        self.assertEqual(response.context['courses_data'][0]['grade'].final_grade, 70.0)
+        self.assertContains(response, 'Итоговая оценка')
+
+
+import random
+from unittest.mock import patch
+from .models import Leaderboard, LeaderboardChange
+from . import leaderboard
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        leaderboard.reset()  # ids are reused between tests
+        self.teacher = User.objects.create_user(username='lteach', password='t', is_staff=True)
+        self.course = Course.objects.create(title='Рейтинг', description='d', teacher=self.teacher)
+        self.lesson = Lesson.objects.create(course=self.course, title='L', content='c')
+        self.students = []
+        for i in range(6):
+            student = Student.objects.create(user=User.objects.create_user(username=f'ls{i}', password='p'))
+            student.courses.add(self.course)
+            self.course.students.add(student)
+            self.students.append(student)
+        self.subs = [HomeworkSubmission.objects.create(student=s, lesson=self.lesson, content='a')
+                     for s in self.students]
+
+    def _grade(self, i, grade):
+        sub = HomeworkSubmission.objects.get(id=self.subs[i].id)
+        sub.grade, sub.is_graded = grade, True
+        with patch.object(Certificate, 'generate_certificate_files'):  # one lesson: every grade completes the course
+            sub.save()
+
+    def test_ranking_matches_sorting(self):
+        rng = random.Random(7)
+        grades = [rng.randrange(0, 1001) / 10 for _ in range(500)]
+        ranking = leaderboard.Ranking()
+        for grade in grades:
+            ranking.add(grade)
+        for grade in grades[:50]:
+            self.assertEqual(ranking.rank(grade), 1 + sum(g > grade for g in grades))
+        # loaded from stored counts, then moved
+        copy = leaderboard.Ranking(ranking.sparse_counts())
+        copy.move(grades[1], 100.0)
+        grades[1] = 100.0
+        for grade in grades[:50]:
+            self.assertEqual(copy.rank(grade), 1 + sum(g > grade for g in grades))
+        self.assertEqual((copy.total, leaderboard.bucket(70.3)), (500, 703))
+
+    def test_ranks_follow_grade_changes(self):
+        for i, grade in enumerate((70, 95, 70, 40)):
+            self._grade(i, grade)
+        self.assertEqual(leaderboard.standing(self.course.id, self.students[0].id), (2, 4, 70.0))
+        self.assertIsNone(leaderboard.standing(self.course.id, self.students[5].id))
+        top = leaderboard.top(self.course.id, 3)
+        self.assertEqual([(p.rank, p.student.id) for p in top],
+                         [(1, self.students[1].id), (2, self.students[0].id), (2, self.students[2].id)])
+        # the built ranking is updated from the log: two small queries, no grade scan
+        self._grade(3, 99)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(leaderboard.standing(self.course.id, self.students[0].id).rank, 3)
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertEqual(LeaderboardChange.objects.count(), 5)
+
+    def test_persist_stores_counts_and_prunes_the_log(self):
+        for i, grade in enumerate((70, 95, 60)):
+            self._grade(i, grade)
+        self.assertEqual(leaderboard.standing(self.course.id, self.students[2].id).rank, 3)
+        # removed without a log entry: dropped by the rebuild
+        CourseGrade.objects.filter(student=self.students[1]).delete()
+        call_command('persist_leaderboards', '--once', stdout=StringIO())
+        stored = Leaderboard.objects.get(course=self.course)
+        self.assertEqual(stored.counts, {'600': 1, '700': 1})
+        self.assertFalse(LeaderboardChange.objects.exists())
+        leaderboard.reset()  # another process starts from the stored counts and the log after them
+        self._grade(3, 80)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(leaderboard.standing(self.course.id, self.students[2].id), (3, 3, 60.0))
+        # the grade, the stored cursor, the stored counts, the log after them: no rebuild
+        self.assertEqual(len(ctx.captured_queries), 4)
+
+    def test_course_pages_show_top_and_rank(self):
+        for i, grade in enumerate((70, 95)):
+            self._grade(i, grade)
+        self.client.login(username='ls0', password='p')
+        response = self.client.get(reverse('course_detail', args=[self.course.id]))
+        self.assertEqual(response.context['standing'].rank, 2)
+        self.assertContains(response, 'Ваше место в рейтинге курса')
+        self.client.login(username='lteach', password='t')
+        response = self.client.get(reverse('teacher_course_detail', args=[self.course.id]))
+        self.assertEqual([p.rank for p in response.context['leaders']], [1, 2])
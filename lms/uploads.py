@@ -0,0 +1,256 @@
+"""Chunked, resumable uploads for lesson and homework attachments.
+
+Protocol (see the views in lms.views):
+
+1. ``POST /api/uploads/`` with ``{"filename": ..., "size": ...}`` opens an
+   UploadSession and returns its id and the current offset (0).
+2. ``PUT /api/uploads/<id>/`` sends the next chunk with a
+   ``Content-Range: bytes <start>-<end>/<total>`` header. ``start`` must equal
+   the current offset; otherwise 409 is returned with the offset to resume at.
+   Chunks of one upload are written one at a time: a PUT arriving while
+   another is being written, or that lost the race to move the offset, gets
+   409 too.
+3. ``GET /api/uploads/<id>/`` returns the current offset, so a client that
+   lost its connection can continue where the server stopped.
+
+Chunks are streamed from the request straight to a ``.part`` file while a
+SHA-256 is updated incrementally. When the last byte arrives the digest is
+looked up in StoredFile: identical content is stored only once. The name a
+file was uploaded under belongs to the upload: attaching it copies it to the
+lesson or submission (``attachment_name``), so a shared StoredFile never shows
+one user's file name to another.
+
+``manage.py expire_uploads`` removes sessions left unfinished for
+UPLOAD_EXPIRE_HOURS together with their ``.part`` files.
+"""
+import hashlib
+import os
+import re
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the conditional offset update serializes chunks
+    fcntl = None
+
+READ_SIZE = 64 * 1024
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+DEFAULT_EXPIRE_HOURS = 24
+# hashers kept per process; a session whose hasher was dropped rehashes its .part file
+MAX_HASHERS = 64
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# upload_id -> (offset, hasher) for the sessions this process wrote last (LRU).
+# If another worker received the previous chunk the state is rebuilt from disk.
+_hashers = OrderedDict()
+
+
+class UploadError(Exception):
+    """Raised for malformed chunk requests; status is the HTTP code to return."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def chunk_size():
+    return getattr(settings, 'UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def max_size():
+    return getattr(settings, 'UPLOAD_MAX_SIZE', DEFAULT_MAX_SIZE)
+
+
+def expire_hours():
+    return getattr(settings, 'UPLOAD_EXPIRE_HOURS', DEFAULT_EXPIRE_HOURS)
+
+
+def part_path(session):
+    return os.path.join(settings.MEDIA_ROOT, 'uploads', 'tmp', f"{session.id}.part")
+
+
+def stored_name(digest, filename):
+    return f"uploads/{digest[:2]}/{digest}/{os.path.basename(filename)}"
+
+
+def parse_content_range(header):
+    m = CONTENT_RANGE_RE.match(header or '')
+    if not m:
+        raise UploadError('missing or invalid Content-Range header')
+    start, end, total = (int(x) for x in m.groups())
+    if end < start:
+        raise UploadError('invalid Content-Range header')
+    return start, end, total
+
+
+def start_upload(user, filename, size):
+    from .models import UploadSession
+
+    filename = os.path.basename(filename or '').strip()
+    if not filename:
+        raise UploadError('filename is required')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('size must be an integer')
+    if size <= 0 or size > max_size():
+        raise UploadError('file size is out of range')
+    session = UploadSession.objects.create(user=user, filename=filename, size=size)
+    os.makedirs(os.path.dirname(part_path(session)), exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return session
+
+
+def _hasher_for(session):
+    """Return a SHA-256 object that has consumed exactly session.offset bytes (the caller's own copy)."""
+    state = _hashers.get(session.id)
+    if state and state[0] == session.offset:
+        return state[1].copy()
+    h = hashlib.sha256()
+    remaining = session.offset
+    with open(part_path(session), 'rb') as f:
+        while remaining:
+            block = f.read(min(READ_SIZE, remaining))
+            if not block:
+                break
+            h.update(block)
+            remaining -= len(block)
+    return h
+
+
+def write_chunk(session, stream, content_range):
+    """Append one chunk from stream (a file-like request) to the session.
+
+    Returns the StoredFile once the upload is complete, otherwise None.
+    """
+    from .models import UploadSession
+
+    if session.is_complete:
+        raise UploadError('upload already complete', status=409, offset=session.offset)
+    start, end, total = parse_content_range(content_range)
+    if total != session.size or end >= session.size:
+        raise UploadError('Content-Range does not match upload size')
+    if start != session.offset:
+        raise UploadError('unexpected offset', status=409, offset=session.offset)
+    expected = end - start + 1
+    if expected > chunk_size():
+        raise UploadError('chunk too large', status=413)
+
+    with open(part_path(session), 'r+b') as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('another chunk is being written', status=409, offset=session.offset)
+        # a request that held the lock before may have moved the offset since the session was read
+        session.refresh_from_db(fields=['offset'])
+        if start != session.offset:
+            raise UploadError('unexpected offset', status=409, offset=session.offset)
+        h = _hasher_for(session)
+        written = 0
+        # drop whatever an interrupted request left after the committed offset
+        f.truncate(session.offset)
+        f.seek(session.offset)
+        while written < expected:
+            block = stream.read(min(READ_SIZE, expected - written))
+            if not block:
+                break
+            f.write(block)
+            h.update(block)
+            written += len(block)
+        if written != expected:
+            # incomplete chunk: keep the committed offset, client resumes from there
+            raise UploadError('incomplete chunk', status=400, offset=session.offset)
+        # only from the offset the chunk was written at: the loser of a race gets 409
+        if not UploadSession.objects.filter(id=session.id, offset=start).update(
+                offset=start + written, updated_at=timezone.now()):
+            session.refresh_from_db(fields=['offset'])
+            raise UploadError('unexpected offset', status=409, offset=session.offset)
+    session.offset = start + written
+    _hashers[session.id] = (session.offset, h)
+    _hashers.move_to_end(session.id)
+    while len(_hashers) > MAX_HASHERS:
+        _hashers.popitem(last=False)
+    if session.offset == session.size:
+        return finish_upload(session, h.hexdigest())
+    return None
+
+
+def finish_upload(session, digest):
+    """Move the completed .part file into content-addressed storage (deduplicated)."""
+    from .models import StoredFile
+
+    _hashers.pop(session.id, None)
+    path = part_path(session)
+    stored = StoredFile.objects.filter(sha256=digest).first()
+    if stored is None:
+        name = stored_name(digest, session.filename)
+        final_path = os.path.join(settings.MEDIA_ROOT, name)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(path, final_path)
+        try:
+            with transaction.atomic():
+                stored = StoredFile.objects.create(sha256=digest, file=name, size=session.size,
+                                                   original_name=session.filename)
+        except IntegrityError:
+            # a concurrent upload of the same content won the race
+            stored = StoredFile.objects.get(sha256=digest)
+    elif os.path.exists(path):
+        os.remove(path)
+    session.stored_file = stored
+    session.save(update_fields=['stored_file', 'updated_at'])
+    return stored
+
+
+def attach_upload(obj, user, upload_id):
+    """Attach a completed upload owned by user to obj (a Lesson or HomeworkSubmission).
+
+    Sets obj.attachment and obj.attachment_name (the name of this upload) and
+    returns True; returns False and leaves obj alone when there is no such upload.
+    """
+    from .models import UploadSession
+
+    if not upload_id:
+        return False
+    session = (UploadSession.objects.filter(id=upload_id, user=user, stored_file__isnull=False)
+               .select_related('stored_file').first())
+    if session is None:
+        return False
+    obj.attachment = session.stored_file
+    obj.attachment_name = session.filename
+    return True
+
+
+def expire_uploads(hours=None, now=None):
+    """Delete unfinished sessions idle for `hours` (default UPLOAD_EXPIRE_HOURS) and their .part files.
+
+    Also removes .part files without a session. Returns the number of sessions deleted.
+    """
+    from .models import UploadSession
+
+    cutoff = (now or timezone.now()) - timedelta(hours=expire_hours() if hours is None else hours)
+    expired = list(UploadSession.objects.filter(stored_file__isnull=True, updated_at__lt=cutoff))
+    for session in expired:
+        _hashers.pop(session.id, None)
+        try:
+            os.remove(part_path(session))
+        except FileNotFoundError:
+            pass
+    UploadSession.objects.filter(id__in=[session.id for session in expired]).delete()
+
+    tmp = os.path.join(settings.MEDIA_ROOT, 'uploads', 'tmp')
+    if os.path.isdir(tmp):
+        live = {str(pk) for pk in UploadSession.objects.filter(stored_file__isnull=True).values_list('id', flat=True)}
+        for entry in os.scandir(tmp):
+            name, ext = os.path.splitext(entry.name)
+            if ext == '.part' and name not in live and entry.stat().st_mtime < cutoff.timestamp():
+                os.remove(entry.path)
+    return len(expired)
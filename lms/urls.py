@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 from django.contrib.auth import views as auth_views
 from .forms import LoginForm
@@ -26,13 +26,26 @@ urlpatterns = [
     # API
     path('api/deadlines/', views.deadlines_api, name='deadlines_api'),
     path('api/deadlines/<int:deadline_id>/', views.deadline_detail_api, name='deadline_detail_api'),
+    path('api/uploads/', views.upload_start_api, name='upload_start_api'),
+    path('api/uploads/<uuid:upload_id>/', views.upload_detail_api, name='upload_detail_api'),
+    path('api/grades/', views.grades_api, name='grades_api'),
+    path('api/me/bootstrap/', views.bootstrap_api, name='bootstrap_api'),
+    path('attachment/<int:file_id>/', views.attachment_download, name='attachment_download'),
+    path('metrics', views.metrics_view, name='metrics'),
     path('about/', views.about_view, name='about'),
     path('profile/', views.profile_view, name='profile'),
+    re_path(r'^avatars/(?P<digest>[0-9a-f]{64})/(?P<size>[0-9]+)\.png$', views.avatar_image, name='avatar_image'),
     # Certificate download (only for the owner student) — use numeric PK for simplicity
     path('certificate/<int:certificate_id>/pdf/', views.certificate_pdf, name='certificate_pdf'),
     # Teacher and student specific
     path('teacher/dashboard/', views.teacher_dashboard, name='teacher_dashboard'),
     path('teacher/course/<int:course_id>/', views.teacher_course_detail, name='teacher_course_detail'),
+    path('teacher/course/<int:course_id>/clone/', views.course_clone, name='course_clone'),
+    path('teacher/course/<int:course_id>/certificates.pdf', views.course_certificates_pdf, name='course_certificates_pdf'),
+    path('teacher/course/<int:course_id>/certificates.zip', views.course_certificates_zip, name='course_certificates_zip'),
     path('teacher/lesson/<int:lesson_id>/submissions/', views.teacher_lesson_submissions, name='teacher_lesson_submissions'),
+    path('teacher/lesson/<int:lesson_id>/checker/', views.lesson_checker, name='lesson_checker'),
+    path('staff/import/', views.import_data, name='import_data'),
     path('student/grades/', views.student_grades, name='student_grades'),
+    path('student/grades/archive/', views.student_grades_archive, name='student_grades_archive'),
 ]
@@ -1,22 +1,54 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Course, Lesson, Student, HomeworkSubmission, Certificate
-from .forms import CourseCreateForm, LessonCreateForm, HomeworkSubmissionForm, GradeForm, UserRegistrationForm
+from django.urls import reverse
+from .models import Course, CourseGrade, Lesson, LessonChecker, Student, HomeworkSubmission, Certificate, StoredFile, UploadSession
+from .forms import CourseCreateForm, CourseCloneForm, LessonCreateForm, LessonCheckerForm, HomeworkSubmissionForm, GradeForm, UserRegistrationForm, AvatarUploadForm, ImportForm
+from .importer import import_uploaded_file
+from . import api, archive, autocheck, avatars, bootstrap, certificates, cloning, grading, leaderboard, metrics, similarity, uploads
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Avg, F, OuterRef, Q, Subquery
 from django.contrib.auth import login
 from django.utils import timezone
 from django.template.loader import render_to_string
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 from django.conf import settings
+import asyncio
 import os
+import secrets
+from datetime import timedelta
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.core.handlers.asgi import ASGIRequest
+from django.contrib import messages
 
 
 @login_required
 def profile_view(request):
-    """Show current user's profile with avatar and role."""
-    return render(request, 'profile.html')
+    """Show current user's profile with avatar and role. POST uploads a new avatar."""
+    if request.method == 'POST':
+        avatar_form = AvatarUploadForm(request.POST, request.FILES)
+        if avatar_form.is_valid():
+            avatars.set_uploaded_avatar(request.user, avatar_form.cleaned_data['image'])
+            return redirect('profile')
+    else:
+        avatar_form = AvatarUploadForm()
+    return render(request, 'profile.html', {'avatar_form': avatar_form})
+
+
+def avatar_image(request, digest, size):
+    """Serve a pre-rendered avatar. Files are content-addressed, so they never change."""
+    if int(size) not in avatars.avatar_sizes():
+        raise Http404('Unknown avatar size')
+    path = avatars.avatar_path(digest, size)
+    if not os.path.exists(path):
+        raise Http404('Avatar not found')
+    from django.http import FileResponse
+    response = FileResponse(open(path, 'rb'), content_type='image/png')
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response['ETag'] = f'"{digest}-{size}"'
+    return response
 
 
 @login_required
@@ -62,21 +94,97 @@ def about_view(request):
 def is_teacher(user):
     return user.is_staff
 
-def course_list(request):
-    courses = Course.objects.all()
+# Body columns that list pages never render (they show content_preview instead).
+# Deferred columns are loaded, and decompressed, only if an instance actually reads them.
+LIST_DEFERRED_FIELDS = ('content', 'lesson__content', 'lesson__course__description')
+
+# -- Async helpers ------------------------------------------------------------------
+# The hot read pages below are native async views using the async ORM. On Django 4.2
+# every aget/acount/async for still runs the query in the one thread-sensitive
+# sync_to_async thread, so queries of a request (and of all requests) execute one
+# at a time and asyncio.gather only saves the hops' scheduling, not database time.
+# What the views gain is that a waiting request does not hold a worker thread.
+
+async def aget_user(request):
+    """Resolve request.user once, together with what base.html reads from it.
+
+    Django 4.2 has no async session/auth API, so the session, user, profile and
+    avatar are loaded in one sync_to_async call (like every async ORM query, it
+    runs in the thread-sensitive executor). Afterwards templates can be
+    rendered without touching the database.
+    """
+    def resolve():
+        user = request.user
+        if user.is_authenticated:
+            getattr(user, 'student_profile', None)
+            avatars.avatar_url(user, 36)
+        return user
+    return await sync_to_async(resolve)()
+
+async def _alist(qs):
+    return [obj async for obj in qs]
+
+async def _aget_or_404(qs, **kwargs):
+    try:
+        return await qs.aget(**kwargs)
+    except ObjectDoesNotExist:
+        raise Http404('Not found')
+
+def alogin_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+def arequire_http_methods(methods):
+    """Async-compatible version of require_http_methods (the 4.2 one wraps views in a sync function)."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def course_list(request):
+    await aget_user(request)
+    courses = await _alist(Course.objects.select_related('teacher'))
     return render(request, 'course_list.html', {'courses': courses})
 
-def course_detail(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
-    lessons = course.lessons.all()
-    return render(request, 'course_detail.html', {'course': course, 'lessons': lessons})
+def _leaderboard(course_id, student_id):
+    # both in one thread hop: they run one after the other in that thread anyway
+    return leaderboard.top(course_id), leaderboard.standing(course_id, student_id)
+
+async def course_detail(request, course_id):
+    user, course, lessons = await asyncio.gather(
+        aget_user(request),
+        _aget_or_404(Course.objects.select_related('teacher'), id=course_id),
+        _alist(Lesson.objects.filter(course_id=course_id).only('id', 'title', 'course_id')),
+    )
+    student = getattr(user, 'student_profile', None) if user.is_authenticated else None
+    is_enrolled = bool(student) and await course.students.filter(id=student.id).aexists()
+    leaders = standing = None
+    if is_enrolled:
+        leaders, standing = await sync_to_async(_leaderboard)(course.id, student.id)
+    return render(request, 'course_detail.html', {
+        'course': course, 'lessons': lessons, 'is_enrolled': is_enrolled, 'leaders': leaders, 'standing': standing,
+    })
 
 def lesson_detail(request, lesson_id):
-    lesson = get_object_or_404(Lesson, id=lesson_id)
+    lesson = get_object_or_404(Lesson, id=lesson_id, course__deleting_at__isnull=True)
     submission = None
     if request.user.is_authenticated:
         student = getattr(request.user, 'student_profile', None)
-        if student:
+        if student and lesson.course.is_archived:
+            # read-only: the work was moved to the archive with the rest of the course
+            submission = archive.archived_submission(student, lesson)
+            form = None
+        elif student:
             submission = HomeworkSubmission.objects.filter(lesson=lesson, student=student).first()
             if request.method == 'POST':
                 form = HomeworkSubmissionForm(request.POST, instance=submission)
@@ -84,7 +192,9 @@ def lesson_detail(request, lesson_id):
                     obj = form.save(commit=False)
                     obj.student = student
                     obj.lesson = lesson
+                    uploads.attach_upload(obj, request.user, form.cleaned_data.get('upload_id'))
                     obj.save()
+                    autocheck.enqueue_submission(obj)
                     return redirect('lesson_detail', lesson_id=lesson.id)
             else:
                 form = HomeworkSubmissionForm(instance=submission)
@@ -138,6 +248,7 @@ def lesson_create(request, course_id):
         if form.is_valid():
             lesson = form.save(commit=False)
             lesson.course = course
+            uploads.attach_upload(lesson, request.user, form.cleaned_data.get('upload_id'))
             lesson.save()
             return redirect('course_detail', course_id=course.id)
     else:
@@ -154,33 +265,31 @@ def course_enroll(request, course_id):
     return redirect('course_detail', course_id=course.id)
 
 
-@login_required
-def student_dashboard(request):
+@alogin_required
+async def student_dashboard(request):
     student = getattr(request.user, 'student_profile', None)
     if not student:
         return redirect('course_list')
-    # gather enrolled courses and submissions
-    courses = student.courses.all().prefetch_related('lessons')
-    submissions = HomeworkSubmission.objects.filter(student=student).select_related('lesson')
-    submissions_by_lesson = {s.lesson_id: s for s in submissions}
-
-    courses_data = []
-    for course in courses:
-        lessons_data = []
-        for lesson in course.lessons.all():
-            lessons_data.append({
-                'lesson': lesson,
-                'submission': submissions_by_lesson.get(lesson.id)
-            })
-        courses_data.append({'course': course, 'lessons': lessons_data})
-
-    # collect upcoming deadlines for student's courses (safe)
-    from django.utils import timezone
+    courses_qs = student.courses.all()
     now = timezone.now()
-    try:
-        deadlines = get_all_deadlines().filter(lesson__course__in=courses, due_at__gte=now).select_related('lesson')[:50]
-    except Exception:
-        deadlines = []
+    # enrolled courses, their lessons, the student's submissions and upcoming deadlines are independent
+    courses, lessons, submissions, deadlines, grades = await asyncio.gather(
+        _alist(courses_qs),
+        _alist(Lesson.objects.filter(course__in=courses_qs).only('id', 'title', 'course_id')),
+        _alist(HomeworkSubmission.objects.filter(student=student).only('id', 'lesson_id', 'is_graded', 'grade')),
+        _aupcoming_deadlines(courses_qs, now),
+        _alist(CourseGrade.objects.filter(student=student).only('course_id', 'final_grade', 'graded_count')),
+    )
+    submissions_by_lesson = {s.lesson_id: s for s in submissions}
+    lessons_by_course = {}
+    for lesson in lessons:
+        lessons_by_course.setdefault(lesson.course_id, []).append({
+            'lesson': lesson,
+            'submission': submissions_by_lesson.get(lesson.id)
+        })
+    grades_by_course = {g.course_id: g for g in grades}
+    courses_data = [{'course': c, 'lessons': lessons_by_course.get(c.id, []), 'grade': grades_by_course.get(c.id)}
+                    for c in courses]
 
     return render(request, 'student_dashboard.html', {
         'student': student,
@@ -188,6 +297,13 @@ def student_dashboard(request):
         'deadlines': deadlines,
     })
 
+async def _aupcoming_deadlines(courses_qs, now):
+    """Upcoming deadlines for the student's courses (safe: [] on DB errors)."""
+    try:
+        return await _alist(get_all_deadlines().filter(lesson__course__in=courses_qs, due_at__gte=now)[:50])
+    except Exception:
+        return []
+
 
 @login_required
 def submission_delete(request, submission_id):
@@ -210,7 +326,10 @@ def submission_edit(request, submission_id):
     if request.method == 'POST':
         form = HomeworkSubmissionForm(request.POST, instance=submission)
         if form.is_valid():
-            form.save()
+            obj = form.save(commit=False)
+            uploads.attach_upload(obj, request.user, form.cleaned_data.get('upload_id'))
+            obj.save()
+            autocheck.enqueue_submission(obj)
             return redirect('lesson_detail', lesson_id=submission.lesson.id)
     else:
         form = HomeworkSubmissionForm(instance=submission)
@@ -223,7 +342,8 @@ def submissions_list(request):
     if not student:
         return redirect('course_list')
 
-    qs = HomeworkSubmission.objects.filter(student=student).select_related('lesson', 'lesson__course')
+    qs = (HomeworkSubmission.objects.filter(student=student).select_related('lesson', 'lesson__course')
+          .defer(*LIST_DEFERRED_FIELDS))
 
     # filters: course, graded (yes/no), q search by lesson title
     course_id = request.GET.get('course')
@@ -265,6 +385,7 @@ def grade_submission(request, submission_id):
             obj = form.save(commit=False)
             obj.is_graded = True
             obj.save()
+            autocheck.enqueue_submission(obj)
             return redirect('lesson_detail', lesson_id=submission.lesson.id)
     else:
         form = GradeForm(instance=submission)
@@ -289,6 +410,9 @@ def teacher_dashboard(request):
     if not is_teacher(request.user):
         raise PermissionDenied
     courses = Course.objects.filter(teacher=request.user).prefetch_related('students')
+    # one query for the average course grade of every course
+    averages = dict(CourseGrade.objects.filter(course__in=courses, final_grade__isnull=False)
+                    .values_list('course_id').annotate(Avg('final_grade')).order_by())
     data = []
     for c in courses:
         students_qs = c.students.all().select_related('user')
@@ -296,20 +420,102 @@ def teacher_dashboard(request):
             'course': c,
             'students_count': students_qs.count(),
             'students': students_qs,
+            'average_grade': averages.get(c.id),
         })
     return render(request, 'teacher_dashboard.html', {'courses_data': data})
 
+# ?sort= of the student list on the teacher's course page
+STUDENT_ORDERINGS = {
+    'name': ('user__last_name', 'user__first_name', 'user__username'),
+    'grade': (F('final_grade').asc(nulls_first=True), 'user__username'),
+    '-grade': (F('final_grade').desc(nulls_last=True), 'user__username'),
+}
+
 @login_required
 def teacher_course_detail(request, course_id):
-    """Show course overview for teacher: students and lessons."""
+    """Show course overview for teacher: students with their course grades and lessons."""
     if not is_teacher(request.user):
         raise PermissionDenied
     course = get_object_or_404(Course, id=course_id)
     if course.teacher != request.user:
         raise PermissionDenied
-    students = course.students.all().select_related('user')
-    lessons = course.lessons.all()
-    return render(request, 'teacher_course_detail.html', {'course': course, 'students': students, 'lessons': lessons})
+    sort = request.GET.get('sort')
+    sort = sort if sort in STUDENT_ORDERINGS else 'name'
+    grades = CourseGrade.objects.filter(course=course, student=OuterRef('pk'))
+    students = (course.students.all().select_related('user')
+                .annotate(final_grade=Subquery(grades.values('final_grade')[:1]),
+                          graded_count=Subquery(grades.values('graded_count')[:1]))
+                .order_by(*STUDENT_ORDERINGS[sort]))
+    lessons = course.lessons.defer('content')
+    return render(request, 'teacher_course_detail.html', {
+        'course': course, 'students': students, 'lessons': lessons, 'sort': sort,
+        'leaders': leaderboard.top(course.id),
+    })
+
+@login_required
+def course_clone(request, course_id):
+    """Copy the course with its lessons, checks and deadlines (shifted) for a new term."""
+    course = get_object_or_404(Course, id=course_id)
+    if not (request.user.is_superuser or (is_teacher(request.user) and course.teacher == request.user)):
+        raise PermissionDenied
+    if request.method == 'POST':
+        form = CourseCloneForm(request.POST)
+        if form.is_valid():
+            result = cloning.clone_course(course, teacher=request.user if is_teacher(request.user) else None,
+                                          title=form.cleaned_data['title'],
+                                          shift=timedelta(days=form.cleaned_data['shift_days']))
+            messages.success(request, f'Курс скопирован: уроков {result.lessons}, дедлайнов {result.deadlines}')
+            return redirect('teacher_course_detail', course_id=result.course.id)
+    else:
+        form = CourseCloneForm(initial={'title': course.title, 'shift_days': cloning.default_shift().days})
+    return render(request, 'course_clone.html', {'course': course, 'form': form})
+
+@login_required
+def course_certificates_pdf(request, course_id):
+    """All certificates of a course in one PDF, one page each, sharing the embedded background."""
+    if not is_teacher(request.user):
+        raise PermissionDenied
+    course = get_object_or_404(Course, id=course_id)
+    if course.teacher != request.user:
+        raise PermissionDenied
+    certs = list(course.certificates.select_related('student__user', 'course__teacher')
+                 .defer('course__description').order_by('issued_at', 'id'))
+    if not certs or not os.path.exists(certificates.template_path()):
+        raise Http404('No certificates')
+    response = HttpResponse(content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="course-{course.id}-certificates.pdf"'
+    certificates.write_vector_pdf(response, certs)
+    return response
+
+@login_required
+def course_certificates_zip(request, course_id):
+    """All certificate PDFs of a course as a ZIP, streamed while it is built."""
+    course = get_object_or_404(Course, id=course_id)
+    if not (request.user.is_superuser or (is_teacher(request.user) and course.teacher == request.user)):
+        raise PermissionDenied
+    response = StreamingHttpResponse(_streamed(request, certificates.course_archive(course)),
+                                     content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="course-{course.id}-certificates.zip"'
+    return response
+
+
+def _streamed(request, chunks):
+    """`chunks` for a StreamingHttpResponse; under ASGI pulled one chunk at a time.
+
+    Django's ASGI handler consumes a sync iterator with sync_to_async(list), i.e.
+    builds the whole body before sending any of it.
+    """
+    if not isinstance(request, ASGIRequest):
+        return chunks
+
+    async def pull():
+        done = object()
+        try:
+            while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+                yield chunk
+        finally:
+            await sync_to_async(chunks.close)()
+    return pull()
 
 @login_required
 def teacher_lesson_submissions(request, lesson_id):
@@ -321,7 +527,7 @@ def teacher_lesson_submissions(request, lesson_id):
         raise PermissionDenied
 
     # Base queryset
-    qs = lesson.submissions.select_related('student__user')
+    qs = lesson.submissions.select_related('student__user', 'attachment').defer('content')
 
     # Filtering by graded status (query param: graded=yes|no)
     graded = request.GET.get('graded')
@@ -330,6 +536,23 @@ def teacher_lesson_submissions(request, lesson_id):
     elif graded == 'no':
         qs = qs.filter(is_graded=False)
 
+    # Confirm all provisional grades of the automatic check at once
+    if request.method == 'POST' and 'confirm_checks' in request.POST:
+        autocheck.confirm_provisional_grades(lesson)
+        return redirect('teacher_lesson_submissions', lesson_id=lesson.id)
+
+    # Batch grading: every non-empty grade-<id> field of the page in one transaction
+    if request.method == 'POST' and 'batch' in request.POST:
+        pairs = [(key[len('grade-'):], value) for key, value in request.POST.items()
+                 if key.startswith('grade-') and value.strip()]
+        try:
+            changed = grading.apply_grades(request.user, grading.parse_grades(pairs), lesson=lesson)
+        except grading.GradingError as exc:
+            return HttpResponseBadRequest(str(exc))
+        messages.success(request, f'Сохранено оценок: {changed}')
+        query = request.GET.urlencode()
+        return redirect(reverse('teacher_lesson_submissions', args=[lesson.id]) + (f'?{query}' if query else ''))
+
     # Handle grading POST (submission_id and grade) - more robust: fetch by id and verify belongs to lesson
     if request.method == 'POST':
         sub_id = request.POST.get('submission_id')
@@ -348,7 +571,8 @@ def teacher_lesson_submissions(request, lesson_id):
 
     # Pagination
     from django.core.paginator import Paginator
-    page_size = 10
+    page_size = request.GET.get('per_page', '10')
+    page_size = int(page_size) if page_size in SUBMISSION_PAGE_SIZES else 10
     paginator = Paginator(qs.order_by('-id'), page_size)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
@@ -356,15 +580,74 @@ def teacher_lesson_submissions(request, lesson_id):
     # prepare forms for current page submissions
     forms = {s.id: GradeForm(instance=s) for s in page_obj.object_list}
 
+    # likely copies: the strongest match of every submission on this page
+    best_match = similarity.best_scores([s.id for s in page_obj.object_list])
+    for s in page_obj.object_list:
+        s.similarity = best_match.get(s.id)
+
     context = {
         'lesson': lesson,
         'page_obj': page_obj,
         'submissions': page_obj.object_list,
         'forms': forms,
         'graded_filter': graded,
+        'per_page': page_size,
+        'page_sizes': SUBMISSION_PAGE_SIZES,
+        'similar_pairs': similarity.similar_pairs(lesson)[:20],
+        'has_checker': LessonChecker.objects.filter(lesson=lesson).exists(),
+        'provisional_count': lesson.submissions.filter(check_status=HomeworkSubmission.CHECK_DONE,
+                                                       provisional_grade__isnull=False, is_graded=False).count(),
     }
     return render(request, 'teacher_lesson_submissions.html', context)
 
+SUBMISSION_PAGE_SIZES = ('10', '20', '40', '100')
+
+@login_required
+def lesson_checker(request, lesson_id):
+    """Set up (or remove) the automatic check of a lesson's answers."""
+    lesson = get_object_or_404(Lesson, id=lesson_id)
+    if not is_teacher(request.user) or lesson.course.teacher != request.user:
+        raise PermissionDenied
+    checker = LessonChecker.objects.filter(lesson=lesson).first()
+    if request.method == 'POST':
+        if 'delete' in request.POST:
+            if checker:
+                checker.delete()
+            return redirect('teacher_lesson_submissions', lesson_id=lesson.id)
+        form = LessonCheckerForm(request.POST, instance=checker)
+        if form.is_valid():
+            checker = form.save(commit=False)
+            checker.lesson = lesson
+            checker.save()
+            # (re)check everything not graded by hand yet
+            autocheck.enqueue(lesson.submissions.filter(is_graded=False))
+            return redirect('teacher_lesson_submissions', lesson_id=lesson.id)
+    else:
+        form = LessonCheckerForm(instance=checker)
+    return render(request, 'lesson_checker_form.html', {'form': form, 'lesson': lesson, 'checker': checker})
+
+@login_required
+def import_data(request):
+    """Staff page: bulk import users, courses, lessons or enrollments from CSV/JSON Lines."""
+    if not is_teacher(request.user):
+        raise PermissionDenied
+    report = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            report = import_uploaded_file(form.cleaned_data['kind'], form.cleaned_data['file'],
+                                          manage_staff=request.user.is_superuser)
+    else:
+        form = ImportForm()
+    return render(request, 'import_form.html', {'form': form, 'report': report})
+
+# ?sort= of the course grades on the student's grades page
+COURSE_GRADE_ORDERINGS = {
+    'title': ('course__title', 'course_id'),
+    'grade': ('final_grade', 'course__title'),
+    '-grade': (F('final_grade').desc(nulls_last=True), 'course__title'),
+}
+
 @login_required
 def student_grades(request):
     """Student view: list submissions and grades for current student."""
@@ -372,22 +655,47 @@ def student_grades(request):
     if not student:
         # Not a student - redirect or deny
         return redirect('course_list')
-    submissions = HomeworkSubmission.objects.filter(student=student).select_related('lesson', 'lesson__course')
-    return render(request, 'student_grades.html', {'submissions': submissions})
+    submissions = (HomeworkSubmission.objects.filter(student=student).select_related('lesson', 'lesson__course')
+                   .defer(*LIST_DEFERRED_FIELDS))
+    sort = request.GET.get('sort')
+    sort = sort if sort in COURSE_GRADE_ORDERINGS else 'title'
+    course_grades = (student.course_grades.filter(graded_count__gt=0, course__deleting_at__isnull=True).select_related('course')
+                     .order_by(*COURSE_GRADE_ORDERINGS[sort]))
+    return render(request, 'student_grades.html', {
+        'submissions': submissions,
+        'course_grades': course_grades,
+        'sort': sort,
+        'has_archive': archive.archived_submissions(student).exists(),
+    })
+
+@login_required
+def student_grades_archive(request):
+    """Read-only grades of archived (finished) courses."""
+    student = getattr(request.user, 'student_profile', None)
+    if not student:
+        return redirect('course_list')
+    submissions = archive.archived_submissions(student).defer('content')
+    return render(request, 'student_grades_archive.html', {'submissions': submissions})
 
 # -- Deadline management and API -------------------------------------------------
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed, HttpResponseNotModified
+from django.utils.http import parse_etags
 from django.views.decorators.http import require_http_methods
 from .forms import DeadlineForm
 from .models import Deadline
-from .repositories import get_all_deadlines, get_deadline, create_deadline, update_deadline, delete_deadline
+from .repositories import get_all_deadlines, get_deadline, aget_deadline, create_deadline, update_deadline, delete_deadline
 import json
 
-@login_required
-@require_http_methods(['GET','POST'])
-def deadlines_api(request):
+@alogin_required
+@arequire_http_methods(['GET', 'POST'])
+async def deadlines_api(request):
     """Return list of deadlines as JSON. POST allows teachers to create a deadline using JSON or form-encoded data."""
     if request.method == 'GET':
+        try:
+            fields = api.parse_fields(request, api.DEADLINE_FIELDS)
+            fmt = api.negotiate(request)
+        except ValueError as exc:
+            return HttpResponseBadRequest(str(exc))
         try:
             # teachers see all, students see deadlines for their courses and global (lesson is null)
             if is_teacher(request.user):
@@ -395,25 +703,37 @@ def deadlines_api(request):
             else:
                 student = getattr(request.user, 'student_profile', None)
                 if not student:
-                    return JsonResponse({'deadlines': []})
-                qs = get_all_deadlines().filter(Q(lesson__course__in=student.courses.all()) | Q(lesson__isnull=True))
-
-            data = []
-            for d in qs:
-                data.append({
-                    'id': d.id,
-                    'title': d.title,
-                    'description': d.description,
-                    'due_at': d.due_at.isoformat(),
-                    'lesson_id': d.lesson.id if d.lesson else None,
-                    'lesson_title': d.lesson.title if d.lesson else None,
-                    'created_by': d.created_by.username if d.created_by else None,
-                })
-            return JsonResponse({'deadlines': data})
+                    return api.list_response(request, 'deadlines', fields, [], fmt)
+                # both branches test lms_deadline.lesson_id, so SQLite can answer each one from an index
+                course_lessons = Lesson.objects.filter(course__in=student.courses.all()).values('id')
+                qs = get_all_deadlines().filter(Q(lesson__in=course_lessons) | Q(lesson__isnull=True))
+
+            # only the columns and joins of the requested fields are fetched
+            qs = api.project(qs, fields, api.DEADLINE_FIELDS)
+            rows = [api.row(d, fields, api.DEADLINE_FIELDS) async for d in qs]
+            return api.list_response(request, 'deadlines', fields, rows, fmt)
         except Exception:
-            return JsonResponse({'deadlines': []})
+            return api.list_response(request, 'deadlines', fields, [], fmt)
+    return await sync_to_async(_deadline_create_json)(request)
 
-    # POST: create (only teachers)
+@alogin_required
+@arequire_http_methods(['GET'])
+async def bootstrap_api(request):
+    """Enrollments, lessons, submissions, grades, upcoming deadlines and certificates of the student in one response."""
+    student = getattr(request.user, 'student_profile', None)
+    if not student:
+        raise PermissionDenied
+    bundle = await bootstrap.get(student)
+    if bundle.etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = api.compress(request, HttpResponse(bundle.body, content_type='application/json'))
+    response['ETag'] = bundle.etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _deadline_create_json(request):
+    # POST: create (only teachers); form validation queries the lesson, so this part stays sync
     if not is_teacher(request.user):
         raise PermissionDenied
     # accept JSON or form data
@@ -432,29 +752,31 @@ def deadlines_api(request):
             return JsonResponse({'errors': 'database error'}, status=500)
     return JsonResponse({'errors': form.errors}, status=400)
 
-@login_required
-@require_http_methods(['GET', 'PUT', 'DELETE'])
-def deadline_detail_api(request, deadline_id):
-    d = get_deadline(deadline_id)
+@alogin_required
+@arequire_http_methods(['GET', 'PUT', 'DELETE'])
+async def deadline_detail_api(request, deadline_id):
+    if request.method != 'GET':
+        return await sync_to_async(_deadline_modify_json)(request, await aget_deadline(deadline_id))
+    try:
+        fields = api.parse_fields(request, api.DEADLINE_FIELDS)
+        fmt = api.negotiate(request)
+    except ValueError as exc:
+        return HttpResponseBadRequest(str(exc))
     # GET: allow if teacher or student of the related course (or global deadline)
-    if request.method == 'GET':
-        if not is_teacher(request.user):
-            student = getattr(request.user, 'student_profile', None)
-            if not student:
-                raise PermissionDenied
-            # if deadline tied to a lesson, ensure the student is enrolled in the course
-            if d.lesson and d.lesson.course not in student.courses.all():
-                raise PermissionDenied
-        return JsonResponse({
-            'id': d.id,
-            'title': d.title,
-            'description': d.description,
-            'due_at': d.due_at.isoformat(),
-            'lesson_id': d.lesson.id if d.lesson else None,
-            'lesson_title': d.lesson.title if d.lesson else None,
-            'created_by': d.created_by.username if d.created_by else None,
-        })
+    teacher = is_teacher(request.user)
+    # students also need the lesson's course for the enrollment check
+    extra = {} if teacher else {'columns': ('lesson', 'lesson__course'), 'joins': ('lesson',)}
+    d = await aget_deadline(deadline_id, api.project(Deadline.objects.all(), fields, api.DEADLINE_FIELDS, **extra))
+    if not teacher:
+        student = getattr(request.user, 'student_profile', None)
+        if not student:
+            raise PermissionDenied
+        # if deadline tied to a lesson, ensure the student is enrolled in the course
+        if d.lesson and not await student.courses.filter(id=d.lesson.course_id).aexists():
+            raise PermissionDenied
+    return api.object_response(request, fields, api.row(d, fields, api.DEADLINE_FIELDS), fmt)
 
+def _deadline_modify_json(request, d):
     # PUT and DELETE require teacher
     if not is_teacher(request.user):
         raise PermissionDenied
@@ -464,19 +786,18 @@ def deadline_detail_api(request, deadline_id):
         return JsonResponse({'status': 'deleted'})
 
     # handle PUT - update
-    if request.method == 'PUT':
-        try:
-            payload = json.loads(request.body.decode('utf-8'))
-        except Exception:
-            return HttpResponseBadRequest('invalid json')
-        form = DeadlineForm(payload, instance=d)
-        if form.is_valid():
-            dl = form.save(commit=False)
-            dl.created_by = dl.created_by or request.user
-            dl.save()
-            return JsonResponse({'status': 'ok', 'id': dl.id})
-        else:
-            return JsonResponse({'errors': form.errors}, status=400)
+    try:
+        payload = json.loads(request.body.decode('utf-8'))
+    except Exception:
+        return HttpResponseBadRequest('invalid json')
+    form = DeadlineForm(payload, instance=d)
+    if form.is_valid():
+        dl = form.save(commit=False)
+        dl.created_by = dl.created_by or request.user
+        dl.save()
+        return JsonResponse({'status': 'ok', 'id': dl.id})
+    else:
+        return JsonResponse({'errors': form.errors}, status=400)
 
 @login_required
 @require_http_methods(['GET', 'POST'])
@@ -528,9 +849,116 @@ def deadline_delete(request, deadline_id):
         return redirect('lesson_detail', lesson_id=lesson_id) if lesson_id else redirect('course_list')
     return render(request, 'deadline_confirm_delete.html', {'deadline': dl})
 
+# -- Chunked uploads ----------------------------------------------------------------
+
+def _upload_state(session):
+    data = {
+        'upload_id': str(session.id),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.offset,
+        'chunk_size': uploads.chunk_size(),
+        'complete': session.is_complete,
+    }
+    if session.stored_file_id:
+        data['file_id'] = session.stored_file_id
+        data['sha256'] = session.stored_file.sha256
+    return data
+
+@login_required
+@require_http_methods(['POST'])
+def upload_start_api(request):
+    """Open a resumable upload. Body: JSON {"filename": ..., "size": ...}."""
+    try:
+        payload = json.loads(request.body.decode('utf-8')) if request.body else request.POST.dict()
+    except Exception:
+        return HttpResponseBadRequest('invalid json')
+    try:
+        session = uploads.start_upload(request.user, payload.get('filename'), payload.get('size'))
+    except uploads.UploadError as e:
+        return JsonResponse({'errors': str(e)}, status=e.status)
+    return JsonResponse(_upload_state(session), status=201)
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def upload_detail_api(request, upload_id):
+    """GET reports the resume offset; PUT appends one chunk (Content-Range required)."""
+    session = get_object_or_404(UploadSession.objects.select_related('stored_file'), id=upload_id, user=request.user)
+    if request.method == 'PUT':
+        try:
+            uploads.write_chunk(session, request, request.headers.get('Content-Range'))
+        except uploads.UploadError as e:
+            data = {'errors': str(e)}
+            if e.offset is not None:
+                data['offset'] = e.offset
+            return JsonResponse(data, status=e.status)
+    return JsonResponse(_upload_state(session))
+
+@login_required
+def attachment_download(request, file_id):
+    """Download an attachment of a lesson or submission the user may see.
+
+    Lesson materials: the course's students and teacher; submission files: their
+    student and the course's teacher. The file is named as it was attached there.
+    """
+    stored = get_object_or_404(StoredFile, id=file_id)
+    user = request.user
+    student = getattr(user, 'student_profile', None)
+    lessons = stored.lessons.filter(course__deleting_at__isnull=True)
+    submissions = stored.submissions.filter(lesson__course__deleting_at__isnull=True)
+    if not user.is_superuser:
+        lesson_scope = Q(course__teacher=user)
+        submission_scope = Q(lesson__course__teacher=user)
+        if student:
+            lesson_scope |= Q(course__students=student)
+            submission_scope |= Q(student=student)
+        lessons, submissions = lessons.filter(lesson_scope), submissions.filter(submission_scope)
+    names = [*lessons.values_list('attachment_name', flat=True)[:1],
+             *submissions.values_list('attachment_name', flat=True)[:1]]
+    if not names:
+        raise PermissionDenied
+    from django.http import FileResponse
+    try:
+        f = stored.file.open('rb')
+    except Exception:
+        raise Http404('Attachment not available')
+    return FileResponse(f, as_attachment=True, filename=names[0] or f"file-{stored.sha256[:8]}")
+
 @login_required
 @require_http_methods(['GET'])
 def calendar_view(request):
     # Students and teachers can view
     return render(request, 'calendar.html')
 
+@login_required
+@require_http_methods(['POST'])
+def grades_api(request):
+    """Grade many submissions in one request.
+
+    Body: {"grades": [{"submission_id": 1, "grade": 90}, ...]}. All submissions
+    must belong to the teacher's courses, otherwise nothing is saved (403).
+    """
+    if not is_teacher(request.user):
+        raise PermissionDenied
+    try:
+        payload = json.loads(request.body.decode('utf-8'))
+        pairs = [(item['submission_id'], item['grade']) for item in payload['grades']]
+        grades = grading.parse_grades(pairs)
+    except (ValueError, KeyError, TypeError) as exc:
+        return JsonResponse({'errors': str(exc) or 'invalid payload'}, status=400)
+    changed = grading.apply_grades(request.user, grades)
+    return JsonResponse({'status': 'ok', 'submitted': len(grades), 'updated': changed})
+
+
+def _metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    if token and secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS or request.user.is_superuser
+
+
+def metrics_view(request):
+    """Prometheus scrape target: METRICS_TOKEN bearers, METRICS_ALLOWED_IPS and superusers only."""
+    if not _metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
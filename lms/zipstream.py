@@ -0,0 +1,63 @@
+"""ZIP archives produced as a stream of byte chunks.
+
+zipfile can write to a file it cannot seek: each member is then followed by a
+data descriptor with its CRC and sizes instead of the local header being
+patched afterwards. _Sink takes what zipfile writes and stream_zip hands it out
+after every chunk, so an archive of any size is built with about one chunk in
+memory and no temporary file; the first bytes go out before the last member
+is even opened.
+"""
+import os
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Sink:
+    """Write-only file for zipfile: has tell() but no seek(), which selects streaming mode."""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+def stream_zip(files, chunk_size=CHUNK_SIZE):
+    """Yield a ZIP archive of `files`, (arcname, path, date_time) tuples, as byte chunks.
+
+    Members are stored, not deflated: the archive is meant for files that are
+    compressed already (PDF, images). `files` may be a generator; it is
+    consumed one member at a time.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for arcname, path, date_time in files:
+            info = zipfile.ZipInfo(arcname, date_time=tuple(date_time)[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = os.path.getsize(path)  # lets zipfile decide on zip64 up front
+            with open(path, 'rb') as src, zf.open(info, 'w') as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # the central directory, written on close
+    yield from sink.drain()
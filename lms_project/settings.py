@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -20,7 +21,9 @@ INSTALLED_APPS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MIDDLEWARE = [
+    'lms.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'lms.routers.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -48,6 +51,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'lms_project.wsgi.application'
 
+# Database profile: LMS_DB_PROFILE=production enables WAL mode, tuned PRAGMAs and
+# persistent connections (see lms/db.py and scripts/bench_sqlite.py).
+DB_PROFILE = os.environ.get('LMS_DB_PROFILE', 'default')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -55,15 +62,143 @@ DATABASES = {
     }
 }
 
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',      # safe with WAL, avoids an fsync per commit
+    'busy_timeout': 5000,         # ms to wait for a lock instead of failing
+    'cache_size': -64000,         # negative = KiB, i.e. 64 MB page cache
+    'mmap_size': 268435456,       # 256 MB memory-mapped I/O
+    'temp_store': 'MEMORY',
+}
+SQLITE_PRAGMAS = {}
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'timeout': 20},
+    })
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
+
+# Read replicas: LMS_DB_REPLICA=1 adds a second SQLite file that read-only queries
+# are routed to; keep it in sync with `manage.py replicate_db --interval 2`.
+DATABASE_ROUTERS = ['lms.routers.ArchiveRouter', 'lms.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+REPLICA_STICKY_SECONDS = 5  # read-your-writes window after a user writes
+
+if os.environ.get('LMS_DB_REPLICA') == '1':
+    DATABASES['replica'] = dict(DATABASES['default'], NAME=BASE_DIR / 'db_replica.sqlite3',
+                                TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS = ['replica']
+
+# Archival of finished courses (lms.archive, `manage.py archive_courses`): courses
+# closed more than ARCHIVE_AFTER_TERMS terms ago move their submissions and deadlines
+# to cold tables. LMS_DB_ARCHIVE=1 keeps those tables in a separate SQLite file.
+ARCHIVE_TERM_DAYS = 182
+ARCHIVE_AFTER_TERMS = 2
+ARCHIVE_BATCH_SIZE = 1000
+ARCHIVE_DATABASE = None
+
+if os.environ.get('LMS_DB_ARCHIVE') == '1':
+    DATABASES['archive'] = dict(DATABASES['default'], NAME=BASE_DIR / 'db_archive.sqlite3')
+    ARCHIVE_DATABASE = 'archive'
+
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
 # Static files collected folder (optional)
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# In production `manage.py collectstatic` fingerprints every asset, writes .gz/.br
+# variants and staticfiles.json; {% static %} then resolves the hashed names.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+        else 'lms.staticfiles.PrecompressedManifestStaticFilesStorage',
+    },
+}
+
 # Media files (user uploaded and templates for certificates)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Certificate PDFs (lms.certificates): 'vector' draws the text over a shared JPEG of
+# certificates/templates/background.png, 'raster' paints it into the bitmap
+CERTIFICATE_RENDERER = 'vector'
+CERTIFICATE_FONT = None                 # TTF path; None = DejaVu Sans/Arial if found
+CERTIFICATE_BACKGROUND_QUALITY = 90     # JPEG quality of the embedded background
+CERTIFICATE_EXPORT_WORKERS = None       # processes rendering missing PDFs for ZIP exports; None = CPU count
+CERTIFICATE_EXPORT_BATCH = 64           # certificates read (and rendered ahead) at a time
+
+# `manage.py media_gc` moves unreferenced and duplicate media files here unless --delete is given
+MEDIA_QUARANTINE_ROOT = BASE_DIR / 'media_quarantine'
+
+# Standard avatar sizes (px) pre-rendered by lms.avatars
+AVATAR_SIZES = (36, 80, 120)
+# how long the avatar digest of a user stays in the cache (other processes see a new
+# avatar after at most this long unless CACHES is shared between them)
+AVATAR_CACHE_SECONDS = 300
+
+# Chunked, resumable uploads (lms.uploads)
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+UPLOAD_EXPIRE_HOURS = 24                # `manage.py expire_uploads` removes sessions idle this long
+
+# Lesson and submission bodies (lms.fields.CompressedTextField): values of at least
+# this many bytes are compressed; 'zstd' is used only if zstandard is installed
+COMPRESSED_TEXT_THRESHOLD = 512
+COMPRESSED_TEXT_CODEC = 'zlib'
+
+# Deadline reminders (lms.reminders, `manage.py run_reminders`)
+DEADLINE_REMINDER_OFFSETS = (24 * 3600, 3600)  # seconds before due_at
+REMINDER_WINDOW_SECONDS = 6 * 3600  # look-ahead kept in the scheduler's heap
+REMINDER_RELOAD_SECONDS = 300       # re-read the window (changes made by other processes)
+REMINDER_BATCH_SIZE = 100           # messages per send_messages() call
+REMINDER_RATE = 20                  # messages per second, 0 = no limit
+REMINDER_RETRY_SECONDS = 300        # wait before sending a failed reminder again
+
+# Near-duplicate submissions (lms.similarity): MinHash with BANDS * ROWS hashes;
+# texts sharing about (1/BANDS) ** (1/ROWS) of their shingles become candidates
+SIMILARITY_BANDS = 16
+SIMILARITY_ROWS = 4
+SIMILARITY_SHINGLE_SIZE = 5    # characters
+SIMILARITY_MIN_LENGTH = 50     # shorter answers are not compared
+SIMILARITY_THRESHOLD = 0.7     # estimated Jaccard similarity reported to teachers
+
+# Automatic checks (lms.autocheck, `manage.py check_submissions`)
+CHECK_WORKERS = None     # processes in the pool; None = CPU count
+CHECK_BATCH_SIZE = 200   # submissions claimed and written back at a time
+
+# Metrics for Prometheus at /metrics (lms.metrics). With several worker processes set
+# LMS_METRICS_DIR to a directory they share, so a scrape sums all of them
+METRICS_DIR = os.environ.get('LMS_METRICS_DIR') or None
+METRICS_FLUSH_SECONDS = 5
+# Who may scrape besides superusers: a request with "Authorization: Bearer <METRICS_TOKEN>", or one
+# from METRICS_ALLOWED_IPS. Behind a reverse proxy every request comes from the proxy's address
+# (usually 127.0.0.1), so only list addresses that no proxied request can come from.
+METRICS_TOKEN = os.environ.get('LMS_METRICS_TOKEN') or None
+METRICS_ALLOWED_IPS = ()
+
+# Background deletion of courses and users (lms.deletion, `manage.py run_deletions`)
+DELETION_BATCH_SIZE = 500       # rows per transaction
+DELETION_PAUSE_SECONDS = 0.05   # between transactions, so other writers get the database
+
+# Course leaderboards (lms.leaderboard, `manage.py persist_leaderboards`)
+LEADERBOARD_TOP = 10                # students listed on the course pages
+LEADERBOARD_PERSIST_SECONDS = 300   # between stored snapshots
+
+# JSON APIs (lms.api): responses at least this big are gzip-compressed when the client accepts it
+API_GZIP_MIN_BYTES = 1024
+# /api/me/bootstrap/ (lms.bootstrap): bundles are cached per student and version in the default cache
+BOOTSTRAP_CACHE_SECONDS = 3600
+
+# Email: printed to the console while DEBUG; set LMS_EMAIL_BACKEND to e.g.
+# django.core.mail.backends.filebased.EmailBackend to keep messages in EMAIL_FILE_PATH
+EMAIL_BACKEND = os.environ.get('LMS_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend' if DEBUG
+                               else 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = 'MiniLMS <noreply@minilms.local>'
+
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
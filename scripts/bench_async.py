@@ -0,0 +1,156 @@
+"""Concurrency benchmark for the async read endpoints.
+
+Fires --connections simultaneous requests at each endpoint, in-process:
+
+- "wsgi": the WSGI application behind a pool of --workers threads, i.e. a
+  classic threaded server where every slow DB read holds a worker;
+- "asgi": the ASGI application with all requests in flight at once on one
+  event loop, which is how an ASGI server (uvicorn, daphne) runs the async views.
+
+A fixed --db-latency-ms is added to every SQL query so the numbers reflect a
+database that is not on the same disk as the app. Results go to stdout.
+
+Usage:
+    python scripts/bench_async.py [--connections 1000] [--workers 8] [--db-latency-ms 5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms_project.settings')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+# before setup(): nothing may open the project's own db.sqlite3
+TMP = tempfile.mkdtemp()
+settings.DATABASES['default']['NAME'] = os.path.join(TMP, 'bench.sqlite3')
+settings.MEDIA_ROOT = os.path.join(TMP, 'media')
+settings.ALLOWED_HOSTS = ['*']
+settings.DEBUG = False
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from lms.models import Course, Deadline, HomeworkSubmission, Lesson, Student  # noqa: E402
+
+
+def seed():
+    call_command('migrate', verbosity=0)
+    teacher = User.objects.create_user(username='bench-teacher', password='x', is_staff=True)
+    courses = [Course.objects.create(title=f'Course {i}', description='d', teacher=teacher) for i in range(5)]
+    user = User.objects.create_user(username='bench-student', password='x')
+    student = Student.objects.create(user=user)
+    student.courses.add(*courses)
+    now = timezone.now()
+    for course in courses:
+        lessons = Lesson.objects.bulk_create(Lesson(course=course, title=f'L{i}', content='c') for i in range(10))
+        HomeworkSubmission.objects.bulk_create(
+            HomeworkSubmission(student=student, lesson=lesson, content='a') for lesson in lessons)
+        Deadline.objects.bulk_create(
+            Deadline(title=f'D{i}', due_at=now + timedelta(days=i), lesson=lesson, created_by=teacher)
+            for i, lesson in enumerate(lessons))
+    client = Client()
+    client.force_login(user)
+    return client.cookies[settings.SESSION_COOKIE_NAME].value, courses[0].id
+
+
+def add_db_latency(seconds):
+    def slow(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(slow)
+
+    connection_created.connect(install, weak=False)
+
+
+def wsgi_request(app, path, cookie):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'bench',
+        'SERVER_PORT': '80', 'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http',
+        'HTTP_COOKIE': f'{settings.SESSION_COOKIE_NAME}={cookie}',
+    }
+    status = []
+    b''.join(app(environ, lambda s, h, exc_info=None: status.append(s)))
+    return time.perf_counter(), status[0].startswith('200')
+
+
+async def asgi_request(app, path, cookie):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'headers': [(b'host', b'bench'), (b'cookie', f'{settings.SESSION_COOKIE_NAME}={cookie}'.encode())],
+        'server': ('bench', 80), 'client': ('127.0.0.1', 1234),
+    }
+    status = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return time.perf_counter(), bool(status) and status[0] == 200
+
+
+def summarize(name, path, results, started):
+    # every client connected at `started`, so latency includes time spent queued for a worker
+    latencies = sorted(done - started for done, _ in results)
+    ok = sum(1 for _, success in results if success)
+    elapsed = latencies[-1]
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000  # noqa: E731
+    print(f"{name:<6}{path:<26}{len(latencies) / elapsed:>10.0f}{statistics.median(latencies) * 1000:>10.0f}"
+          f"{p(0.95):>10.0f}{p(0.99):>10.0f}{len(latencies) - ok:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=8, help='WSGI worker threads')
+    parser.add_argument('--db-latency-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    cookie, course_id = seed()
+    add_db_latency(args.db_latency_ms / 1000)
+    paths = ['/api/deadlines/', '/', f'/course/{course_id}/', '/student/dashboard/']
+    wsgi_app = get_wsgi_application()
+    asgi_app = get_asgi_application()
+
+    print(f"{args.connections} concurrent requests per endpoint, {args.db_latency_ms} ms per query, "
+          f"{args.workers} WSGI threads")
+    print(f"{'mode':<6}{'endpoint':<26}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for path in paths:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(lambda _: wsgi_request(wsgi_app, path, cookie), range(args.connections)))
+        summarize('wsgi', path, results, started)
+
+        async def run_all():
+            return await asyncio.gather(*(asgi_request(asgi_app, path, cookie) for _ in range(args.connections)))
+
+        started = time.perf_counter()
+        results = asyncio.run(run_all())
+        summarize('asgi', path, results, started)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Certificate rendering benchmark: raster vs vector PDFs.
+
+Renders the same certificates (unsaved model instances, no database needed)
+with both renderers of lms.certificates into a temporary directory:
+
+- raster: text painted into the bitmap, one PNG + PDF per certificate;
+- vector: shared JPEG background + vector text, one PDF per certificate;
+- vector, one file: all certificates as pages of a single PDF.
+
+Usage:
+    python scripts/bench_certificates.py [--count 50] [--template PATH]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from lms import certificates  # noqa: E402
+from lms.models import Certificate, Course, Student  # noqa: E402
+
+
+def make_certificates(count):
+    teacher = User(username='teacher', first_name='Анна', last_name='Петрова')
+    course = Course(title='Основы программирования на Python', teacher=teacher)
+    return [Certificate(student=Student(user=User(username=f's{i}', first_name='Иван', last_name=f'Студент {i}')),
+                        course=course, issued_at=timezone.now())
+            for i in range(count)]
+
+
+def size_of(paths):
+    return sum(os.path.getsize(p) for p in paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=50)
+    parser.add_argument('--template', default=certificates.template_path())
+    args = parser.parse_args()
+    certs = make_certificates(args.count)
+    out = tempfile.mkdtemp(prefix='lms-bench-certificates-')
+    try:
+        results = []
+
+        started = time.perf_counter()
+        paths = []
+        for i, cert in enumerate(certs):
+            path = os.path.join(out, f'raster-{i}.pdf')
+            certificates.write_raster_pdf(path, cert, args.template)
+            paths.append(path)
+        results.append(('raster', time.perf_counter() - started, size_of(paths), len(paths)))
+
+        certificates.write_vector_pdf(os.path.join(out, 'warmup.pdf'), certs[:1], args.template)  # font, JPEG
+        started = time.perf_counter()
+        paths = []
+        for i, cert in enumerate(certs):
+            path = os.path.join(out, f'vector-{i}.pdf')
+            certificates.write_vector_pdf(path, [cert], args.template)
+            paths.append(path)
+        results.append(('vector', time.perf_counter() - started, size_of(paths), len(paths)))
+
+        started = time.perf_counter()
+        path = os.path.join(out, 'vector-all.pdf')
+        certificates.write_vector_pdf(path, certs, args.template)
+        results.append(('vector, one file', time.perf_counter() - started, size_of([path]), 1))
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+    print(f"{args.count} certificates, template {args.template}")
+    print(f"{'mode':<18}{'total s':>10}{'ms/cert':>10}{'files':>7}{'bytes':>12}{'bytes/cert':>12}")
+    for mode, seconds, size, files in results:
+        print(f"{mode:<18}{seconds:>10.2f}{seconds * 1000 / args.count:>10.1f}{files:>7}{size:>12}"
+              f"{size // args.count:>12}")
+
+
+if __name__ == '__main__':
+    main()
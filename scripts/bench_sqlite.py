@@ -0,0 +1,126 @@
+"""Reader/writer concurrency benchmark for the SQLite database profiles.
+
+Runs the same workload twice on a temporary database file: once with SQLite's
+defaults (rollback journal, what the 'default' profile uses) and once with the
+PRAGMAs of the 'production' profile (settings.SQLITE_PRODUCTION_PRAGMAS).
+Readers run the kind of query student_dashboard issues, the writer grades
+submissions one transaction at a time.
+
+Usage:
+    python scripts/bench_sqlite.py [--readers 8] [--seconds 5] [--rows 20000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms_project.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from lms.db import apply_pragmas  # noqa: E402
+
+
+def create_db(path, rows, students):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE submission (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL,
+            lesson_id INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            is_graded BOOL NOT NULL DEFAULT 0,
+            grade INTEGER
+        );
+        CREATE INDEX submission_student ON submission (student_id);
+    """)
+    conn.executemany(
+        "INSERT INTO submission (student_id, lesson_id, content) VALUES (?, ?, ?)",
+        ((i % students, i // students, 'answer ' * 40) for i in range(rows)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def connect(path, pragmas):
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    if pragmas:
+        apply_pragmas(conn.cursor(), pragmas)
+    return conn
+
+
+def run(path, pragmas, readers, seconds, rows, students):
+    stop = time.monotonic() + seconds
+    counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+    lock = threading.Lock()
+
+    def reader():
+        conn = connect(path, pragmas)
+        n = errors = 0
+        while time.monotonic() < stop:
+            try:
+                conn.execute(
+                    "SELECT id, lesson_id, is_graded, grade FROM submission WHERE student_id = ?",
+                    (random.randrange(students),),
+                ).fetchall()
+                n += 1
+            except sqlite3.OperationalError:
+                errors += 1
+        conn.close()
+        with lock:
+            counts['reads'] += n
+            counts['read_errors'] += errors
+
+    def writer():
+        conn = connect(path, pragmas)
+        n = errors = 0
+        while time.monotonic() < stop:
+            try:
+                with conn:
+                    conn.execute("UPDATE submission SET is_graded = 1, grade = ? WHERE id = ?",
+                                 (random.randrange(101), random.randrange(1, rows + 1)))
+                n += 1
+            except sqlite3.OperationalError:
+                errors += 1
+        conn.close()
+        with lock:
+            counts['writes'] += n
+            counts['write_errors'] += errors
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=writer)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {k: v / seconds if k in ('reads', 'writes') else v for k, v in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--students', type=int, default=500)
+    args = parser.parse_args()
+
+    profiles = [('default', {}), ('production', settings.SQLITE_PRODUCTION_PRAGMAS)]
+    print(f"{args.readers} readers + 1 writer, {args.seconds}s each, {args.rows} rows")
+    print(f"{'profile':<12}{'reads/s':>12}{'writes/s':>12}{'read err':>10}{'write err':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, pragmas in profiles:
+            path = os.path.join(tmp, f'{name}.sqlite3')
+            create_db(path, args.rows, args.students)
+            r = run(path, pragmas, args.readers, args.seconds, args.rows, args.students)
+            print(f"{name:<12}{r['reads']:>12.0f}{r['writes']:>12.0f}{r['read_errors']:>10}{r['write_errors']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,396 @@
+"""Load test: scripted student and teacher journeys against a real local server.
+
+Boots the app in this process on a temporary database filled with generated
+courses, students and teachers, serves it with a threaded WSGI server
+(wsgiref) or, with --server asgi, with uvicorn (if installed), and runs
+`clients` concurrent asyncio clients for `duration` seconds. Every client
+picks a journey by weight, logs in and walks its steps with a random think
+time in between, over plain HTTP. Steps:
+
+  login, dashboard, open_lesson, submit_homework, poll_deadlines   (students)
+  login, teacher_dashboard, grade_page                              (teachers)
+
+grade_page opens a page of 40 submissions and grades all of them in one POST.
+
+The scenario (clients, duration, ramp-up, think time, data size, journey mix)
+comes from a JSON file, or YAML if PyYAML is installed; scripts/loadtest.json
+is the default. The random seed is part of the scenario, so two runs of the
+same scenario send the same requests in the same order per client. Results per
+step: requests, errors, throughput and latency percentiles. --output saves
+them with the scenario as JSON, and --compare prints the change against such
+a file.
+
+Clients and server share one interpreter (and its GIL), so absolute numbers
+are lower than with a separate server; compare runs made the same way.
+Set LMS_DB_PROFILE=production to test with the production SQLite PRAGMAs.
+
+Usage:
+    python scripts/loadtest.py [scenario.json] [--clients N] [--duration S] [--server wsgi|asgi]
+                               [--fast-passwords] [--output results.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from socketserver import ThreadingMixIn
+from urllib.parse import urlencode
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms_project.settings')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+# before setup(): nothing may open the project's own db.sqlite3
+TMP = tempfile.mkdtemp(prefix='lms-loadtest-')
+settings.DATABASES['default']['NAME'] = os.path.join(TMP, 'loadtest.sqlite3')
+settings.MEDIA_ROOT = os.path.join(TMP, 'media')
+settings.ALLOWED_HOSTS = ['*']
+settings.DEBUG = False
+settings.EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+
+django.setup()
+
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from lms.models import Course, Deadline, HomeworkSubmission, Lesson, Student  # noqa: E402
+
+PASSWORD = 'load-test'
+PERCENTILES = (50, 90, 95, 99)
+
+
+# -- Scenario and data ----------------------------------------------------------------
+
+def load_scenario(path):
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yml', '.yaml')):
+            if yaml is None:
+                raise SystemExit('PyYAML is needed for YAML scenarios (pip install pyyaml)')
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def seed(data, rng):
+    """Create users, courses, lessons, enrollments and deadlines; returns what the clients need."""
+    call_command('migrate', verbosity=0)
+    password = make_password(PASSWORD)  # hashed once, shared by all generated users
+    now = timezone.now()
+    teachers = User.objects.bulk_create(
+        User(username=f'teacher{i}', password=password, is_staff=True) for i in range(data['teachers']))
+    courses = Course.objects.bulk_create(
+        Course(title=f'Course {t}.{i}', description='Load test course', teacher=teacher)
+        for t, teacher in enumerate(teachers) for i in range(data['courses_per_teacher']))
+    lessons = Lesson.objects.bulk_create(
+        Lesson(course=course, title=f'Lesson {i}', content='Lesson text ' * 50)
+        for course in courses for i in range(data['lessons_per_course']))
+    Deadline.objects.bulk_create(
+        Deadline(title=f'Due {lesson.title}', due_at=now + timezone.timedelta(days=rng.randint(1, 30)),
+                 lesson=lesson, created_by=lesson.course.teacher) for lesson in lessons)
+    lessons_by_course = defaultdict(list)
+    for lesson in lessons:
+        lessons_by_course[lesson.course_id].append(lesson.id)
+
+    users = User.objects.bulk_create(
+        User(username=f'student{i}', password=password) for i in range(data['students']))
+    students = Student.objects.bulk_create(Student(user=user) for user in users)
+    Enrollment = Student.courses.through
+    enrollments, student_lessons = [], {}
+    for student in students:
+        picked = rng.sample(courses, min(data['courses_per_student'], len(courses)))
+        enrollments += [Enrollment(student_id=student.id, course_id=course.id) for course in picked]
+        student_lessons[student.user.username] = [l for c in picked for l in lessons_by_course[c.id]]
+    Enrollment.objects.bulk_create(enrollments, batch_size=1000)
+    # half of the lessons already have an answer, so teachers have something to grade
+    HomeworkSubmission.objects.bulk_create(
+        (HomeworkSubmission(student=student, lesson_id=lesson_id, content='First answer')
+         for student in students for lesson_id in student_lessons[student.user.username][::2]), batch_size=1000)
+    teacher_lessons = {t.username: [l for c in courses if c.teacher_id == t.id for l in lessons_by_course[c.id]]
+                       for t in teachers}
+    return student_lessons, teacher_lessons
+
+
+# -- Server -------------------------------------------------------------------------------
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(kind):
+    """Serve the app on a free local port from a background thread; returns the port."""
+    if kind == 'asgi':
+        try:
+            import uvicorn
+        except ImportError:
+            raise SystemExit('--server asgi needs uvicorn (pip install uvicorn)')
+        from django.core.asgi import get_asgi_application
+
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(get_asgi_application(), host='127.0.0.1', port=port,
+                                               log_level='warning', backlog=1024))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.05)
+        return port
+
+    from django.core.wsgi import get_wsgi_application
+
+    server = make_server('127.0.0.1', 0, get_wsgi_application(), server_class=ThreadingWSGIServer,
+                         handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_port
+
+
+# -- Client ---------------------------------------------------------------------------------
+
+class StepFailed(Exception):
+    pass
+
+
+class Session:
+    """A browser-like client: keeps cookies, sends the CSRF token, one connection per request."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = {}
+
+    async def request(self, method, path, form=None, json_body=None, expect=(200,)):
+        body = b''
+        headers = {'Host': f'127.0.0.1:{self.port}', 'Connection': 'close', 'User-Agent': 'lms-loadtest'}
+        if form is not None:
+            body = urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        if method != 'GET':
+            headers['X-CSRFToken'] = self.cookies.get('csrftoken', '')
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        headers['Content-Length'] = str(len(body))
+
+        reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        try:
+            head = ''.join(f'{k}: {v}\r\n' for k, v in headers.items())
+            writer.write(f'{method} {path} HTTP/1.1\r\n{head}\r\n'.encode() + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            status = int(status_line.split()[1])
+            while (line := await reader.readline()) not in (b'\r\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'set-cookie':
+                    for morsel in SimpleCookie(value.strip()).values():
+                        self.cookies[morsel.key] = morsel.value
+            content = await reader.read()
+        finally:
+            writer.close()
+        if status not in expect:
+            raise StepFailed(f'{method} {path}: HTTP {status}')
+        return content
+
+
+class Journey:
+    """The steps of one virtual user; each step is a coroutine method."""
+
+    def __init__(self, session, username, lessons, rng):
+        self.session = session
+        self.username = username
+        self.lessons = lessons
+        self.rng = rng
+
+    async def login(self):
+        await self.session.request('GET', '/login/')
+        await self.session.request('POST', '/login/', form={
+            'username': self.username, 'password': PASSWORD,
+            'csrfmiddlewaretoken': self.session.cookies.get('csrftoken', '')}, expect=(302,))
+
+    async def dashboard(self):
+        await self.session.request('GET', '/student/dashboard/')
+
+    async def open_lesson(self):
+        await self.session.request('GET', f'/lesson/{self.rng.choice(self.lessons)}/')
+
+    async def submit_homework(self):
+        lesson = self.rng.choice(self.lessons)
+        text = ' '.join(self.rng.choice(('ответ', 'решение', 'функция', 'цикл', 'данные')) for _ in range(40))
+        await self.session.request('POST', f'/lesson/{lesson}/', form={'content': text}, expect=(302,))
+
+    async def poll_deadlines(self):
+        await self.session.request('GET', '/api/deadlines/')
+
+    async def teacher_dashboard(self):
+        await self.session.request('GET', '/teacher/dashboard/')
+
+    async def grade_page(self):
+        lesson = self.rng.choice(self.lessons)
+        page = await self.session.request('GET', f'/teacher/lesson/{lesson}/submissions/?per_page=40')
+        ids = re.findall(rb'name="grade-(\d+)"', page)
+        form = {f'grade-{i.decode()}': self.rng.randint(40, 100) for i in ids}
+        form['batch'] = '1'
+        await self.session.request('POST', f'/teacher/lesson/{lesson}/submissions/?per_page=40', form=form,
+                                   expect=(302,))
+
+
+STEPS = {name for name in vars(Journey) if not name.startswith('_')}
+
+
+async def virtual_user(index, scenario, port, users, stop_at, results):
+    rng = random.Random(f"{scenario['seed']}-{index}")
+    journeys = scenario['journeys']
+    names = sorted(journeys)
+    await asyncio.sleep(scenario.get('ramp_up', 0) * index / scenario['clients'])
+    low, high = scenario.get('think_time', (0, 0))
+    while time.monotonic() < stop_at:
+        name = rng.choices(names, weights=[journeys[n].get('weight', 1) for n in names])[0]
+        username = rng.choice(sorted(users[name]))
+        journey = Journey(Session(port), username, users[name][username], rng)
+        for step in journeys[name]['steps']:
+            if time.monotonic() >= stop_at:
+                return
+            started = time.perf_counter()
+            error = None
+            try:
+                await getattr(journey, step)()
+            except (StepFailed, OSError, ValueError, IndexError) as exc:
+                error = str(exc) or type(exc).__name__
+            results[step].append((time.perf_counter() - started, error))
+            if error:
+                break  # start over with a new journey
+            await asyncio.sleep(rng.uniform(low, high))
+
+
+async def run_clients(scenario, port, users):
+    results = defaultdict(list)
+    stop_at = time.monotonic() + scenario['duration']
+    await asyncio.gather(*(virtual_user(i, scenario, port, users, stop_at, results)
+                           for i in range(scenario['clients'])))
+    return results
+
+
+# -- Report ---------------------------------------------------------------------------------
+
+def percentile(sorted_values, p):
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(results, duration):
+    summary = {}
+    for step, samples in sorted(results.items()):
+        latencies = sorted(latency for latency, _ in samples)
+        errors = [error for _, error in samples if error]
+        summary[step] = {
+            'requests': len(samples),
+            'errors': len(errors),
+            'error_rate': len(errors) / len(samples),
+            'throughput': len(samples) / duration,
+            **{f'p{p}_ms': percentile(latencies, p) * 1000 for p in PERCENTILES},
+            'max_ms': latencies[-1] * 1000,
+            'first_errors': sorted(set(errors))[:3],
+        }
+    return summary
+
+
+def print_summary(summary, previous=None):
+    header = f"{'step':<18}{'requests':>9}{'errors':>8}{'req/s':>8}" + ''.join(f"{f'p{p} ms':>9}" for p in PERCENTILES)
+    print(header + (f"{'Δ req/s':>10}{'Δ p95':>9}" if previous else ''))
+    for step, row in summary.items():
+        line = (f"{step:<18}{row['requests']:>9}{row['errors']:>8}{row['throughput']:>8.1f}"
+                + ''.join(f"{row[f'p{p}_ms']:>9.0f}" for p in PERCENTILES))
+        if previous and step in previous:
+            before = previous[step]
+            change = lambda new, old: f"{(new - old) / old * 100:+.0f}%" if old else 'n/a'  # noqa: E731
+            line += f"{change(row['throughput'], before['throughput']):>10}{change(row['p95_ms'], before['p95_ms']):>9}"
+        print(line)
+    for step, row in summary.items():
+        for error in row['first_errors']:
+            print(f"  {step}: {error}")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenario', nargs='?', default=os.path.join(ROOT, 'scripts', 'loadtest.json'))
+    parser.add_argument('--clients', type=int, help='Override the number of concurrent clients.')
+    parser.add_argument('--duration', type=float, help='Override the duration in seconds.')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi')
+    parser.add_argument('--fast-passwords', action='store_true',
+                        help='Hash passwords with MD5 so logins measure the app, not PBKDF2.')
+    parser.add_argument('--output', help='Write the results (and the scenario) to this JSON file.')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare with.')
+    args = parser.parse_args()
+
+    scenario = load_scenario(args.scenario)
+    for key in ('clients', 'duration'):
+        if getattr(args, key) is not None:
+            scenario[key] = getattr(args, key)
+    unknown = {s for j in scenario['journeys'].values() for s in j['steps']} - STEPS
+    if unknown:
+        raise SystemExit(f"unknown steps {sorted(unknown)}; available: {sorted(STEPS)}")
+    if args.fast_passwords:
+        settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+    started = time.monotonic()
+    student_lessons, teacher_lessons = seed(scenario['data'], random.Random(scenario['seed']))
+    users = {name: teacher_lessons if name == 'teacher' else student_lessons for name in scenario['journeys']}
+    port = start_server(args.server)
+    print(f"seeded in {time.monotonic() - started:.1f}s; {scenario['clients']} clients for "
+          f"{scenario['duration']}s against {args.server} on port {port}")
+
+    results = asyncio.run(run_clients(scenario, port, users))
+    summary = summarize(results, scenario['duration'])
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)['steps']
+    print_summary(summary, previous)
+
+    if args.output:
+        report = {
+            'scenario': scenario, 'server': args.server, 'fast_passwords': args.fast_passwords,
+            'db_profile': settings.DB_PROFILE, 'revision': git_revision(),
+            'python': platform.python_version(), 'cpus': os.cpu_count(),
+            'finished_at': timezone.now().isoformat(), 'steps': summary,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+// Resumable chunked uploads for forms with <input type="hidden" data-chunked-upload>.
+// The file is sent in chunks to /api/uploads/; on a network error the upload
+// asks the server for its offset and continues from there instead of restarting.
+(function(){
+  function csrfToken(form){
+    const el = form.querySelector('input[name=csrfmiddlewaretoken]');
+    return el ? el.value : '';
+  }
+
+  function sleep(ms){ return new Promise(r => setTimeout(r, ms)); }
+
+  async function uploadFile(file, token, onProgress){
+    let resp = await fetch('/api/uploads/', {
+      method: 'POST',
+      headers: {'Content-Type': 'application/json', 'X-CSRFToken': token},
+      body: JSON.stringify({filename: file.name, size: file.size}),
+    });
+    if(!resp.ok) throw new Error('upload start failed');
+    let state = await resp.json();
+    const url = '/api/uploads/' + state.upload_id + '/';
+    let failures = 0;
+    while(!state.complete){
+      const start = state.offset;
+      const end = Math.min(start + state.chunk_size, file.size) - 1;
+      try{
+        resp = await fetch(url, {
+          method: 'PUT',
+          headers: {'Content-Range': `bytes ${start}-${end}/${file.size}`, 'X-CSRFToken': token,
+                    'Content-Type': 'application/octet-stream'},
+          body: file.slice(start, end + 1),
+        });
+        if(resp.ok){
+          state = await resp.json();
+          failures = 0;
+        } else if(resp.status === 409 || resp.status === 400){
+          state = await (await fetch(url)).json();
+        } else {
+          throw new Error('chunk rejected: ' + resp.status);
+        }
+      }catch(e){
+        if(++failures > 8) throw e;
+        await sleep(Math.min(30000, 500 * 2 ** failures));
+        try{ state = await (await fetch(url)).json(); }catch(_){ /* retry again */ }
+      }
+      onProgress(state.offset / file.size);
+    }
+    return state.upload_id;
+  }
+
+  document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('input[data-chunked-upload]').forEach(hidden => {
+      const form = hidden.form;
+      const picker = document.createElement('input');
+      picker.type = 'file';
+      picker.className = 'form-control mb-1';
+      const progress = document.createElement('div');
+      progress.className = 'small text-muted mb-3';
+      hidden.after(picker, progress);
+      const submit = form.querySelector('[type=submit]');
+      picker.addEventListener('change', async () => {
+        if(!picker.files.length) return;
+        if(submit) submit.disabled = true;
+        try{
+          hidden.value = await uploadFile(picker.files[0], csrfToken(form), p => {
+            progress.textContent = 'Загружено: ' + Math.floor(p * 100) + '%';
+          });
+          progress.textContent = 'Файл загружен';
+        }catch(e){
+          progress.textContent = 'Ошибка загрузки, попробуйте ещё раз';
+        }finally{
+          if(submit) submit.disabled = false;
+        }
+      });
+    });
+  });
+})();